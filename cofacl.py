@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# coding=utf-8
+# module name: cofacl
+# author: Cof-Lee <cof8007@gmail.com>
+# this module uses the GPL-3.0 open source protocol
+# update: 2024-12-01
+
+"""
+ipv4访问控制列表（ACL）的解析、编译及批量匹配，用于根据流日志统计防火墙规则的命中情况，运行方式:
+python3 cofacl.py acl.txt flows.csv                      统计每条规则的命中次数，flows.csv每行为 源ip,目的ip[,协议号]
+python3 cofacl.py acl.txt flows.csv --unused             只列出没有命中的规则
+
+★支持思科风格的条目，反掩码（通配符掩码）可以不连续，如 10.0.0.1 0.0.254.0 匹配第3段为偶数的10.0.x.1:
+access-list 101 permit ip 10.0.0.0 0.0.0.255 any        编号式扩展ACL
+10 deny tcp host 10.1.1.1 10.2.0.0 0.0.255.255 log     带序号，行尾的 log/log-input 忽略
+permit 192.168.0.0 0.0.255.255                         标准ACL（只有源地址）
+permit udp 10.0.0.0/8 any                              也可以写为cidr
+空行、!开头的行、remark行、ip access-list 开头的行忽略；带端口条件（eq/range等）或 established 的条目暂不支持，解析时报错
+★匹配语义与设备一致：按顺序，第一条命中的规则生效，都不命中则为隐式拒绝（返回的规则下标为-1）
+★编译方式（元组空间哈希）: 把 (协议, 源地址, 目的地址) 拼接为1个整数 协议<<64 | 源<<32 | 目的，
+每条规则对应1个关心位掩码（反掩码取反），关心位掩码相同的规则放在同一张哈希表里，key为拼接数值与关心位掩码相与的结果，
+value为该key下最靠前的规则下标；匹配时每张表只需1次与运算加1次字典查找，各表按其中最靠前的规则下标排序，
+已命中的规则下标比下一张表的最小下标还小时即可停止，不必查完所有表
+"""
+
+import sys
+import csv
+import argparse
+import cofnet
+
+ACL_ACTION_LIST = ["permit", "deny"]
+ACL_PROTOCOL_NAME_DICT = {"ip": 0, "icmp": 1, "igmp": 2, "tcp": 6, "udp": 17, "gre": 47, "esp": 50, "ahp": 51, "eigrp": 88,
+                          "ospf": 89, "pim": 103, "sctp": 132}  # ip表示任意协议
+ACL_IGNORED_OPTION_LIST = ["log", "log-input"]
+ACL_UNSUPPORTED_OPTION_LIST = ["eq", "neq", "lt", "gt", "range", "established"]
+IPV4_ALL_ONE = 0xFFFFFFFF
+
+
+def local__parse_acl_address(token_list: list, position: int) -> tuple:
+    """
+    从 token_list[position] 开始解析1个地址条件，返回三元组 (地址数值, 反掩码数值, 下一个token的位置)
+    【输入错误会抛出Exception异常】
+    """
+    if position >= len(token_list):
+        raise Exception("ACL条目缺少地址条件", " ".join(token_list))
+    token = token_list[position]
+    if token == "any":
+        return 0, IPV4_ALL_ONE, position + 1
+    if token == "host":
+        if position + 1 >= len(token_list):
+            raise Exception("host后面缺少ip地址", " ".join(token_list))
+        is_ip, ip_int = cofnet.parse_ip_addr(token_list[position + 1])
+        if not is_ip:
+            raise Exception("不是正确的ip地址", token_list[position + 1])
+        return ip_int, 0, position + 2
+    is_ip_with_mask, ip_int, maskint = cofnet.parse_ip_with_maskint(token)
+    if is_ip_with_mask:
+        return ip_int, IPV4_ALL_ONE >> maskint, position + 1
+    is_ip, ip_int = cofnet.parse_ip_addr(token)
+    if not is_ip:
+        raise Exception("不是正确的地址条件", token)
+    if position + 1 < len(token_list):
+        is_wildcard, wildcard_int = cofnet.parse_ip_addr(token_list[position + 1])
+        if is_wildcard:
+            return ip_int, wildcard_int, position + 2
+    return ip_int, 0, position + 1  # 只写了1个ip，没有反掩码，同host
+
+
+class AclEntry:
+    """
+    1条ACL规则，地址条件已按反掩码规整（地址的非关心位清0）
+    """
+
+    def __init__(self, text="", action="permit", protocol=0, src_int=0, src_wildcard_int=IPV4_ALL_ONE, dst_int=0,
+                 dst_wildcard_int=IPV4_ALL_ONE):
+        self.text = text  # 原始文本
+        self.action = action  # "permit" 或 "deny"
+        self.protocol = protocol  # 协议号，0表示任意协议
+        self.src_wildcard_int = src_wildcard_int  # 源地址反掩码，1的位表示不关心，可以不连续
+        self.src_int = src_int & ~src_wildcard_int & IPV4_ALL_ONE
+        self.dst_wildcard_int = dst_wildcard_int
+        self.dst_int = dst_int & ~dst_wildcard_int & IPV4_ALL_ONE
+
+    @classmethod
+    def from_text(cls, text: str):
+        """
+        解析1行思科风格的ACL条目，空行或无需处理的行（注释、remark、ACL头）返回None
+        【输入错误会抛出Exception异常】
+        """
+        token_list = text.strip().lower().split()
+        if len(token_list) == 0 or token_list[0].startswith("!") or "remark" in token_list[:3]:
+            return None
+        if token_list[0] == "ip" and len(token_list) > 1 and token_list[1] == "access-list":
+            return None
+        if token_list[0] == "access-list":
+            token_list = token_list[2:]
+        if len(token_list) != 0 and token_list[0].isdigit():  # 序号
+            token_list = token_list[1:]
+        if len(token_list) == 0 or token_list[0] not in ACL_ACTION_LIST:
+            raise Exception("ACL条目应以permit或deny开头", text)
+        action = token_list[0]
+        while len(token_list) != 0 and token_list[-1] in ACL_IGNORED_OPTION_LIST:
+            token_list = token_list[:-1]
+        for token in token_list:
+            if token in ACL_UNSUPPORTED_OPTION_LIST:
+                raise Exception("暂不支持端口条件或established", text)
+        protocol_token = token_list[1] if len(token_list) > 1 else ""
+        if protocol_token in ACL_PROTOCOL_NAME_DICT:
+            protocol = ACL_PROTOCOL_NAME_DICT[protocol_token]
+        elif protocol_token.isdigit() and int(protocol_token) <= 255:
+            protocol = int(protocol_token)
+        else:  # 标准ACL，只有源地址
+            src_int, src_wildcard_int, position = local__parse_acl_address(token_list, 1)
+            if position != len(token_list):
+                raise Exception("ACL条目有多余的内容", text)
+            return cls(text.strip(), action, 0, src_int, src_wildcard_int)
+        src_int, src_wildcard_int, position = local__parse_acl_address(token_list, 2)
+        dst_int, dst_wildcard_int, position = local__parse_acl_address(token_list, position)
+        if position != len(token_list):
+            raise Exception("ACL条目有多余的内容", text)
+        return cls(text.strip(), action, protocol, src_int, src_wildcard_int, dst_int, dst_wildcard_int)
+
+    def get_care_mask(self) -> int:
+        """
+        返回拼接数值 协议<<64 | 源<<32 | 目的 的关心位掩码
+        """
+        protocol_care = 0xFF if self.protocol != 0 else 0
+        return (protocol_care << 64 | (~self.src_wildcard_int & IPV4_ALL_ONE) << 32
+                | (~self.dst_wildcard_int & IPV4_ALL_ONE))
+
+    def get_key(self) -> int:
+        return self.protocol << 64 | self.src_int << 32 | self.dst_int
+
+    def match(self, src_int: int, dst_int: int, protocol=0) -> bool:
+        """
+        逐条判断，用于核对编译结果，批量匹配请用 AccessList
+        """
+        return ((src_int & ~self.src_wildcard_int) == self.src_int and (dst_int & ~self.dst_wildcard_int) == self.dst_int
+                and (self.protocol == 0 or self.protocol == protocol))
+
+
+class AccessList:
+    """
+    编译后的ACL，用法:
+    acl = AccessList.from_text(open("acl.txt").read())
+    acl.match_ip("10.0.0.1", "10.2.3.4", 6)          # 返回第一条命中的规则下标，都不命中返回-1
+    acl.match_list(src_int_list, dst_int_list)       # 批量匹配，返回与输入一一对应的规则下标列表
+    acl.count_hit(src_int_list, dst_int_list)        # 返回每条规则的命中次数列表，最后1项为隐式拒绝的次数
+    ★协议号为0表示流日志没有协议信息，这时只有协议为ip（任意）的规则可能命中
+    """
+
+    def __init__(self, entry_list=None):
+        self.entry_list = entry_list if entry_list is not None else []  # AclEntry列表，下标即规则序号
+        self.table_list = []  # 每项为 (该表最小的规则下标, 关心位掩码, 哈希表{key: 规则下标})，按最小规则下标排序
+        self.compile()
+
+    @classmethod
+    def from_text(cls, text: str):
+        """
+        解析多行ACL文本
+        【输入错误会抛出Exception异常】
+        """
+        entry_list = []
+        for line in text.splitlines():
+            entry = AclEntry.from_text(line)
+            if entry is not None:
+                entry_list.append(entry)
+        return cls(entry_list)
+
+    def compile(self):
+        table_dict = {}  # key为关心位掩码，value为哈希表
+        for index, entry in enumerate(self.entry_list):
+            table = table_dict.setdefault(entry.get_care_mask(), {})
+            table.setdefault(entry.get_key(), index)  # 同一key只保留最靠前的规则，后面的被它遮蔽，永远不会命中
+        self.table_list = sorted((min(table.values()), care_mask, table) for care_mask, table in table_dict.items())
+
+    def get_shadowed_index_list(self) -> list:
+        """
+        返回被前面的规则完全遮蔽（条件完全相同）的规则下标列表，这些规则永远不会命中
+        """
+        kept_index_set = set(index for _, _, table in self.table_list for index in table.values())
+        return [index for index in range(len(self.entry_list)) if index not in kept_index_set]
+
+    def match_packed(self, packed: int) -> int:
+        """
+        按拼接数值 协议<<64 | 源<<32 | 目的 匹配，返回第一条命中的规则下标，都不命中（隐式拒绝）返回-1
+        """
+        best_index = len(self.entry_list)
+        for min_index, care_mask, table in self.table_list:
+            if min_index >= best_index:
+                break
+            index = table.get(packed & care_mask, best_index)
+            if index < best_index:
+                best_index = index
+        return best_index if best_index < len(self.entry_list) else -1
+
+    def match(self, src_int: int, dst_int: int, protocol=0) -> int:
+        """
+        返回第一条命中的规则下标，都不命中（隐式拒绝）返回-1
+        """
+        return self.match_packed(protocol << 64 | src_int << 32 | dst_int)
+
+    def match_ip(self, src_ip: str, dst_ip: str, protocol=0) -> int:
+        """
+        同 match() ，输入为ip地址文本
+        【输入错误会抛出Exception异常】
+        """
+        is_src_ip, src_int = cofnet.parse_ip_addr(src_ip)
+        is_dst_ip, dst_int = cofnet.parse_ip_addr(dst_ip)
+        if not is_src_ip or not is_dst_ip:
+            raise Exception("不是正确的ip地址", src_ip, dst_ip)
+        return self.match(src_int, dst_int, protocol)
+
+    def match_list(self, src_int_list: list, dst_int_list: list, protocol_list=None) -> list:
+        """
+        批量匹配，返回与输入一一对应的规则下标列表（-1为隐式拒绝）
+        ★流日志中相同的 (协议, 源, 目的) 大量重复，先拼接为整数去重，每个不同的值只匹配1次
+        """
+        if protocol_list is None:
+            packed_list = [src_int << 32 | dst_int for src_int, dst_int in zip(src_int_list, dst_int_list)]
+        else:
+            packed_list = [protocol << 64 | src_int << 32 | dst_int
+                           for src_int, dst_int, protocol in zip(src_int_list, dst_int_list, protocol_list)]
+        match_packed = self.match_packed
+        index_dict = {packed: match_packed(packed) for packed in set(packed_list)}
+        return [index_dict[packed] for packed in packed_list]
+
+    def count_hit(self, src_int_list: list, dst_int_list: list, protocol_list=None) -> list:
+        """
+        返回每条规则的命中次数列表，长度为规则数+1，最后1项为隐式拒绝（都不命中）的次数
+        """
+        hit_count_list = [0] * (len(self.entry_list) + 1)
+        for index in self.match_list(src_int_list, dst_int_list, protocol_list):
+            hit_count_list[index] += 1  # -1正好对应最后1项
+        return hit_count_list
+
+
+def main(argv: list) -> int:
+    parser = argparse.ArgumentParser(prog="cofacl.py", description="根据流日志统计ACL每条规则的命中次数")
+    parser.add_argument("acl_path", help="ACL文本文件，每行1条")
+    parser.add_argument("flow_path", help="流日志csv，每行为 源ip,目的ip[,协议号]，无法解析的行（如表头）跳过")
+    parser.add_argument("--unused", action="store_true", help="只列出没有命中的规则")
+    parser.add_argument("--batch-size", type=int, default=100000, help="每批匹配的流数量")
+    args = parser.parse_args(argv[1:])
+    with open(args.acl_path, "r", encoding="utf8") as f:
+        acl = AccessList.from_text(f.read())
+    hit_count_list = [0] * (len(acl.entry_list) + 1)
+    skipped_count = 0
+
+    def flush(src_list, dst_list, protocol_list):
+        for index, count in enumerate(acl.count_hit(src_list, dst_list, protocol_list)):
+            hit_count_list[index] += count
+
+    src_int_list, dst_int_list, protocol_list = [], [], []
+    with open(args.flow_path, "r", encoding="utf8", newline="") as f:
+        for row in csv.reader(f):
+            if len(row) < 2:
+                skipped_count += 1
+                continue
+            is_src_ip, src_int = cofnet.parse_ip_addr(row[0].strip())
+            is_dst_ip, dst_int = cofnet.parse_ip_addr(row[1].strip())
+            protocol_text = row[2].strip() if len(row) > 2 else "0"
+            if not is_src_ip or not is_dst_ip or not protocol_text.isdigit():
+                skipped_count += 1
+                continue
+            src_int_list.append(src_int)
+            dst_int_list.append(dst_int)
+            protocol_list.append(int(protocol_text))
+            if len(src_int_list) >= args.batch_size:
+                flush(src_int_list, dst_int_list, protocol_list)
+                src_int_list, dst_int_list, protocol_list = [], [], []
+    flush(src_int_list, dst_int_list, protocol_list)
+    shadowed_index_set = set(acl.get_shadowed_index_list())
+    for index, entry in enumerate(acl.entry_list):
+        if args.unused and hit_count_list[index] != 0:
+            continue
+        print(f"{index:>5} {hit_count_list[index]:>10}  {entry.text}{'  (被前面的规则遮蔽)' if index in shadowed_index_set else ''}")
+    if not args.unused:
+        print(f"{'-':>5} {hit_count_list[-1]:>10}  (隐式拒绝)")
+    print(f"flows={sum(hit_count_list)} skipped={skipped_count}")
+    return 0
+
+
+# #################################  end of module  ##############################
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
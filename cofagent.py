@@ -0,0 +1,384 @@
+#!/usr/bin/env python3
+# coding=utf-8
+# module name: cofagent
+# author: Cof-Lee <cof8007@gmail.com>
+# this module uses the GPL-3.0 open source protocol
+# update: 2024-11-27
+
+"""
+分布式存活扫描：1个协调端（SweepCoordinator）+ 多个探测节点（SweepAgent），基于tcp通信
+探测节点部署在各个观测点上监听tcp端口，协调端连接所有探测节点，把目标列表切分为多个分片，
+每个探测节点同一时间只领取1个分片，用 cofping.PingSweep 扫描，边扫描边把存活ip回传给协调端，
+协调端汇总结果并记录每个存活ip是由哪个探测节点发现的；某个探测节点断线或无响应时，它未完成的分片会重新分配给其他节点
+
+★协议：每条消息为1行json（utf8编码，以\n结尾）
+协调端 --> 探测节点:  {"type": "auth", "token": "共享令牌"}                                     连接建立后先发送，令牌不对时探测节点断开连接
+                    {"type": "shard", "shard_id": 0, "target_ip_list": [...], "sweep": {PingSweep的参数}}
+探测节点 --> 协调端:  {"type": "hello", "agent_name": "bj-01"}                                 认证通过后发送
+                    {"type": "live", "shard_id": 0, "result_list": [[ip, rtt_ms], ...]}      扫描过程中分批发送
+                    {"type": "heartbeat", "shard_id": 0}                                     扫描过程中每秒发送
+                    {"type": "done", "shard_id": 0, "sent_count": 256}                       分片扫描结束
+                    {"type": "error", "shard_id": 0, "message": "..."}                       分片扫描失败（如没有原始套接字权限）
+★安全：探测节点必须设置共享令牌，默认只监听127.0.0.1，需要跨主机时再显式指定监听地址；
+sweep参数只接受 AGENT_SWEEP_KWARG_LIST 中的数值参数，其他的一律拒绝
+★某个分片在探测节点上扫描失败时，协调端把它交给其他探测节点重试（不会再交给失败过的节点），
+所有在线的探测节点都失败过后不再重试，记入 failed_shard_dict
+
+用法（在本机用模拟网络测试时，给 SweepAgent 传入 socket_factory=cofsim.FakeIcmpNetwork(...).socket_factory 即可）:
+agent = SweepAgent(listen_host="10.0.0.11", listen_port=9731, agent_name="bj-01", token="共享令牌")
+agent.start()
+coordinator = SweepCoordinator(agent_address_list=[("10.0.0.11", 9731), ("10.0.0.12", 9731)], token="共享令牌")
+coordinator.start(target_ip_list)  # 阻塞型
+coordinator.live_ip_source_dict  # {ip: {agent_name: rtt_ms}}
+"""
+
+import hmac
+import json
+import queue
+import socket
+import threading
+import time
+import cofping
+
+AGENT_LISTEN_PORT_DEFAULT = 9731
+HEARTBEAT_INTERVAL_S = 1.0  # 探测节点扫描时发送心跳的间隔，单位：秒
+AGENT_IDLE_TIMEOUT_S = 10.0  # 协调端超过此时长没收到探测节点的任何消息，则认为它已失联，单位：秒
+AGENT_SWEEP_KWARG_LIST = ["timeout", "retry_count", "backoff", "rate_pps", "size", "ttl"]  # 协调端可以指定的PingSweep参数
+# 协调端与探测节点之间可能出现的通信错误：网络断开、json格式错误、消息缺少字段或字段类型不对
+AGENT_PROTOCOL_ERROR_TUPLE = (OSError, ValueError, KeyError, TypeError, AttributeError, IndexError)
+
+
+def send_message(conn: socket.socket, message: dict):
+    conn.sendall(json.dumps(message, separators=(",", ":")).encode("utf8") + b"\n")
+
+
+class MessageReader:
+    """
+    从tcp连接中按行读取json消息，对端关闭连接时抛出ConnectionError
+    """
+
+    def __init__(self, conn: socket.socket):
+        self.conn = conn
+        self.buffer = b""
+
+    def read_message(self) -> dict:
+        while b"\n" not in self.buffer:
+            data = self.conn.recv(65536)
+            if len(data) == 0:
+                raise ConnectionError("对端已关闭连接")
+            self.buffer += data
+        line, self.buffer = self.buffer.split(b"\n", 1)
+        return json.loads(line.decode("utf8"))
+
+
+class SweepAgent:
+    """
+    探测节点，监听tcp端口，接受协调端的连接，按协调端分配的分片执行存活扫描并回传结果
+    """
+
+    def __init__(self, listen_host="127.0.0.1", listen_port=AGENT_LISTEN_PORT_DEFAULT, agent_name="", token="", socket_factory=None):
+        self.listen_host = listen_host  # 默认只监听本机，需要跨主机时再显式指定
+        self.listen_port = listen_port  # 为0时由系统分配端口，start()后可从 self.listen_port 获取
+        self.agent_name = agent_name if agent_name != "" else socket.gethostname()  # 探测节点名称，用于标识结果来源
+        self.token = token  # 共享令牌，协调端连接后必须先发送相同的令牌
+        self.socket_factory = socket_factory  # 传给 cofping.PingSweep ，测试时可传入模拟套接字工厂
+        self.server_socket = None
+        self.conn_list = []
+        self.is_stopped = False
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        开始监听，非阻塞型，接受连接及处理请求都在后台线程中进行
+        【没有设置共享令牌时会抛出Exception异常】
+        """
+        if self.token == "":
+            raise Exception("探测节点必须设置共享令牌token", self.agent_name)
+        self.is_stopped = False
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server_socket.bind((self.listen_host, self.listen_port))
+        self.server_socket.listen(8)
+        self.listen_port = self.server_socket.getsockname()[1]
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+
+    def accept_loop(self):
+        while not self.is_stopped:
+            try:
+                conn, addr = self.server_socket.accept()
+            except OSError:
+                return  # 监听套接字已关闭
+            with self.lock:
+                self.conn_list.append(conn)
+            threading.Thread(target=self.serve_coordinator, args=(conn,), daemon=True).start()
+
+    def serve_coordinator(self, conn: socket.socket):
+        send_lock = threading.Lock()  # 收包线程（回传存活ip）、心跳线程与本线程共用此连接发送
+        try:
+            reader = MessageReader(conn)
+            message = reader.read_message()
+            if message.get("type") != "auth" or not hmac.compare_digest(str(message.get("token", "")).encode("utf8"),
+                                                                        self.token.encode("utf8")):
+                send_message(conn, {"type": "error", "message": "令牌不正确"})
+                return
+            send_message(conn, {"type": "hello", "agent_name": self.agent_name})
+            while not self.is_stopped:
+                message = reader.read_message()
+                if message.get("type") == "shard":
+                    self.run_shard(conn, send_lock, message)
+        except AGENT_PROTOCOL_ERROR_TUPLE:
+            pass  # 协调端断开，或收到了无法解析的消息
+        finally:
+            with self.lock:
+                if conn in self.conn_list:
+                    self.conn_list.remove(conn)
+            conn.close()
+
+    @staticmethod
+    def get_sweep_kwargs(message: dict) -> dict:
+        """
+        从分片消息中取出PingSweep的参数，只接受白名单中的数值参数
+        【参数不在白名单中或不是数值时会抛出Exception异常】
+        """
+        sweep_kwargs = message.get("sweep", {})
+        if not isinstance(sweep_kwargs, dict):
+            raise Exception("sweep参数格式不正确", sweep_kwargs)
+        for key, value in sweep_kwargs.items():
+            if key not in AGENT_SWEEP_KWARG_LIST:
+                raise Exception("不接受此sweep参数", key)
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+                raise Exception("sweep参数应为非负数值", key, value)
+        return sweep_kwargs
+
+    def run_shard(self, conn: socket.socket, send_lock: threading.Lock, message: dict):
+        shard_id = message["shard_id"]
+        live_batch_list = []
+        sweep_error_list = []  # 扫描线程中抛出的异常
+
+        def send_locked(reply: dict):
+            with send_lock:
+                send_message(conn, reply)
+
+        def on_live(target_ip, rtt_ms):
+            live_batch_list.append([target_ip, rtt_ms])
+
+        def run_sweep():
+            try:
+                sweep.start()
+            except Exception as e:  # 如没有原始套接字权限，异常不能随线程一起丢掉，要回报给协调端
+                sweep_error_list.append(e)
+
+        try:
+            target_ip_list = message["target_ip_list"]
+            if not isinstance(target_ip_list, list) or not all(isinstance(target_ip, str) for target_ip in target_ip_list):
+                raise Exception("target_ip_list格式不正确")
+            sweep = cofping.PingSweep(target_ip_list=target_ip_list, live_callback=on_live, socket_factory=self.socket_factory,
+                                      **self.get_sweep_kwargs(message))
+        except Exception as e:
+            send_locked({"type": "error", "shard_id": shard_id, "message": str(e)})
+            return
+        sweep_thread = threading.Thread(target=run_sweep, daemon=True)
+        sweep_thread.start()
+        try:
+            # 本线程每隔一段时间把攒下的存活ip回传一次，顺带作为心跳
+            while sweep_thread.is_alive():
+                sweep_thread.join(HEARTBEAT_INTERVAL_S / 4)
+                if self.is_stopped:
+                    sweep.stop()
+                    raise ConnectionError("探测节点已停止")
+                result_list = live_batch_list[:]
+                del live_batch_list[:len(result_list)]
+                if len(result_list) != 0:
+                    send_locked({"type": "live", "shard_id": shard_id, "result_list": result_list})
+                else:
+                    send_locked({"type": "heartbeat", "shard_id": shard_id})
+        except OSError:
+            sweep.stop()
+            raise
+        if len(live_batch_list) != 0:
+            send_locked({"type": "live", "shard_id": shard_id, "result_list": live_batch_list[:]})
+        if len(sweep_error_list) != 0:
+            send_locked({"type": "error", "shard_id": shard_id, "message": repr(sweep_error_list[0])})
+            return
+        send_locked({"type": "done", "shard_id": shard_id, "sent_count": sweep.sent_count})
+
+    def stop(self):
+        """
+        停止监听并断开所有连接，正在扫描的分片会被中断（协调端会把它重新分配给其他探测节点）
+        """
+        self.is_stopped = True
+        if self.server_socket is not None:
+            self.server_socket.close()
+        with self.lock:
+            for conn in self.conn_list:
+                try:
+                    conn.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                conn.close()
+            self.conn_list = []
+
+
+class SweepCoordinator:
+    """
+    协调端，连接各探测节点，切分目标列表并分配分片，汇总回传的结果
+    """
+
+    def __init__(self, agent_address_list=None, shard_size=4096, timeout=1, retry_count=2, backoff=2.0, rate_pps=0,
+                 size=1, ttl=128, idle_timeout_s=AGENT_IDLE_TIMEOUT_S, token=""):
+        self.agent_address_list = [] if agent_address_list is None else agent_address_list  # [(host, port), ...]
+        self.token = token  # 与探测节点相同的共享令牌
+        self.shard_size = shard_size  # 每个分片的目标ip数量
+        self.sweep_kwargs = {"timeout": timeout, "retry_count": retry_count, "backoff": backoff, "rate_pps": rate_pps,
+                             "size": size, "ttl": ttl}
+        self.idle_timeout_s = idle_timeout_s
+        self.live_ip_source_dict = {}  # 扫描结果，key为存活的ip，value为 {探测节点名称: rtt_ms}
+        self.shard_agent_dict = {}  # key为分片id，value为完成该分片的探测节点名称
+        self.unfinished_shard_id_list = []  # 所有探测节点都失联后，仍未完成的分片
+        self.lost_agent_list = []  # 中途失联的探测节点地址
+        self.failed_shard_dict = {}  # 在所有尝试中都扫描失败的分片，key为分片id，value为 [(探测节点名称, 错误信息), ...]
+        self.shard_error_dict = {}  # 扫描失败过的分片（含重试后成功的），格式同上
+        self.shard_failed_agent_dict = {}  # key为分片id，value为扫描该分片失败过的探测节点地址集合
+        self.active_agent_set = set()  # 尚未失联的探测节点地址（开始时为全部节点，连接失败或失联时移除）
+        self.sent_count = 0
+        self.is_finished = False
+        self.pending_shard_queue = queue.Queue()  # 领取的分片有结果（完成、失败或放回队列）后调用task_done()
+        self.shard_list = []
+        self.lock = threading.Lock()
+
+    @property
+    def live_ip_set(self) -> set:
+        return set(self.live_ip_source_dict)
+
+    def start(self, target_ip_list: list):
+        """
+        开始扫描，阻塞型，所有分片都完成或所有探测节点都失联后返回
+        """
+        self.live_ip_source_dict = {}
+        self.shard_agent_dict = {}
+        self.unfinished_shard_id_list = []
+        self.lost_agent_list = []
+        self.failed_shard_dict = {}
+        self.shard_error_dict = {}
+        self.shard_failed_agent_dict = {}
+        self.active_agent_set = set(tuple(agent_address) for agent_address in self.agent_address_list)
+        self.sent_count = 0
+        self.is_finished = False
+        self.pending_shard_queue = queue.Queue()
+        self.shard_list = [target_ip_list[start:start + self.shard_size] for start in range(0, len(target_ip_list), self.shard_size)]
+        for shard_id in range(len(self.shard_list)):
+            self.pending_shard_queue.put(shard_id)
+        thread_list = []
+        for agent_address in self.agent_address_list:
+            thread = threading.Thread(target=self.drive_agent, args=(tuple(agent_address),), daemon=True)
+            thread.start()
+            thread_list.append(thread)
+        for thread in thread_list:
+            thread.join()
+        self.unfinished_shard_id_list = [shard_id for shard_id in range(len(self.shard_list))
+                                         if shard_id not in self.shard_agent_dict and shard_id not in self.failed_shard_dict]
+        self.is_finished = True
+
+    def is_all_shard_done(self) -> bool:
+        """
+        所有分片都已完成或已确定失败时返回True；
+        队列中没有待领取的分片、也没有在途的分片（unfinished_tasks为0）时，不会再有分片可做，也返回True
+        """
+        with self.lock:
+            if len(self.shard_agent_dict) + len(self.failed_shard_dict) >= len(self.shard_list):
+                return True
+        return self.pending_shard_queue.unfinished_tasks == 0
+
+    def handle_shard_error(self, shard_id: int, agent_address: tuple, agent_name: str, error_message: str):
+        """
+        分片扫描失败：放回队列交给其他探测节点，所有在线的探测节点都失败过时记为失败
+        """
+        with self.lock:
+            self.shard_error_dict.setdefault(shard_id, []).append((agent_name, error_message))
+            self.shard_failed_agent_dict.setdefault(shard_id, set()).add(agent_address)
+        if not self.check_shard_failed(shard_id):
+            self.pending_shard_queue.put(shard_id)
+
+    def check_shard_failed(self, shard_id: int) -> bool:
+        """
+        所有在线的探测节点都扫描该分片失败过时，把它记为失败并返回True
+        """
+        with self.lock:
+            if not self.active_agent_set <= self.shard_failed_agent_dict.get(shard_id, set()):
+                return False
+            self.failed_shard_dict[shard_id] = self.shard_error_dict[shard_id]
+            return True
+
+    def drive_agent(self, agent_address: tuple):
+        """
+        每个探测节点一个线程：领取分片、发送、接收结果，直到所有分片完成；探测节点失联时把当前分片放回队列
+        """
+        try:
+            conn = socket.create_connection(agent_address, timeout=self.idle_timeout_s)
+        except OSError:
+            with self.lock:
+                self.lost_agent_list.append(agent_address)
+                self.active_agent_set.discard(agent_address)
+            return
+        shard_id = None
+        try:
+            reader = MessageReader(conn)
+            send_message(conn, {"type": "auth", "token": self.token})
+            message = reader.read_message()
+            if message.get("type") != "hello":
+                raise ValueError("探测节点拒绝了连接", message.get("message"))
+            agent_name = str(message.get("agent_name", "{}:{}".format(*agent_address)))
+            while not self.is_all_shard_done():
+                try:
+                    shard_id = self.pending_shard_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue  # 其他探测节点失联时，它的分片会被放回队列
+                with self.lock:
+                    is_failed_here = agent_address in self.shard_failed_agent_dict.get(shard_id, set())
+                if is_failed_here:  # 本节点扫描此分片失败过，留给其他节点
+                    if not self.check_shard_failed(shard_id):
+                        self.pending_shard_queue.put(shard_id)
+                    self.pending_shard_queue.task_done()
+                    shard_id = None
+                    time.sleep(0.05)
+                    continue
+                send_message(conn, {"type": "shard", "shard_id": shard_id, "target_ip_list": self.shard_list[shard_id],
+                                    "sweep": self.sweep_kwargs})
+                while True:
+                    message = reader.read_message()
+                    if message.get("shard_id") != shard_id:
+                        continue
+                    if message["type"] == "live":
+                        result_list = [(str(target_ip), float(rtt_ms)) for target_ip, rtt_ms in message["result_list"]]
+                        with self.lock:
+                            for target_ip, rtt_ms in result_list:
+                                self.live_ip_source_dict.setdefault(target_ip, {})[agent_name] = rtt_ms
+                    elif message["type"] == "done":
+                        sent_count = int(message["sent_count"])
+                        with self.lock:
+                            self.shard_agent_dict[shard_id] = agent_name
+                            self.sent_count += sent_count
+                        self.pending_shard_queue.task_done()
+                        shard_id = None
+                        break
+                    elif message["type"] == "error":
+                        self.handle_shard_error(shard_id, agent_address, agent_name, str(message.get("message", "")))
+                        self.pending_shard_queue.task_done()
+                        shard_id = None
+                        break
+        except AGENT_PROTOCOL_ERROR_TUPLE:
+            # 断线、消息格式不对等都按失联处理，在途的分片放回队列，重新分配给其他探测节点
+            with self.lock:
+                self.lost_agent_list.append(agent_address)
+            if shard_id is not None:
+                self.pending_shard_queue.put(shard_id)  # 先放回再task_done，unfinished_tasks不会短暂变为0
+                self.pending_shard_queue.task_done()
+        finally:
+            with self.lock:
+                self.active_agent_set.discard(agent_address)
+            conn.close()
+
+
+# #################################  end of module  ##############################
+if __name__ == '__main__':
+    print("Hello, this is cofagent.py")
@@ -0,0 +1,593 @@
+#!/usr/bin/env python3
+# coding=utf-8
+# module name: cofbench
+# author: Cof-Lee <cof8007@gmail.com>
+# this module uses the GPL-3.0 open source protocol
+# update: 2024-11-25
+
+"""
+cofnet及cofping热点函数的性能基准测试，无需网络，运行方式:
+python3 cofbench.py                                  运行全部基准，打印 ops/s 及内存峰值
+python3 cofbench.py --corpus-size 200000             指定语料数量（默认10万）
+python3 cofbench.py --save-baseline baseline.json    运行后把结果保存为基线（JSON）
+python3 cofbench.py --baseline baseline.json         运行后与基线对比，任一项 ops/s 下降超过阈值或基线中的项没有运行则返回码为1，
+                                                     基线中没有的新项只提示WARN
+python3 cofbench.py --baseline baseline.json --threshold 0.1    阈值默认为0.2，即下降20%
+python3 cofbench.py --legacy                         单次扫描解析与旧实现的对比（默认100万个地址，要求至少快5倍）
+
+★基线与机器相关，应在同一台机器上保存及对比
+★每项基准先预热一遍，再与其他项轮流重复计时 BENCH_REPEAT 轮，取最快的一轮，每轮至少 BENCH_ROUND_TIME_MIN 秒，输入至少 BENCH_SAMPLE_NUM_MIN 个
+★cofping的基准使用 cofsim 模拟网络（LOOPBACK_NETWORK，所有地址都立即回复echo响应），不发出任何真实报文
+
+★对比对象（--legacy）:
+legacy_ 开头的函数为 cofnet 改为单次扫描解析之前的实现（原样保留，仅作为速度基准，不要在业务代码里调用）
+新实现 parse_ip_addr() parse_cidr() parse_ipv6_addr() 在判断格式的同时返回数值，
+因此与之对比的是旧的“先 is_ 判断、再转换为数值”的两步写法
+"""
+
+import re
+import os
+import sys
+import json
+import math
+import time
+import random
+import struct
+import argparse
+import platform
+import contextlib
+import tracemalloc
+import cofnet
+import cofping
+import cofsim
+
+PARSE_SPEEDUP_REQUIRED = 5.0  # 单次扫描解析相对旧写法至少要快5倍
+REGRESSION_THRESHOLD_DEFAULT = 0.2  # ops/s 比基线下降超过20%即判为性能退化
+TRACEMALLOC_SAMPLE_SIZE = 2000  # 统计内存峰值时，每项基准只取前2000个输入，tracemalloc开启后会明显变慢
+ICMP_PKG_SIZE_MAX = 65535  # 与 iptool.MainWindow.detect_pkg_size_max 一致
+BENCH_REPEAT = 7  # 每项基准预热一遍后重复计时7轮，取最快的一轮，单轮计时受调度/频率波动影响太大，不能直接拿来卡20%的阈值
+BENCH_ROUND_TIME_MIN = 0.1  # 每轮至少跑0.1秒（单位：秒），语料太少时一轮内把语料循环多遍
+BENCH_SAMPLE_NUM_MIN = 10  # 每项基准的输入至少10个，避免个别输入的耗时决定整项结果
+
+# cofping基准用的模拟网络：任意目标都是0时延、不丢包，收到echo请求即回复，通过 socket_factory 注入
+LOOPBACK_NETWORK = cofsim.FakeIcmpNetwork()
+LOOPBACK_NETWORK.add_block("0.0.0.0/0", cofsim.FakeHostProfile(latency_ms=0.0))
+
+
+# #################################  legacy implementation（速度基准）  ##############################
+def legacy_is_ip_addr(input_str: str) -> bool:
+    """
+    判断 输入的字符串 是否为 ipv4地址（不带掩码），返回bool值，是则返回True，否则返回False。例如：
+    输入 "10.99.1.1"  返回  True
+    输入  "10.99.1.1/24"  返回  False，纯ipv4地址不能带掩码
+    """
+    seg_list = input_str.split(".")
+    if len(seg_list) != 4:
+        return False
+    if seg_list[0].isdigit():
+        if 0 > int(seg_list[0]) or int(seg_list[0]) > 255:
+            return False
+    else:
+        return False
+    if seg_list[1].isdigit():
+        if 0 > int(seg_list[1]) or int(seg_list[1]) > 255:
+            return False
+    else:
+        return False
+    if seg_list[2].isdigit():
+        if 0 > int(seg_list[2]) or int(seg_list[2]) > 255:
+            return False
+    else:
+        return False
+    if seg_list[3].isdigit():
+        if 0 > int(seg_list[3]) or int(seg_list[3]) > 255:
+            return False
+    else:
+        return False
+    return True
+
+
+def legacy_ip_or_maskbyte_to_int(ip_or_mask: str) -> int:
+    """
+    将 ip地址或掩码byte型 转为 32 bit的数值，例如：
+    输入 "255.255.255.0" 输出 4294967040
+    输入 "192.168.1.1"   输出 3232235777
+    【输入错误会抛出Exception异常】
+    """
+    if not legacy_is_ip_addr(ip_or_mask):
+        raise Exception("不是正确的ip地址或掩码", ip_or_mask)
+    seg_list = ip_or_mask.split(".")
+    ip_mask_int = int(seg_list[0]) << 24 | int(seg_list[1]) << 16 | int(seg_list[2]) << 8 | int(seg_list[3])
+    return ip_mask_int
+
+
+def legacy_is_cidr(input_str: str) -> bool:
+    """
+    判断 输入字符串 是否为 cidr地址块，返回bool值，是则返回True，否则返回False
+    输入 "10.99.1.0/24" 输出 True
+    输入 "10.99.1.1/24" 输出 False ，不是正确的cidr地址块写法，24位掩码，的最后一字节必须为0
+    """
+    netseg_maskint_seg_list = input_str.split("/")
+    if len(netseg_maskint_seg_list) != 2:
+        return False
+    if not netseg_maskint_seg_list[1].isdigit():
+        return False
+    if int(netseg_maskint_seg_list[1]) > 32 or int(netseg_maskint_seg_list[1]) < 0:
+        return False
+    ipv4_seg_list = netseg_maskint_seg_list[0].split(".")
+    if len(ipv4_seg_list) != 4:
+        return False
+    if ipv4_seg_list[0].isdigit():
+        if 0 > int(ipv4_seg_list[0]) or int(ipv4_seg_list[0]) > 255:
+            return False
+    else:
+        return False
+    if ipv4_seg_list[1].isdigit():
+        if 0 > int(ipv4_seg_list[1]) or int(ipv4_seg_list[1]) > 255:
+            return False
+    else:
+        return False
+    if ipv4_seg_list[2].isdigit():
+        if 0 > int(ipv4_seg_list[2]) or int(ipv4_seg_list[2]) > 255:
+            return False
+    else:
+        return False
+    if ipv4_seg_list[3].isdigit():
+        if 0 > int(ipv4_seg_list[3]) or int(ipv4_seg_list[3]) > 255:
+            return False
+    else:
+        return False
+    netseg_int = int(ipv4_seg_list[0]) << 24 | int(ipv4_seg_list[1]) << 16 | int(ipv4_seg_list[2]) << 8 | int(ipv4_seg_list[3])
+    netseg_int_and = netseg_int & (0xFFFFFFFF << (32 - int(netseg_maskint_seg_list[1])))
+    if netseg_int != netseg_int_and:
+        return False
+    return True
+
+
+def legacy_is_ipv6_addr(input_str: str) -> bool:
+    """
+    判断 输入字符串 是否为 ipv6地址（不带前缀长度），返回bool值，是则返回True，否则返回False，例：
+    输入 "FD00::1"   输出 True
+    输入 "FD00::1/64" 输出 False，原因是带了前缀长度
+    """
+    seg_list_sp = input_str.split("/")
+    if len(seg_list_sp) > 1:
+        return False
+    match_pattern = r'\:{2,}'
+    ret = re.findall(match_pattern, input_str, flags=re.I)
+    if ret.__len__() >= 2:  # 如果 输入的地址 有超过2个 :: 块，则为错误的ipv6地址，ipv6地址最多只能有1个 ::
+        return False
+    match_pattern2 = r'\:{3,}'
+    ret2 = re.findall(match_pattern2, input_str, flags=re.I)
+    if ret2.__len__() >= 1:  # 如果 输入的地址 有连续三个及以上数量的冒号，如 ::: ，则为错误的ipv6地址，最多只有2个连续的冒号
+        return False
+    seg_list = input_str.split("::")
+    if len(seg_list) == 1:  # 没有 "::" 0位缩写，则必须有8块
+        seg_list0 = input_str.split(":")
+        if len(seg_list0) != 8:
+            return False
+        for ipv6_seg in seg_list0:
+            try:
+                if int(ipv6_seg, base=16) > 0xFFFF or int(ipv6_seg, base=16) < 0:
+                    return False
+            except ValueError:
+                return False
+        return True
+    elif len(seg_list) == 2:  # 只有1个 "::" 0位缩写，则全0缩写:: 至少为2个块
+        if seg_list[0] != "" and seg_list[1] != "":  # 例如 FD00:1234::ffff
+            seg_list_head = seg_list[0].split(":")
+            seg_list_tail = seg_list[1].split(":")
+            if len(seg_list_head) + len(seg_list_tail) > 6:
+                return False
+            for ipv6_seg in seg_list_head:
+                try:
+                    if int(ipv6_seg, base=16) > 0xFFFF or int(ipv6_seg, base=16) < 0:
+                        return False
+                except ValueError:
+                    return False
+            for ipv6_seg in seg_list_tail:
+                try:
+                    if int(ipv6_seg, base=16) > 0xFFFF or int(ipv6_seg, base=16) < 0:
+                        return False
+                except ValueError:
+                    return False
+            return True
+        elif seg_list[0] == "" and seg_list[1] != "":  # 例如 ::ffff
+            seg_list_tail = seg_list[1].split(":")
+            if len(seg_list_tail) > 6:
+                return False
+            for ipv6_seg in seg_list_tail:
+                try:
+                    if int(ipv6_seg, base=16) > 0xFFFF or int(ipv6_seg, base=16) < 0:
+                        return False
+                except ValueError:
+                    return False
+            return True
+        elif seg_list[0] != "" and seg_list[1] == "":  # 例如 FD00::
+            seg_list_head = seg_list[0].split(":")
+            if len(seg_list_head) > 6:
+                return False
+            for ipv6_seg in seg_list_head:
+                try:
+                    if int(ipv6_seg, base=16) > 0xFFFF or int(ipv6_seg, base=16) < 0:
+                        return False
+                except ValueError:
+                    return False
+            return True
+        else:  # :: 的情况（全0）
+            return True
+    else:
+        return False
+
+
+def legacy_local__convert_to_ipv6_seg_full(ipv6_seg: str) -> str:
+    """
+    将ipv6的地址块（2字节为一块）转为4个字符的16进制数，返回的十六进制数都用大写字母表示
+    输入 "fd"  输出 "00FD"
+    """
+    if len(ipv6_seg) == 1:
+        return "000" + ipv6_seg.upper()
+    elif len(ipv6_seg) == 2:
+        return "00" + ipv6_seg.upper()
+    elif len(ipv6_seg) == 3:
+        return "0" + ipv6_seg.upper()
+    elif len(ipv6_seg) == 4:
+        return ipv6_seg.upper()
+    else:
+        raise Exception("不是正确的ipv6地址块（2字节为一块）,E1", ipv6_seg)
+
+
+def legacy_convert_to_ipv6_full(ipv6_address: str) -> str:
+    """
+    输入ipv6地址，转为完全展开式的ipv6地址（非缩写形式），返回的十六进制数都用大写字母表示
+    输入 "FD00:123::11" 输出 "FD00:0123:0000:0000:0000:0000:0000:0011"
+    【输入错误会抛出Exception异常】
+    """
+    if not legacy_is_ipv6_addr(ipv6_address):
+        raise Exception("不是正确的ipv6地址,E1", ipv6_address)
+    ipv6_full_seg_list = []
+    seg_list = ipv6_address.split("::")
+    if len(seg_list) == 1:  # 没有 "::" 0位缩写，则必须有8块
+        seg_list0 = ipv6_address.split(":")
+        for ipv6_seg in seg_list0:
+            ipv6_full_seg_list.append(legacy_local__convert_to_ipv6_seg_full(ipv6_seg))
+        return ":".join(ipv6_full_seg_list)
+    else:  # 只有1个 "::" 0位缩写，每个::缩写至少为2个块
+        if seg_list[0] != "" and seg_list[1] != "":  # 例如 FD00:1234::ffff
+            seg_list_head = seg_list[0].split(":")
+            seg_list_tail = seg_list[1].split(":")
+            len_seg_of_abbr = len(seg_list_head) + len(seg_list_tail)  # :: 全0缩写代表的块数
+            for ipv6_seg in seg_list_head:
+                ipv6_full_seg_list.append(legacy_local__convert_to_ipv6_seg_full(ipv6_seg))
+            for seg_zero in range(8 - len_seg_of_abbr):
+                ipv6_full_seg_list.append("0000")
+            for ipv6_seg in seg_list_tail:
+                ipv6_full_seg_list.append(legacy_local__convert_to_ipv6_seg_full(ipv6_seg))
+            return ":".join(ipv6_full_seg_list)
+        elif seg_list[0] == "" and seg_list[1] != "":  # 例如 ::ffff
+            seg_list_tail = seg_list[1].split(":")
+            for seg_zero in range(8 - len(seg_list_tail)):
+                ipv6_full_seg_list.append("0000")
+            for ipv6_seg in seg_list_tail:
+                ipv6_full_seg_list.append(legacy_local__convert_to_ipv6_seg_full(ipv6_seg))
+            return ":".join(ipv6_full_seg_list)
+        elif seg_list[0] != "" and seg_list[1] == "":  # 例如 FD00::
+            seg_list_head = seg_list[0].split(":")
+            for ipv6_seg in seg_list_head:
+                ipv6_full_seg_list.append(legacy_local__convert_to_ipv6_seg_full(ipv6_seg))
+            for seg_zero in range(8 - len(seg_list_head)):
+                ipv6_full_seg_list.append("0000")
+            return ":".join(ipv6_full_seg_list)
+        else:  # ::的情况（全0）
+            return "0000:0000:0000:0000:0000:0000:0000:0000"
+
+
+def legacy_ipv6_to_int128(ipv6_address: str) -> int:
+    # 旧版没有直接转数值的函数，只能先判断，再展开为完全式，再整体转为数值
+    return int(legacy_convert_to_ipv6_full(ipv6_address).replace(":", ""), base=16)
+
+
+# #################################  corpus  ##############################
+def generate_ipv4_corpus(count: int, seed=1) -> list:
+    """
+    生成ipv4地址字符串语料，约9成为正确地址（含常见的私网段、公网段），约1成为各种错误写法
+    """
+    rand = random.Random(seed)
+    invalid_sample_list = ["10.1.1", "10.1.1.256", "a.b.c.d", "10.1.1.1/24", "", "10..1.1", "300.1.1.1", "1.2.3.4.5"]
+    corpus = []
+    for _ in range(count):
+        kind = rand.random()
+        if kind < 0.3:
+            corpus.append(f"10.{rand.randint(0, 255)}.{rand.randint(0, 255)}.{rand.randint(1, 254)}")
+        elif kind < 0.5:
+            corpus.append(f"192.168.{rand.randint(0, 255)}.{rand.randint(1, 254)}")
+        elif kind < 0.9:
+            corpus.append(".".join(str(rand.randint(0, 255)) for _ in range(4)))
+        else:
+            corpus.append(rand.choice(invalid_sample_list))
+    return corpus
+
+
+def generate_cidr_corpus(count: int, seed=2) -> list:
+    """
+    生成cidr字符串语料，掩码位数集中在16-30位，少量为错误的网段（主机位不为0）
+    """
+    rand = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        maskint = rand.choice((8, 16, 20, 22, 23, 24, 24, 24, 25, 26, 27, 28, 29, 30, 32))
+        netseg_int = rand.randint(0, 0xFFFFFFFF) & cofnet.IPV4_MASKINT_TO_INT32_LIST[maskint]
+        if rand.random() < 0.05:
+            netseg_int |= 1  # 主机位不为0，不是正确的cidr
+        corpus.append(f"{cofnet.int32_to_ip(netseg_int)}/{maskint}")
+    return corpus
+
+
+def generate_ipv6_corpus(count: int, seed=3) -> list:
+    """
+    生成ipv6地址字符串语料，含完全展开式、缩写式（文档段、ULA、链路本地等常见形态），约1成为错误写法
+    """
+    rand = random.Random(seed)
+    invalid_sample_list = ["FD00:::1", "1::2::3", "FD00::1/64", "G::1", "1:2:3:4:5:6:7", "12345::1", ":1:2:3:4:5:6:7"]
+    corpus = []
+    for _ in range(count):
+        kind = rand.random()
+        if kind < 0.3:
+            corpus.append(cofnet.int128_to_ipv6_full(rand.getrandbits(128)))
+        elif kind < 0.5:
+            corpus.append(f"2001:db8:{rand.randint(0, 0xffff):x}::{rand.randint(1, 0xffff):x}")
+        elif kind < 0.7:
+            corpus.append(f"fe80::{rand.randint(0, 0xffff):x}:{rand.randint(0, 0xffff):x}:{rand.randint(0, 0xffff):x}:{rand.randint(0, 0xffff):x}")
+        elif kind < 0.9:
+            corpus.append(cofnet.int128_to_ipv6_short((0xFD << 120) | rand.getrandbits(80)))
+        else:
+            corpus.append(rand.choice(invalid_sample_list))
+    return corpus
+
+
+def generate_icmp_packet_corpus(count: int, seed=4) -> list:
+    """
+    生成icmp报文语料（bytes），大小多为常见的ping包长度，也覆盖到界面允许的最大值 ICMP_PKG_SIZE_MAX
+    """
+    rand = random.Random(seed)
+    common_size_list = [1, 32, 56, 64, 100, 512, 1024, 1472, 1500, 4096, 8192]
+    corpus = []
+    for _ in range(count):
+        kind = rand.random()
+        if kind < 0.8:
+            data_size = rand.choice(common_size_list)
+        elif kind < 0.95:
+            data_size = rand.randint(1, ICMP_PKG_SIZE_MAX)
+        else:
+            data_size = ICMP_PKG_SIZE_MAX
+        corpus.append(struct.pack("bbHHH", 8, 0, 0, rand.randint(0, 0xFFFF), rand.randint(0, 0xFFFF)) + rand.randbytes(data_size))
+    return corpus
+
+
+# #################################  benchmark  ##############################
+def time_func_over_corpus(func, corpus: list) -> float:
+    """
+    对语料中的每一项调用一次func，返回总耗时（单位：秒）
+    """
+    start_time = time.perf_counter()
+    for item in corpus:
+        func(item)
+    return time.perf_counter() - start_time
+
+
+def time_func_round(func, corpus: list, pass_num: int) -> float:
+    """
+    把语料循环 pass_num 遍，返回总耗时（单位：秒）
+    ★每遍之前都清空ipv6转换缓存（不计入耗时），各遍测的都是冷缓存，与只跑一遍时的口径一致
+    """
+    round_time = 0.0
+    for _ in range(pass_num):
+        cofnet.clear_ipv6_convert_cache()
+        round_time += time_func_over_corpus(func, corpus)
+    return round_time
+
+
+def legacy_parse_ip_addr(input_str: str) -> int:
+    if legacy_is_ip_addr(input_str):
+        return legacy_ip_or_maskbyte_to_int(input_str)
+    return -1
+
+
+def legacy_parse_cidr(input_str: str) -> int:
+    if legacy_is_cidr(input_str):
+        netseg, maskint = input_str.split("/")
+        return legacy_ip_or_maskbyte_to_int(netseg) << 8 | int(maskint)
+    return -1
+
+
+def legacy_parse_ipv6_addr(input_str: str) -> int:
+    if legacy_is_ipv6_addr(input_str):
+        return legacy_ipv6_to_int128(input_str)
+    return -1
+
+
+def bench_parse_validators(corpus_size=1000000) -> list:
+    """
+    对比旧的“先判断再转换”写法与新的单次扫描解析函数，返回结果列表，每项为字典:
+    {"name", "legacy_s", "new_s", "speedup", "ops_per_s"}
+    """
+    bench_item_list = [("ipv4 parse", legacy_parse_ip_addr, cofnet.parse_ip_addr, generate_ipv4_corpus(corpus_size)),
+                       ("cidr parse", legacy_parse_cidr, cofnet.parse_cidr, generate_cidr_corpus(corpus_size)),
+                       ("ipv6 parse", legacy_parse_ipv6_addr, cofnet.parse_ipv6_addr, generate_ipv6_corpus(corpus_size)),
+                       ("ipv4 is_ only", legacy_is_ip_addr, cofnet.is_ip_addr, generate_ipv4_corpus(corpus_size)),
+                       ("ipv6 is_ only", legacy_is_ipv6_addr, cofnet.is_ipv6_addr, generate_ipv6_corpus(corpus_size))]
+    result_list = []
+    for name, legacy_func, new_func, corpus in bench_item_list:
+        legacy_s = time_func_over_corpus(legacy_func, corpus)
+        new_s = time_func_over_corpus(new_func, corpus)
+        result_list.append({"name": name, "legacy_s": legacy_s, "new_s": new_s, "speedup": legacy_s / new_s,
+                            "ops_per_s": corpus_size / new_s})
+    return result_list
+
+
+def bench_ping_one_packet_loopback(target_ip: str):
+    ping = cofping.PingOnePacket(target_ip=target_ip, timeout=1, size=56, socket_factory=LOOPBACK_NETWORK.socket_factory)
+    ping.start()
+    if not ping.result.is_success:
+        raise Exception("回环模拟套接字应当总是检测成功", target_ip, ping.result.failed_info)
+
+
+def build_bench_case_list(corpus_size: int) -> list:
+    """
+    生成基准项列表，每项为三元组 (名称, 被测函数, 输入列表)，被测函数每次接收输入列表中的一项
+    """
+    ipv4_corpus = generate_ipv4_corpus(corpus_size)
+    valid_ipv4_corpus = [ip for ip in ipv4_corpus if cofnet.is_ip_addr(ip)]
+    ipv6_corpus = generate_ipv6_corpus(corpus_size)
+    valid_ipv6_corpus = [ipv6 for ipv6 in ipv6_corpus if cofnet.is_ipv6_addr(ipv6)]
+    rand = random.Random(5)
+    netseg_input_list = [(ip, str(rand.randint(0, 32))) for ip in valid_ipv4_corpus]
+    bench_case_list = [("cofnet.is_ip_addr", cofnet.is_ip_addr, ipv4_corpus),
+                       ("cofnet.parse_ip_addr", cofnet.parse_ip_addr, ipv4_corpus),
+                       ("cofnet.is_cidr", cofnet.is_cidr, generate_cidr_corpus(corpus_size)),
+                       ("cofnet.is_ipv6_addr", cofnet.is_ipv6_addr, ipv6_corpus),
+                       ("cofnet.convert_to_ipv6_short", cofnet.convert_to_ipv6_short, valid_ipv6_corpus),
+                       ("cofnet.get_netseg_int", lambda item: cofnet.get_netseg_int(*item), netseg_input_list),
+                       ("cofping.generate_icmp_checksum", cofping.PingOnePacket.generate_icmp_checksum,
+                        generate_icmp_packet_corpus(max(corpus_size // 100, BENCH_SAMPLE_NUM_MIN))),
+                       ("cofping.PingOnePacket(loopback)", bench_ping_one_packet_loopback,
+                        valid_ipv4_corpus[:max(corpus_size // 20, BENCH_SAMPLE_NUM_MIN)])]
+    try:
+        import iptool  # 依赖tkinter，没有tkinter的环境跳过此项
+        same_netseg_input_list = [(cofnet.get_netseg_int(ip, "17"), 32768, cofnet.get_hostseg_int(ip, "17"))
+                                  for ip in valid_ipv4_corpus[:max(corpus_size // 10000, BENCH_SAMPLE_NUM_MIN)]]
+        bench_case_list.append(("iptool.calculate_ip(/17 same netseg lines)",
+                                lambda item: iptool.MainWindow.generate_same_netseg_ip_line_list(*item), same_netseg_input_list))
+    except ImportError as err:
+        print(f"cofbench.build_bench_case_list: 跳过iptool基准 {err}")
+    return bench_case_list
+
+
+def measure_peak_bytes(func, corpus: list) -> int:
+    """
+    用tracemalloc统计对前 TRACEMALLOC_SAMPLE_SIZE 项输入调用func期间的内存分配峰值（单位：字节）
+    """
+    tracemalloc.start()
+    try:
+        for item in corpus[:TRACEMALLOC_SAMPLE_SIZE]:
+            func(item)
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return peak_bytes
+
+
+def run_bench_suite(corpus_size: int) -> dict:
+    """
+    运行全部基准项，返回字典，key为基准项名称，value为 {"ops_per_s", "peak_bytes", "count", "pass_num"}
+    每项先预热一遍（兼作估时），确定每轮循环语料的遍数 pass_num 使单轮耗时不少于 BENCH_ROUND_TIME_MIN，
+    再按轮次轮流计时全部基准项共 BENCH_REPEAT 轮，ops_per_s 取各项最快的一轮，count为输入个数
+    ★各项轮流计时而不是一项连跑多轮，机器整体变慢的时段会摊到所有项上，不会让某一项的几轮全落在慢时段里
+    """
+    result_dict = {}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):  # 屏蔽被测函数内部的print()
+        bench_case_list = build_bench_case_list(corpus_size)
+        pass_num_list = []
+        for name, func, corpus in bench_case_list:
+            warmup_time = time_func_round(func, corpus, 1)
+            pass_num_list.append(max(1, math.ceil(BENCH_ROUND_TIME_MIN / warmup_time)) if warmup_time > 0 else 1)
+        best_time_list = [math.inf] * len(bench_case_list)
+        for _ in range(BENCH_REPEAT):
+            for index, (name, func, corpus) in enumerate(bench_case_list):
+                best_time_list[index] = min(best_time_list[index], time_func_round(func, corpus, pass_num_list[index]))
+        for index, (name, func, corpus) in enumerate(bench_case_list):
+            cofnet.clear_ipv6_convert_cache()
+            best_time = best_time_list[index]
+            result_dict[name] = {"ops_per_s": pass_num_list[index] * len(corpus) / best_time if best_time > 0 else 0.0,
+                                 "peak_bytes": measure_peak_bytes(func, corpus),
+                                 "count": len(corpus),
+                                 "pass_num": pass_num_list[index]}
+    return result_dict
+
+
+def save_baseline(file_path: str, result_dict: dict, corpus_size: int):
+    baseline = {"python": platform.python_version(),
+                "platform": platform.platform(),
+                "corpus_size": corpus_size,
+                "saved_time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime()),
+                "results": result_dict}
+    with open(file_path, "w", encoding="utf8") as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2)
+
+
+def compare_with_baseline(result_dict: dict, baseline_result_dict: dict, threshold: float) -> list:
+    """
+    与基线对比，返回退化的基准项列表，每项为 (名称, 当前ops_per_s, 基线ops_per_s)
+    当前 ops/s 低于 基线*(1-threshold) 即判为退化，两边不都有的项不参与对比，由 get_missing_case_list() 另行报告
+    """
+    regression_list = []
+    for name, result in result_dict.items():
+        if name not in baseline_result_dict:
+            continue
+        baseline_ops = baseline_result_dict[name]["ops_per_s"]
+        if result["ops_per_s"] < baseline_ops * (1 - threshold):
+            regression_list.append((name, result["ops_per_s"], baseline_ops))
+    return regression_list
+
+
+def get_missing_case_list(result_dict: dict, baseline_result_dict: dict) -> tuple:
+    """
+    返回 (基线中没有的项, 本次没有运行的项)，均为名称列表，
+    前者一般是新增的基准（需重新保存基线），后者说明基准被删除或改名了，对应的退化不会被发现
+    """
+    new_case_list = [name for name in result_dict if name not in baseline_result_dict]
+    missing_case_list = [name for name in baseline_result_dict if name not in result_dict]
+    return new_case_list, missing_case_list
+
+
+def main_legacy(corpus_size: int) -> int:
+    result_list = bench_parse_validators(corpus_size)
+    is_all_passed = True
+    print(f"corpus_size={corpus_size}")
+    for result in result_list:
+        gated = result["name"].endswith("parse")  # 只对“判断+取数值”的对比做5倍要求，单纯is_判断的仅做展示
+        passed = result["speedup"] >= PARSE_SPEEDUP_REQUIRED or not gated
+        is_all_passed = is_all_passed and passed
+        print(f"{result['name']:<16} legacy={result['legacy_s']:8.3f}s  new={result['new_s']:8.3f}s  "
+              f"speedup={result['speedup']:6.2f}x  {result['ops_per_s']:12.0f} ops/s  {'' if not gated else ('OK' if passed else 'FAIL')}")
+    return 0 if is_all_passed else 1
+
+
+def main(argv: list) -> int:
+    parser = argparse.ArgumentParser(prog="cofbench", description="cofnet及cofping性能基准测试")
+    parser.add_argument("--corpus-size", type=int, default=None, help="语料数量，默认10万（--legacy时默认100万）")
+    parser.add_argument("--save-baseline", default="", help="把本次结果保存为基线JSON文件")
+    parser.add_argument("--baseline", default="", help="与此基线JSON文件对比，有退化则返回码为1")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD_DEFAULT, help="判为退化的ops/s下降比例")
+    parser.add_argument("--legacy", action="store_true", help="单次扫描解析与旧实现的对比")
+    args = parser.parse_args(argv[1:])
+    if args.legacy:
+        return main_legacy(args.corpus_size or 1000000)
+    corpus_size = args.corpus_size or 100000
+    result_dict = run_bench_suite(corpus_size)
+    print(f"corpus_size={corpus_size}")
+    for name, result in result_dict.items():
+        print(f"{name:<44} {result['ops_per_s']:14.1f} ops/s  peak={result['peak_bytes'] / 1024:10.1f} KiB  count={result['count']}x{result['pass_num']}")
+    if args.save_baseline != "":
+        save_baseline(args.save_baseline, result_dict, corpus_size)
+        print(f"已保存基线: {args.save_baseline}")
+    if args.baseline != "":
+        with open(args.baseline, "r", encoding="utf8") as f:
+            baseline = json.load(f)
+        regression_list = compare_with_baseline(result_dict, baseline["results"], args.threshold)
+        new_case_list, missing_case_list = get_missing_case_list(result_dict, baseline["results"])
+        for name in new_case_list:
+            print(f"WARN {name}: 基线中没有此项，未做对比，请重新保存基线")
+        for name in missing_case_list:
+            print(f"FAIL {name}: 基线中有此项，本次却没有运行（基准被删除或改名）")
+        for name, ops_per_s, baseline_ops in regression_list:
+            print(f"FAIL {name}: {ops_per_s:.1f} ops/s，基线为 {baseline_ops:.1f} ops/s，下降了 {1 - ops_per_s / baseline_ops:.1%}")
+        if len(regression_list) != 0 or len(missing_case_list) != 0:
+            return 1
+        print(f"与基线对比通过（阈值 {args.threshold:.0%}）")
+    return 0
+
+
+# #################################  end of module  ##############################
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+# coding=utf-8
+# module name: cofbulk
+# author: Cof-Lee <cof8007@gmail.com>
+# this module uses the GPL-3.0 open source protocol
+# update: 2024-11-29
+
+"""
+海量ip地址文件的去重、排序及聚合（合并为最少的cidr），文件大小可以超过内存，运行方式:
+python3 cofbulk.py dump1.txt dump2.txt -o result.txt                 去重并排序，每行1个ip
+python3 cofbulk.py dump1.txt --aggregate -o result.txt               去重后聚合为最少的cidr
+python3 cofbulk.py dump1.txt --memory-mb 512 --processes 4           内存预算512MB，解析用4个进程（默认为cpu核数）
+python3 cofbulk.py annotate access.csv --column src_ip -o out.csv   批量标注：在csv每行后追加该列ip的网段信息
+python3 cofbulk.py annotate access.csv --column 2 --maskint 24      列可用列名或下标（从0开始），单元格不带掩码时默认按/24计算
+
+★输入文件每行1个ipv4或ipv6地址，空行及#开头的行忽略，无法解析的行计数后跳过；输出先ipv4、后ipv6，各自按数值升序
+★流程（外部归并排序）:
+1.主进程按块（默认4MB，在行尾处切开）读取输入文件，分发给多个解析进程，各进程把一块解析为ipv4（32bit）及ipv6（128bit）整数，
+  在块内去重排序后，打包为定长大端字节序记录（ipv4每条4字节，ipv6每条16字节）返回，称为一个有序段（run），
+  定长大端记录按字节比较的顺序与按数值比较一致，归并时无需再转为整数
+2.主进程持有的有序段总大小超过内存预算时，把它们归并写入临时文件（溢出到磁盘）
+3.所有块解析完后，对内存中及磁盘上的有序段做k路归并（段太多时先分组归并），归并时顺带去重，最后按需聚合为cidr
+★块内排序直接用C实现的 sorted()（比纯python的基数排序快得多），跨块的顺序由归并保证
+★批量标注（BulkCsvAnnotator）: 同样按块分发给多个进程，每个单元格的ip（或 ip/掩码位数）用 cofnet.calculate_ip_info() 计算，
+  与界面ipv4页面显示的信息一致；各块的结果按输入顺序写出，在途的块数量有上限，内存占用与文件大小无关；
+  按行切块，所以csv的单元格内不能含有换行符；无法解析的单元格，其标注列留空
+"""
+
+import os
+import sys
+import heapq
+import array
+import shutil
+import csv
+import io
+import argparse
+import tempfile
+import collections
+import multiprocessing
+import cofnet
+
+BULK_MEMORY_BUDGET_DEFAULT = 256 << 20  # 主进程持有的有序段总大小上限，超过则溢出到磁盘，单位：字节
+BULK_CHUNK_SIZE_DEFAULT = 4 << 20  # 每个解析块的大小，单位：字节
+BULK_MERGE_FAN_IN_MAX = 64  # k路归并时同时打开的有序段数量上限
+BULK_READ_RECORD_NUM = 16384  # 从磁盘上的有序段每次读入的记录数
+IPV4_RECORD_SIZE = 4
+IPV6_RECORD_SIZE = 16
+# 批量标注追加的列，与 cofnet.calculate_ip_info() 返回的key对应
+BULK_ANNOTATE_FIELD_LIST = ["ip_hex", "ip_int", "ip_binary", "maskint", "maskbyte", "wildcard_mask", "netseg", "netseg_hex",
+                            "hostseg", "host_num", "last_ip"]
+
+
+def parse_ip_chunk(chunk: bytes) -> tuple:
+    """
+    解析进程的入口：把一块文本解析、去重、排序，返回四元组 (ipv4有序段, ipv6有序段, 行数, 无法解析的行数)，
+    有序段为定长大端记录拼接成的bytes，本函数不会抛出异常
+    """
+    ipv4_int_set = set()
+    ipv6_int_set = set()
+    line_count = 0
+    invalid_count = 0
+    for line in chunk.decode("utf8", errors="replace").splitlines():
+        line_count += 1
+        line = line.strip()
+        if line == "" or line[0] == "#":
+            continue
+        is_ip, ip_int = cofnet.parse_ip_addr(line)
+        if is_ip:
+            ipv4_int_set.add(ip_int)
+            continue
+        is_ipv6, ipv6_int = cofnet.parse_ipv6_addr(line)
+        if is_ipv6:
+            ipv6_int_set.add(ipv6_int)
+        else:
+            invalid_count += 1
+    ipv4_array = array.array("I", sorted(ipv4_int_set))
+    if sys.byteorder == "little":
+        ipv4_array.byteswap()  # 转为大端字节序
+    ipv6_run = b"".join([ipv6_int.to_bytes(IPV6_RECORD_SIZE, "big") for ipv6_int in sorted(ipv6_int_set)])
+    return ipv4_array.tobytes(), ipv6_run, line_count, invalid_count
+
+
+def iter_file_chunk(file_path: str, chunk_size: int):
+    """
+    按块读取文件，每块在最后一个换行符处切开，余下的部分并入下一块，保证每行完整地属于某一块
+    """
+    with open(file_path, "rb") as f:
+        remain = b""
+        while True:
+            data = f.read(chunk_size)
+            if len(data) == 0:
+                break
+            data = remain + data
+            cut_index = data.rfind(b"\n")
+            if cut_index < 0:
+                remain = data
+                continue
+            remain = data[cut_index + 1:]
+            yield data[:cut_index + 1]
+        if len(remain) != 0:
+            yield remain
+
+
+def iter_run_record(run, record_size: int):
+    """
+    逐条产出有序段中的记录（bytes），run为内存中的bytes，或磁盘上的有序段文件路径（str）
+    """
+    if isinstance(run, bytes):
+        for offset in range(0, len(run), record_size):
+            yield run[offset:offset + record_size]
+        return
+    with open(run, "rb") as f:
+        while True:
+            data = f.read(record_size * BULK_READ_RECORD_NUM)
+            if len(data) == 0:
+                return
+            for offset in range(0, len(data), record_size):
+                yield data[offset:offset + record_size]
+
+
+def iter_merged_record(run_list: list, record_size: int):
+    """
+    k路归并多个有序段，并去掉重复的记录
+    """
+    last_record = None
+    for record in heapq.merge(*[iter_run_record(run, record_size) for run in run_list]):
+        if record != last_record:
+            yield record
+            last_record = record
+
+
+def write_record_file(file_path: str, record_iter) -> int:
+    """
+    把记录逐块写入文件，返回写入的记录数
+    """
+    record_count = 0
+    buffer_list = []
+    with open(file_path, "wb") as f:
+        for record in record_iter:
+            buffer_list.append(record)
+            if len(buffer_list) >= BULK_READ_RECORD_NUM:
+                f.write(b"".join(buffer_list))
+                record_count += len(buffer_list)
+                buffer_list = []
+        f.write(b"".join(buffer_list))
+        record_count += len(buffer_list)
+    return record_count
+
+
+class BulkIpAggregator:
+    """
+    海量ip的去重、排序及聚合，结果通过 iter_ipv4_int() iter_ipv6_int() iter_cidr_int() 等按需流式产出
+    用法:
+    with BulkIpAggregator(input_path_list=["dump1.txt", "dump2.txt"], memory_budget=256 << 20) as aggregator:
+        aggregator.start()  # 阻塞型，解析全部输入
+        for cidr in aggregator.iter_cidr(4):
+            print(cidr)
+    """
+
+    def __init__(self, input_path_list=None, memory_budget=BULK_MEMORY_BUDGET_DEFAULT, process_num=0,
+                 chunk_size=BULK_CHUNK_SIZE_DEFAULT, temp_dir=None):
+        self.input_path_list = [] if input_path_list is None else input_path_list
+        self.memory_budget = memory_budget  # 主进程持有的有序段总大小上限，单位：字节（解析进程各自还需约 chunk_size 的数倍）
+        self.process_num = multiprocessing.cpu_count() if process_num <= 0 else process_num  # 为0时取cpu核数
+        self.chunk_size = chunk_size
+        self.temp_dir = temp_dir  # 临时文件所在目录，为None时使用系统默认的临时目录
+        self.line_count = 0  # 输入的总行数
+        self.invalid_count = 0  # 无法解析的行数
+        self.spill_count = 0  # 溢出到磁盘的次数
+        self.work_dir = ""  # 本次运行的临时目录，close()时删除
+        self.run_list_dict = {IPV4_RECORD_SIZE: [], IPV6_RECORD_SIZE: []}  # key为记录大小，value为有序段列表（bytes或文件路径）
+        self.held_size = 0  # 内存中有序段的总大小，单位：字节
+        self.temp_file_index = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        删除临时文件
+        """
+        if self.work_dir != "":
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+            self.work_dir = ""
+        self.run_list_dict = {IPV4_RECORD_SIZE: [], IPV6_RECORD_SIZE: []}
+        self.held_size = 0
+
+    def start(self):
+        self.close()
+        self.line_count = 0
+        self.invalid_count = 0
+        self.spill_count = 0
+        self.work_dir = tempfile.mkdtemp(prefix="cofbulk_", dir=self.temp_dir)
+        chunk_iter = (chunk for input_path in self.input_path_list for chunk in iter_file_chunk(input_path, self.chunk_size))
+        if self.process_num == 1:
+            for chunk in chunk_iter:
+                self.add_chunk_result(parse_ip_chunk(chunk))
+        else:
+            context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else multiprocessing
+            # 在途的块数量有上限，主进程不会一口气把整个文件读进内存
+            pending_result_deque = collections.deque()
+            with context.Pool(self.process_num) as pool:
+                for chunk in chunk_iter:
+                    pending_result_deque.append(pool.apply_async(parse_ip_chunk, (chunk,)))
+                    if len(pending_result_deque) >= self.process_num * 2:
+                        self.add_chunk_result(pending_result_deque.popleft().get())
+                while len(pending_result_deque) != 0:
+                    self.add_chunk_result(pending_result_deque.popleft().get())
+        for record_size in self.run_list_dict:
+            self.reduce_run_list(record_size)
+
+    def add_chunk_result(self, chunk_result: tuple):
+        ipv4_run, ipv6_run, line_count, invalid_count = chunk_result
+        self.line_count += line_count
+        self.invalid_count += invalid_count
+        for record_size, run in ((IPV4_RECORD_SIZE, ipv4_run), (IPV6_RECORD_SIZE, ipv6_run)):
+            if len(run) != 0:
+                self.run_list_dict[record_size].append(run)
+                self.held_size += len(run)
+        if self.held_size > self.memory_budget:
+            self.spill()
+
+    def get_temp_file_path(self) -> str:
+        self.temp_file_index += 1
+        return os.path.join(self.work_dir, f"run_{self.temp_file_index}.bin")
+
+    def spill(self):
+        """
+        把内存中的有序段归并为1个有序段文件
+        """
+        self.spill_count += 1
+        for record_size, run_list in self.run_list_dict.items():
+            held_run_list = [run for run in run_list if isinstance(run, bytes)]
+            if len(held_run_list) == 0:
+                continue
+            temp_file_path = self.get_temp_file_path()
+            write_record_file(temp_file_path, iter_merged_record(held_run_list, record_size))
+            self.run_list_dict[record_size] = [run for run in run_list if not isinstance(run, bytes)] + [temp_file_path]
+        self.held_size = 0
+
+    def reduce_run_list(self, record_size: int):
+        """
+        有序段数量超过 BULK_MERGE_FAN_IN_MAX 时，分组归并为较少的有序段文件，直到可以一次归并完
+        """
+        run_list = self.run_list_dict[record_size]
+        while len(run_list) > BULK_MERGE_FAN_IN_MAX:
+            next_run_list = []
+            for start in range(0, len(run_list), BULK_MERGE_FAN_IN_MAX):
+                group_run_list = run_list[start:start + BULK_MERGE_FAN_IN_MAX]
+                temp_file_path = self.get_temp_file_path()
+                write_record_file(temp_file_path, iter_merged_record(group_run_list, record_size))
+                for run in group_run_list:
+                    if not isinstance(run, bytes):
+                        os.remove(run)
+                next_run_list.append(temp_file_path)
+            run_list = next_run_list
+        self.held_size = sum(len(run) for run in run_list if isinstance(run, bytes))
+        self.run_list_dict[record_size] = run_list
+
+    def iter_int(self, ip_version: int):
+        """
+        按数值升序产出去重后的ip数值，ip_version为4或6
+        """
+        record_size = IPV4_RECORD_SIZE if ip_version == 4 else IPV6_RECORD_SIZE
+        for record in iter_merged_record(self.run_list_dict[record_size], record_size):
+            yield int.from_bytes(record, "big")
+
+    def iter_ipv4_int(self):
+        return self.iter_int(4)
+
+    def iter_ipv6_int(self):
+        return self.iter_int(6)
+
+    def iter_cidr_int(self, ip_version: int):
+        """
+        把去重后的ip聚合为最少的cidr，按网段数值升序产出 (网段数值, 前缀长度)
+        """
+        address_bits = 32 if ip_version == 4 else 128
+        range_start = range_end = -1
+        for ip_int in self.iter_int(ip_version):
+            if ip_int == range_end + 1:
+                range_end = ip_int
+                continue
+            if range_start >= 0:
+                yield from cofnet.range_to_cidr_int_list(range_start, range_end, address_bits)
+            range_start = range_end = ip_int
+        if range_start >= 0:
+            yield from cofnet.range_to_cidr_int_list(range_start, range_end, address_bits)
+
+    def iter_ip(self, ip_version: int):
+        int_to_ip = cofnet.int32_to_ip if ip_version == 4 else cofnet.int128_to_ipv6_short
+        for ip_int in self.iter_int(ip_version):
+            yield int_to_ip(ip_int)
+
+    def iter_cidr(self, ip_version: int):
+        int_to_ip = cofnet.int32_to_ip if ip_version == 4 else cofnet.int128_to_ipv6_short
+        for netseg_int, prefix_len in self.iter_cidr_int(ip_version):
+            yield int_to_ip(netseg_int) + "/" + str(prefix_len)
+
+
+def annotate_csv_chunk(chunk: bytes, column_index: int, default_maskint: int, field_list: list) -> tuple:
+    """
+    标注进程的入口：解析一块csv文本，在每行后追加 field_list 中的各列，返回二元组 (输出的csv文本bytes, 无法解析的行数)，
+    空行及只有空白字符的行直接跳过，不输出也不计为无法解析，本函数不会抛出异常
+    """
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator="\n")
+    empty_cell_list = [""] * len(field_list)
+    invalid_count = 0
+    line_list = [line for line in chunk.decode("utf8", errors="replace").splitlines() if line.strip() != ""]
+    for row in csv.reader(line_list):
+        cell = row[column_index].strip() if column_index < len(row) else ""
+        is_ip, ip_int = cofnet.parse_ip_addr(cell)
+        maskint = default_maskint
+        if not is_ip:
+            is_ip, ip_int, maskint = cofnet.parse_ip_with_maskint(cell)
+        if is_ip:
+            ip_info = cofnet.calculate_ip_info(ip_int, maskint)
+            writer.writerow(row + [ip_info[field] for field in field_list])
+        else:
+            invalid_count += 1
+            writer.writerow(row + empty_cell_list)
+    return output.getvalue().encode("utf8"), invalid_count
+
+
+class BulkCsvAnnotator:
+    """
+    批量标注csv文件：读取指定列的ipv4地址（或 ip/掩码位数），在每行后追加网段信息列，按输入顺序写出
+    用法:
+    annotator = BulkCsvAnnotator(input_path="access.csv", output_path="out.csv", column="src_ip", default_maskint=24)
+    annotator.start()  # 阻塞型
+    """
+
+    def __init__(self, input_path="", output_path="", column="0", default_maskint=32, field_list=None, has_header=True,
+                 process_num=0, chunk_size=BULK_CHUNK_SIZE_DEFAULT):
+        self.input_path = input_path
+        self.output_path = output_path
+        self.column = column  # 列名（有表头时）或列下标（从0开始）的字符串
+        self.default_maskint = default_maskint  # 单元格不带掩码时使用的掩码位数
+        self.field_list = BULK_ANNOTATE_FIELD_LIST[:] if field_list is None else field_list
+        self.has_header = has_header
+        self.process_num = multiprocessing.cpu_count() if process_num <= 0 else process_num  # 为0时取cpu核数
+        self.chunk_size = chunk_size
+        self.row_count = 0
+        self.invalid_count = 0  # 无法解析的行数
+
+    def start(self):
+        for field in self.field_list:
+            if field not in BULK_ANNOTATE_FIELD_LIST:
+                raise Exception("不支持的标注列", field)
+        if self.default_maskint < 0 or self.default_maskint > 32:
+            raise Exception("子网掩码数值应在[0-32]", self.default_maskint)
+        self.row_count = 0
+        self.invalid_count = 0
+        chunk_iter = iter_file_chunk(self.input_path, self.chunk_size)
+        with open(self.output_path, "wb") as output_file:
+            if self.has_header:
+                header_chunk = next(chunk_iter, b"")
+                header_line, _, first_chunk = header_chunk.partition(b"\n")
+                header_row = next(csv.reader([header_line.decode("utf8", errors="replace").lstrip("\ufeff")]), [])
+                column_index = self.column_to_index(header_row)
+                header_output = io.StringIO()
+                csv.writer(header_output, lineterminator="\n").writerow(header_row + self.field_list)
+                output_file.write(header_output.getvalue().encode("utf8"))
+                chunk_iter = self.chain_chunk(first_chunk, chunk_iter)
+            else:
+                column_index = self.column_to_index(None)
+            task_args = (column_index, self.default_maskint, self.field_list)
+            if self.process_num == 1:
+                for chunk in chunk_iter:
+                    self.write_chunk_result(output_file, annotate_csv_chunk(chunk, *task_args))
+                return
+            context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else multiprocessing
+            # 按提交顺序取回结果，保证输出与输入行序一致；在途的块数量有上限，内存占用与文件大小无关
+            pending_result_deque = collections.deque()
+            with context.Pool(self.process_num) as pool:
+                for chunk in chunk_iter:
+                    pending_result_deque.append(pool.apply_async(annotate_csv_chunk, (chunk,) + task_args))
+                    if len(pending_result_deque) >= self.process_num * 2:
+                        self.write_chunk_result(output_file, pending_result_deque.popleft().get())
+                while len(pending_result_deque) != 0:
+                    self.write_chunk_result(output_file, pending_result_deque.popleft().get())
+
+    @staticmethod
+    def chain_chunk(first_chunk: bytes, chunk_iter):
+        if len(first_chunk) != 0:
+            yield first_chunk
+        yield from chunk_iter
+
+    def column_to_index(self, header_row) -> int:
+        if header_row is not None and self.column in header_row:
+            return header_row.index(self.column)
+        if self.column.isdigit():
+            return int(self.column)
+        raise Exception("找不到要标注的列", self.column)
+
+    def write_chunk_result(self, output_file, chunk_result: tuple):
+        output_data, invalid_count = chunk_result
+        output_file.write(output_data)
+        self.row_count += output_data.count(b"\n")
+        self.invalid_count += invalid_count
+
+
+def main_annotate(argv: list) -> int:
+    parser = argparse.ArgumentParser(prog="cofbulk.py annotate", description="批量标注csv文件中ip的网段信息")
+    parser.add_argument("input_path", help="输入的csv文件")
+    parser.add_argument("-o", "--output", required=True, help="输出的csv文件")
+    parser.add_argument("--column", default="0", help="ip所在的列，列名或下标（从0开始）")
+    parser.add_argument("--maskint", type=int, default=32, help="单元格不带掩码时使用的掩码位数")
+    parser.add_argument("--fields", default=",".join(BULK_ANNOTATE_FIELD_LIST), help="追加的列，以逗号分隔")
+    parser.add_argument("--no-header", action="store_true", help="输入文件没有表头")
+    parser.add_argument("--processes", type=int, default=0, help="标注进程数，默认为cpu核数")
+    args = parser.parse_args(argv[1:])
+    annotator = BulkCsvAnnotator(input_path=args.input_path, output_path=args.output, column=args.column,
+                                 default_maskint=args.maskint, field_list=args.fields.split(","),
+                                 has_header=not args.no_header, process_num=args.processes)
+    annotator.start()
+    print(f"rows={annotator.row_count} invalid={annotator.invalid_count}", file=sys.stderr)
+    return 0
+
+
+def main(argv: list) -> int:
+    if len(argv) > 1 and argv[1] == "annotate":
+        return main_annotate(argv[1:])
+
+    parser = argparse.ArgumentParser(prog="cofbulk.py", description="海量ip地址文件的去重、排序及聚合为cidr")
+    parser.add_argument("input_path_list", nargs="+", help="输入文件，每行1个ipv4或ipv6地址")
+    parser.add_argument("-o", "--output", default="", help="输出文件，不指定时输出到标准输出")
+    parser.add_argument("--aggregate", action="store_true", help="聚合为最少的cidr")
+    parser.add_argument("--memory-mb", type=int, default=BULK_MEMORY_BUDGET_DEFAULT >> 20, help="内存预算，单位：MB")
+    parser.add_argument("--processes", type=int, default=0, help="解析进程数，默认为cpu核数")
+    parser.add_argument("--temp-dir", default=None, help="临时文件目录，默认为系统临时目录")
+    args = parser.parse_args(argv[1:])
+    with BulkIpAggregator(input_path_list=args.input_path_list, memory_budget=args.memory_mb << 20,
+                          process_num=args.processes, temp_dir=args.temp_dir) as aggregator:
+        aggregator.start()
+        output_file = open(args.output, "w", encoding="utf8") if args.output != "" else sys.stdout
+        try:
+            for ip_version in (4, 6):
+                line_iter = aggregator.iter_cidr(ip_version) if args.aggregate else aggregator.iter_ip(ip_version)
+                for line in line_iter:
+                    output_file.write(line + "\n")
+        finally:
+            if output_file is not sys.stdout:
+                output_file.close()
+        print(f"lines={aggregator.line_count} invalid={aggregator.invalid_count} spill={aggregator.spill_count}",
+              file=sys.stderr)
+    return 0
+
+
+# #################################  end of module  ##############################
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
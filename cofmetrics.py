@@ -0,0 +1,439 @@
+#!/usr/bin/env python3
+# coding=utf-8
+# module name: cofmetrics
+# author: Cof-Lee <cof8007@gmail.com>
+# this module uses the GPL-3.0 open source protocol
+# update: 2024-11-28
+
+"""
+探测过程的耗时统计、性能剖析钩子及限频日志
+用法:
+cofmetrics.enable()  # 默认关闭，关闭时各统计点只多一次属性判断，几乎没有开销
+... 运行ping检测或存活扫描 ...
+cofmetrics.INSTRUMENTATION.snapshot()  # {"stage": {阶段: {"count", "sum_ns", "max_ns", "bucket_count_list"}}, "counter": {...}}
+print(cofmetrics.INSTRUMENTATION.format_summary())
+
+★统计阶段:
+build           生成icmp报文（含校验和）
+send            发包系统调用（sendto/sendmmsg）
+queue_wait      报文到达内核（内核时间戳）到python线程被唤醒拿到报文的时长，即线程调度及GIL等待
+recv            收包系统调用（含阻塞等待回包的时长）
+parse           解析回包
+ui_dispatch     把结果更新到界面控件上
+"""
+
+import cProfile
+import http.server
+import io
+import logging
+import pstats
+import sys
+import threading
+import time
+import collections
+
+STAGE_BUILD = "build"
+STAGE_SEND = "send"
+STAGE_QUEUE_WAIT = "queue_wait"
+STAGE_RECV = "recv"
+STAGE_PARSE = "parse"
+STAGE_UI_DISPATCH = "ui_dispatch"
+STAGE_LIST = [STAGE_BUILD, STAGE_SEND, STAGE_QUEUE_WAIT, STAGE_RECV, STAGE_PARSE, STAGE_UI_DISPATCH]
+
+# 直方图的桶上限（纳秒），从1微秒开始按2倍递增到约17秒，最后一个桶收纳所有更大的值
+HISTOGRAM_BUCKET_BOUND_NS_LIST = [1000 << shift for shift in range(25)]
+
+# 每个目标的RTT直方图桶上限（秒），即Prometheus直方图的le标签
+TARGET_RTT_BUCKET_BOUND_S_LIST = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+METRICS_EXPORTER_PORT_DEFAULT = 9732
+
+LOG_RATE_LIMIT_COUNT_DEFAULT = 10  # 限频日志：同一条日志（按logger名称及消息模板区分）每个周期内最多输出的条数
+LOG_RATE_LIMIT_INTERVAL_S_DEFAULT = 10.0  # 限频日志的周期，单位：秒
+
+
+class LatencyHistogram:
+    """
+    耗时直方图，桶按2的幂划分，记录一次只需 int.bit_length() 计算桶下标，不需要排序或保存每个样本
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.sum_ns = 0
+        self.max_ns = 0
+        self.bucket_count_list = [0] * (len(HISTOGRAM_BUCKET_BOUND_NS_LIST) + 1)
+
+    def observe(self, duration_ns: int):
+        self.count += 1
+        self.sum_ns += duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+        # 第k个桶的上限为 1000<<k ，(duration_ns-1)//1000 的bit长度即为桶下标
+        bucket_index = ((max(duration_ns, 1) - 1) // 1000).bit_length()
+        self.bucket_count_list[min(bucket_index, len(HISTOGRAM_BUCKET_BOUND_NS_LIST))] += 1
+
+    def get_quantile_ns(self, quantile: float) -> int:
+        """
+        估算分位数（取所在桶的上限），没有样本时返回0
+        """
+        if self.count == 0:
+            return 0
+        target_count = quantile * self.count
+        accumulated_count = 0
+        for bucket_index, bucket_count in enumerate(self.bucket_count_list):
+            accumulated_count += bucket_count
+            if accumulated_count >= target_count:
+                if bucket_index < len(HISTOGRAM_BUCKET_BOUND_NS_LIST):
+                    return min(HISTOGRAM_BUCKET_BOUND_NS_LIST[bucket_index], self.max_ns)
+                return self.max_ns
+        return self.max_ns
+
+    def to_dict(self) -> dict:
+        return {"count": self.count, "sum_ns": self.sum_ns, "max_ns": self.max_ns, "bucket_count_list": self.bucket_count_list[:]}
+
+
+class Instrumentation:
+    """
+    各阶段耗时直方图及计数器，全局只用一个（INSTRUMENTATION），由 is_enabled 控制是否统计，
+    调用方在取时间之前先判断 is_enabled ，关闭时不调用 time.perf_counter_ns()
+    """
+
+    def __init__(self):
+        self.is_enabled = False
+        self.stage_histogram_dict = {stage: LatencyHistogram() for stage in STAGE_LIST}
+        self.counter_dict = collections.Counter()  # 如 "packet_sent" "packet_received" "reply_matched"
+        self.start_time = time.time()
+        self.lock = threading.Lock()
+
+    def observe(self, stage: str, duration_ns: int):
+        with self.lock:
+            histogram = self.stage_histogram_dict.get(stage)
+            if histogram is None:
+                histogram = self.stage_histogram_dict[stage] = LatencyHistogram()
+            histogram.observe(duration_ns)
+
+    def count(self, counter_name: str, number=1):
+        with self.lock:
+            self.counter_dict[counter_name] += number
+
+    def reset(self):
+        with self.lock:
+            self.stage_histogram_dict = {stage: LatencyHistogram() for stage in STAGE_LIST}
+            self.counter_dict = collections.Counter()
+            self.start_time = time.time()
+
+    def snapshot(self) -> dict:
+        """
+        导出当前统计数据的副本（只复制几十个整数），可在任意线程中调用
+        """
+        with self.lock:
+            return {"start_time": self.start_time,
+                    "stage": {stage: histogram.to_dict() for stage, histogram in self.stage_histogram_dict.items()},
+                    "counter": dict(self.counter_dict)}
+
+    def format_summary(self) -> str:
+        """
+        以文本表格汇总各阶段的次数、平均、p50、p99、最大耗时（微秒）及各计数器
+        """
+        with self.lock:
+            line_list = ["{:<12}{:>10}{:>12}{:>12}{:>12}{:>12}".format("stage", "count", "avg_us", "p50_us", "p99_us", "max_us")]
+            for stage, histogram in self.stage_histogram_dict.items():
+                avg_ns = histogram.sum_ns / histogram.count if histogram.count != 0 else 0
+                line_list.append("{:<12}{:>10}{:>12.1f}{:>12.1f}{:>12.1f}{:>12.1f}".format(
+                    stage, histogram.count, avg_ns / 1000, histogram.get_quantile_ns(0.5) / 1000,
+                    histogram.get_quantile_ns(0.99) / 1000, histogram.max_ns / 1000))
+            for counter_name, counter_value in sorted(self.counter_dict.items()):
+                line_list.append("{:<34}{:>12}".format(counter_name, counter_value))
+        return "\n".join(line_list)
+
+
+INSTRUMENTATION = Instrumentation()
+
+
+def enable():
+    INSTRUMENTATION.is_enabled = True
+
+
+def disable():
+    INSTRUMENTATION.is_enabled = False
+
+
+class TargetMetrics:
+    """
+    单个目标的累计统计，每次探测结束时增量更新
+    """
+
+    def __init__(self):
+        self.probe_count = 0  # 探测次数
+        self.lost_count = 0  # 失败次数（超时或收到差错报文）
+        self.is_up = False  # 最近一次探测是否成功
+        self.last_rtt_s = 0.0  # 最近一次成功探测的RTT，单位：秒
+        self.rtt_sum_s = 0.0
+        self.rtt_bucket_count_list = [0] * (len(TARGET_RTT_BUCKET_BOUND_S_LIST) + 1)  # 各桶的计数（非累计），最后一个为+Inf
+
+
+class TargetMetricsRegistry:
+    """
+    各目标的探测统计及探测引擎的运行状态，供 MetricsExporter 导出，
+    探测线程每次只更新一个目标的几个数值，导出时在锁内复制一份数值再格式化，不会长时间阻塞探测线程
+    """
+
+    def __init__(self):
+        self.target_metrics_dict = {}  # key为目标ip，value为TargetMetrics
+        self.inflight_probe_count = 0  # 正在进行中的探测数
+        self.lock = threading.Lock()
+
+    def probe_started(self):
+        with self.lock:
+            self.inflight_probe_count += 1
+
+    def probe_finished(self, target_ip: str, is_success: bool, rtt_ms: float):
+        rtt_s = rtt_ms / 1000
+        bucket_index = 0
+        while bucket_index < len(TARGET_RTT_BUCKET_BOUND_S_LIST) and rtt_s > TARGET_RTT_BUCKET_BOUND_S_LIST[bucket_index]:
+            bucket_index += 1
+        with self.lock:
+            self.inflight_probe_count -= 1
+            target_metrics = self.target_metrics_dict.get(target_ip)
+            if target_metrics is None:
+                target_metrics = self.target_metrics_dict[target_ip] = TargetMetrics()
+            target_metrics.probe_count += 1
+            target_metrics.is_up = is_success
+            if is_success:
+                target_metrics.last_rtt_s = rtt_s
+                target_metrics.rtt_sum_s += rtt_s
+                target_metrics.rtt_bucket_count_list[bucket_index] += 1
+            else:
+                target_metrics.lost_count += 1
+
+    def remove_target(self, target_ip: str):
+        with self.lock:
+            self.target_metrics_dict.pop(target_ip, None)
+
+    def reset(self):
+        with self.lock:
+            self.target_metrics_dict = {}
+
+    def format_prometheus_text(self) -> str:
+        """
+        按Prometheus文本格式（0.0.4）导出所有指标，耗时与目标数量成正比
+        """
+        with self.lock:
+            target_value_list = [(target_ip, target_metrics.probe_count, target_metrics.lost_count, target_metrics.is_up,
+                                  target_metrics.last_rtt_s, target_metrics.rtt_sum_s, target_metrics.rtt_bucket_count_list[:])
+                                 for target_ip, target_metrics in self.target_metrics_dict.items()]
+            inflight_probe_count = self.inflight_probe_count
+        engine_snapshot = INSTRUMENTATION.snapshot()
+        counter_dict = engine_snapshot["counter"]
+        line_list = ["# HELP cofping_rtt_seconds RTT of successful probes per target.",
+                     "# TYPE cofping_rtt_seconds histogram"]
+        for target_ip, probe_count, lost_count, is_up, last_rtt_s, rtt_sum_s, rtt_bucket_count_list in target_value_list:
+            label = escape_label_value(target_ip)
+            accumulated_count = 0
+            for bound_s, bucket_count in zip(TARGET_RTT_BUCKET_BOUND_S_LIST, rtt_bucket_count_list):
+                accumulated_count += bucket_count
+                line_list.append(f'cofping_rtt_seconds_bucket{{target="{label}",le="{bound_s}"}} {accumulated_count}')
+            accumulated_count += rtt_bucket_count_list[-1]
+            line_list.append(f'cofping_rtt_seconds_bucket{{target="{label}",le="+Inf"}} {accumulated_count}')
+            line_list.append(f'cofping_rtt_seconds_sum{{target="{label}"}} {rtt_sum_s}')
+            line_list.append(f'cofping_rtt_seconds_count{{target="{label}"}} {accumulated_count}')
+        for metric_name, metric_type, help_text, value_index in (
+                ("cofping_probes_total", "counter", "Probes sent per target.", 1),
+                ("cofping_probes_lost_total", "counter", "Probes without an echo reply per target.", 2),
+                ("cofping_target_up", "gauge", "1 if the last probe to the target succeeded.", 3),
+                ("cofping_last_rtt_seconds", "gauge", "RTT of the last successful probe per target.", 4)):
+            line_list.append(f"# HELP {metric_name} {help_text}")
+            line_list.append(f"# TYPE {metric_name} {metric_type}")
+            for target_value in target_value_list:
+                metric_value = int(target_value[value_index]) if metric_name == "cofping_target_up" else target_value[value_index]
+                line_list.append(f'{metric_name}{{target="{escape_label_value(target_value[0])}"}} {metric_value}')
+        line_list += ["# HELP cofping_inflight_probes Probes waiting for a reply.",
+                      "# TYPE cofping_inflight_probes gauge",
+                      f"cofping_inflight_probes {inflight_probe_count}"]
+        for counter_name, help_text in (("packet_sent", "Echo requests sent."),
+                                        ("packet_received", "ICMP packets received by the engine."),
+                                        ("reply_matched", "Received packets matched to a probe."),
+                                        ("reply_dropped", "Received packets dropped: unparsable, or echo replies carrying our id with an unknown or duplicate sequence."),
+                                        ("reply_timeout", "Probes that timed out.")):
+            line_list.append(f"# HELP cofping_{counter_name}_total {help_text}")
+            line_list.append(f"# TYPE cofping_{counter_name}_total counter")
+            line_list.append(f"cofping_{counter_name}_total {counter_dict.get(counter_name, 0)}")
+        line_list += ["# HELP cofping_stage_duration_seconds Time spent in each engine stage.",
+                      "# TYPE cofping_stage_duration_seconds histogram"]
+        for stage, histogram_dict in engine_snapshot["stage"].items():
+            accumulated_count = 0
+            for bound_ns, bucket_count in zip(HISTOGRAM_BUCKET_BOUND_NS_LIST, histogram_dict["bucket_count_list"]):
+                accumulated_count += bucket_count
+                line_list.append(f'cofping_stage_duration_seconds_bucket{{stage="{stage}",le="{bound_ns / 1e9}"}} {accumulated_count}')
+            line_list.append(f'cofping_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram_dict["count"]}')
+            line_list.append(f'cofping_stage_duration_seconds_sum{{stage="{stage}"}} {histogram_dict["sum_ns"] / 1e9}')
+            line_list.append(f'cofping_stage_duration_seconds_count{{stage="{stage}"}} {histogram_dict["count"]}')
+        return "\n".join(line_list) + "\n"
+
+
+TARGET_METRICS = TargetMetricsRegistry()
+
+
+def escape_label_value(label_value: str) -> str:
+    return label_value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class MetricsRequestHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = TARGET_METRICS.format_prometheus_text().encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # 不输出每次抓取的访问日志
+
+
+class MetricsExporter:
+    """
+    内置的Prometheus指标导出http服务，在后台线程中运行，访问 http://host:port/metrics 即可，
+    启动时会开启统计（enable()），探测线程只负责增量更新，抓取时才格式化
+    ★默认只监听 127.0.0.1 ，需要远程抓取时才显式指定 listen_host="0.0.0.0"
+    """
+
+    def __init__(self, listen_host="127.0.0.1", listen_port=METRICS_EXPORTER_PORT_DEFAULT):
+        self.listen_host = listen_host
+        self.listen_port = listen_port  # 为0时由系统分配端口，start()后可从 self.listen_port 获取
+        self.http_server = None
+        self.server_thread = None
+
+    def start(self):
+        enable()
+        self.http_server = http.server.ThreadingHTTPServer((self.listen_host, self.listen_port), MetricsRequestHandler)
+        self.http_server.daemon_threads = True
+        self.listen_port = self.http_server.server_address[1]
+        self.server_thread = threading.Thread(target=self.http_server.serve_forever, daemon=True)
+        self.server_thread.start()
+
+    def stop(self):
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+            self.http_server = None
+
+
+class ProfileHook:
+    """
+    cProfile性能剖析钩子，包住一段代码即可，例如：
+    with ProfileHook(output_path="sweep.prof") as hook:
+        sweep.start()
+    print(hook.report_text)
+    ★cProfile只统计调用它的线程，收包线程等其他线程需用 SamplingProfiler
+    """
+
+    def __init__(self, output_path="", sort_key="cumulative", line_num=30):
+        self.output_path = output_path  # 不为空时把原始数据保存到此文件，可用 snakeviz 等工具查看
+        self.sort_key = sort_key
+        self.line_num = line_num
+        self.profile = cProfile.Profile()
+        self.report_text = ""
+
+    def __enter__(self):
+        self.profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profile.disable()
+        if self.output_path != "":
+            self.profile.dump_stats(self.output_path)
+        report_stream = io.StringIO()
+        pstats.Stats(self.profile, stream=report_stream).sort_stats(self.sort_key).print_stats(self.line_num)
+        self.report_text = report_stream.getvalue()
+        return False
+
+
+class SamplingProfiler:
+    """
+    采样式性能剖析，后台线程每隔 interval_s 秒记录一次所有线程正在执行的函数，开销与被测代码的调用次数无关，
+    适合在压力下观察收发线程时间花在哪里
+    """
+
+    def __init__(self, interval_s=0.005):
+        self.interval_s = interval_s
+        self.sample_counter = collections.Counter()  # key为 "文件名:行号 函数名"，value为采样次数
+        self.sample_total = 0
+        self.is_running = False
+        self.sample_thread = None
+
+    def start(self):
+        self.is_running = True
+        self.sample_thread = threading.Thread(target=self.sample_loop, daemon=True)
+        self.sample_thread.start()
+
+    def sample_loop(self):
+        own_thread_id = threading.get_ident()
+        while self.is_running:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_thread_id:
+                    continue
+                code = frame.f_code
+                self.sample_counter[f"{code.co_filename}:{frame.f_lineno} {code.co_name}"] += 1
+                self.sample_total += 1
+            time.sleep(self.interval_s)
+
+    def stop(self):
+        self.is_running = False
+        if self.sample_thread is not None:
+            self.sample_thread.join()
+
+    def report(self, top_num=20) -> list:
+        """
+        返回采样次数最多的前top_num个位置，每项为 (位置, 采样次数, 占比)
+        """
+        return [(location, sample_count, sample_count / self.sample_total)
+                for location, sample_count in self.sample_counter.most_common(top_num)]
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    日志限频过滤器，同一条日志（按logger名称及未格式化的消息模板区分）每个周期内最多输出 limit_count 条，
+    周期结束时汇总输出被丢弃的条数，避免压力下大量日志拖慢收发线程
+    """
+
+    def __init__(self, limit_count=LOG_RATE_LIMIT_COUNT_DEFAULT, interval_s=LOG_RATE_LIMIT_INTERVAL_S_DEFAULT):
+        super().__init__()
+        self.limit_count = limit_count
+        self.interval_s = interval_s
+        self.window_dict = {}  # key为 (logger名称, 消息模板)，value为 [周期开始时间, 本周期已输出条数, 本周期丢弃条数]
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self.lock:
+            window = self.window_dict.get(key)
+            if window is None or now - window[0] >= self.interval_s:
+                dropped_count = 0 if window is None else window[2]
+                self.window_dict[key] = [now, 1, 0]
+                if dropped_count != 0:
+                    record.msg = f"{record.msg} (上个周期丢弃了{dropped_count}条相同日志)"
+                return True
+            if window[1] < self.limit_count:
+                window[1] += 1
+                return True
+            window[2] += 1
+            return False
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    获取带限频过滤器的logger，同一名称多次调用只添加一次过滤器，日志级别及输出位置由使用方用logging统一配置
+    """
+    logger = logging.getLogger(name)
+    if not any(isinstance(log_filter, RateLimitFilter) for log_filter in logger.filters):
+        logger.addFilter(RateLimitFilter())
+    return logger
+
+
+# #################################  end of module  ##############################
+if __name__ == '__main__':
+    print("Hello, this is cofmetrics.py")
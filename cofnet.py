@@ -28,6 +28,7 @@ ipv6_with_prefix_len    ipv6地址前带缀长度 的表示格式，如 FD00::33
 
 ★规定：
 凡是以 is_ 开头的用于判断的函数，只返回True或False两个值，不报错，不抛出异常
+凡是以 parse_ 开头的用于解析的函数，返回元组，第1项为是否解析成功（bool值），后面为解析出的数值，不报错，不抛出异常
 
 ★作者： 李茂福（英文名Cof-Lee）
 """
@@ -37,40 +38,203 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 import re
+import bisect
+import heapq
+import socket
+import functools
+import random
+
+# #################################  start of module's constant  ##############################
+# ipv4掩码只有33种（0-32位），模块加载时一次性算好，之后各函数直接查表，不再逐位计算
+IPV4_MASKINT_TO_INT32_LIST = [(0xFFFFFFFF << (32 - maskint)) & 0xFFFFFFFF for maskint in range(33)]  # 下标为掩码位数
+IPV4_MASKINT_TO_MASKBYTE_LIST = [".".join(str(0xFF & (mask_int32 >> shift)) for shift in (24, 16, 8, 0))
+                                 for mask_int32 in IPV4_MASKINT_TO_INT32_LIST]  # 如 [24] 为 "255.255.255.0"
+IPV4_MASKINT_TO_WILDCARD_MASK_LIST = [".".join(str(0xFF & (~mask_int32 >> shift)) for shift in (24, 16, 8, 0))
+                                      for mask_int32 in IPV4_MASKINT_TO_INT32_LIST]  # 如 [24] 为 "0.0.0.255"
+IPV4_MASKINT_TO_HOSTSEG_NUM_LIST = [(0xFFFFFFFF >> maskint) + 1 for maskint in range(33)]  # 如 [24] 为 256
+IPV4_MASKBYTE_INT32_TO_MASKINT_DICT = {mask_int32: maskint for maskint, mask_int32 in enumerate(IPV4_MASKINT_TO_INT32_LIST)}
+IPV4_MASKBYTE_TO_MASKINT_DICT = {maskbyte: maskint for maskint, maskbyte in enumerate(IPV4_MASKINT_TO_MASKBYTE_LIST)}
+IPV4_MASKINT_STR_TO_INT_DICT = {str(maskint): maskint for maskint in range(33)}  # 如 "24" 对应 24
+# ipv4地址每个字节段的字符串写法（含 "01" "001" 这类前导0写法）到数值的对照表，解析时查表代替int()
+IPV4_SEG_STR_TO_INT_DICT = {seg_str: seg_int for seg_int in range(256)
+                            for seg_str in (str(seg_int), "{:0>2d}".format(seg_int), "{:0>3d}".format(seg_int))}
+
+# 系统是否提供inet_pton（Unix及Windows都有），有则用它做ip地址解析的快速路径
+HAS_INET_PTON = hasattr(socket, "inet_pton")
+# ipv6地址的合法字符（一次匹配整个字符串），以及完全展开式各块在32位十六进制字符串中的切片位置
+IPV6_CHAR_PATTERN = re.compile(r'[0-9A-Fa-f:]+\Z')
+IPV6_FULL_HEX_SLICE_LIST = [(i, i + 4) for i in range(0, 32, 4)]
+
+# ipv6地址转换结果的LRU缓存容量，界面拖动前缀长度滑块时，同一地址会被反复转换
+IPV6_CONVERT_CACHE_SIZE = 4096
+
+# 循环群乱序遍历所支持的最大范围（ip数量），需要对 p-1 做试除分解，2^40 以内都很快
+CYCLIC_PERMUTATION_SIZE_MAX = 1 << 40
+
+# 特殊用途地址表，取自IANA的 IPv4/IPv6 Special-Purpose Address Registry（RFC6890）及组播、6to4等常用地址块，
+# 每项为 (地址块, 类别, 说明)，地址块可以嵌套，分类时以最长匹配（最具体的地址块）为准
+IPV4_SPECIAL_PURPOSE_LIST = [
+    ("0.0.0.0/8", "this_network", "本网络（RFC791）"),
+    ("0.0.0.0/32", "unspecified", "未指定地址"),
+    ("10.0.0.0/8", "private", "私网地址（RFC1918）"),
+    ("100.64.0.0/10", "cgnat", "运营商级NAT共享地址（RFC6598）"),
+    ("127.0.0.0/8", "loopback", "环回地址（RFC1122）"),
+    ("169.254.0.0/16", "link_local", "链路本地地址（RFC3927）"),
+    ("172.16.0.0/12", "private", "私网地址（RFC1918）"),
+    ("192.0.0.0/24", "ietf_protocol", "IETF协议分配（RFC6890）"),
+    ("192.0.0.0/29", "ietf_protocol", "IPv4服务延续前缀 DS-Lite（RFC7335）"),
+    ("192.0.0.8/32", "ietf_protocol", "IPv4哑地址（RFC7600）"),
+    ("192.0.0.9/32", "anycast", "PCP任播地址（RFC7723）"),
+    ("192.0.0.10/32", "anycast", "TURN任播地址（RFC8155）"),
+    ("192.0.0.170/31", "ietf_protocol", "NAT64/DNS64发现（RFC7050）"),
+    ("192.0.2.0/24", "documentation", "文档示例地址 TEST-NET-1（RFC5737）"),
+    ("192.31.196.0/24", "as112", "AS112-v4（RFC7535）"),
+    ("192.52.193.0/24", "amt", "AMT（RFC7450）"),
+    ("192.88.99.0/24", "6to4", "6to4中继任播，已废弃（RFC7526）"),
+    ("192.168.0.0/16", "private", "私网地址（RFC1918）"),
+    ("192.175.48.0/24", "as112", "AS112直接委派（RFC7534）"),
+    ("198.18.0.0/15", "benchmarking", "网络设备基准测试（RFC2544）"),
+    ("198.51.100.0/24", "documentation", "文档示例地址 TEST-NET-2（RFC5737）"),
+    ("203.0.113.0/24", "documentation", "文档示例地址 TEST-NET-3（RFC5737）"),
+    ("224.0.0.0/4", "multicast", "组播地址（RFC5771）"),
+    ("224.0.0.0/24", "multicast", "本地网络控制组播（RFC5771）"),
+    ("232.0.0.0/8", "multicast", "指定源组播 SSM（RFC4607）"),
+    ("233.252.0.0/24", "documentation", "文档示例组播地址 MCAST-TEST-NET（RFC6676）"),
+    ("239.0.0.0/8", "multicast", "管理范围组播（RFC2365）"),
+    ("240.0.0.0/4", "reserved", "保留地址（RFC1112）"),
+    ("255.255.255.255/32", "broadcast", "受限广播地址（RFC919）"),
+]
+IPV4_GLOBAL_CATEGORY = ("global", "公网地址")  # 不属于任何特殊用途地址块时的分类
+IPV6_SPECIAL_PURPOSE_LIST = [
+    ("::/128", "unspecified", "未指定地址（RFC4291）"),
+    ("::1/128", "loopback", "环回地址（RFC4291）"),
+    ("::ffff:0:0/96", "ipv4_mapped", "IPv4映射地址（RFC4291）"),
+    ("64:ff9b::/96", "translation", "IPv4/IPv6转换 NAT64（RFC6052）"),
+    ("64:ff9b:1::/48", "translation", "本地使用的IPv4/IPv6转换（RFC8215）"),
+    ("100::/64", "discard", "仅丢弃地址（RFC6666）"),
+    ("2000::/3", "global", "全球单播地址"),
+    ("2001::/23", "ietf_protocol", "IETF协议分配（RFC2928）"),
+    ("2001::/32", "teredo", "Teredo隧道（RFC4380）"),
+    ("2001:1::1/128", "anycast", "PCP任播地址（RFC7723）"),
+    ("2001:1::2/128", "anycast", "TURN任播地址（RFC8155）"),
+    ("2001:2::/48", "benchmarking", "网络设备基准测试（RFC5180）"),
+    ("2001:3::/32", "amt", "AMT（RFC7450）"),
+    ("2001:4:112::/48", "as112", "AS112-v6（RFC7535）"),
+    ("2001:10::/28", "orchid", "ORCHID，已废弃（RFC4843）"),
+    ("2001:20::/28", "orchid", "ORCHIDv2（RFC7343）"),
+    ("2001:db8::/32", "documentation", "文档示例地址（RFC3849）"),
+    ("2002::/16", "6to4", "6to4（RFC3056）"),
+    ("2620:4f:8000::/48", "as112", "AS112直接委派（RFC7534）"),
+    ("3fff::/20", "documentation", "文档示例地址（RFC9637）"),
+    ("5f00::/16", "srv6", "SRv6 SID（RFC9602）"),
+    ("fc00::/7", "ula", "唯一本地地址 ULA（RFC4193）"),
+    ("fe80::/10", "link_local", "链路本地地址（RFC4291）"),
+    ("ff00::/8", "multicast", "组播地址（RFC4291）"),
+]
+IPV6_UNASSIGNED_CATEGORY = ("reserved", "IETF保留地址（未分配）")  # 不属于任何地址块时的分类
 
 
 # #################################  start of module's function  ##############################
 # #### ipv4 ####
+def local__parse_ipv4_seg(ipv4_seg: str) -> int:
+    """
+    解析ipv4地址的1个字节段（十进制数字），返回0-255的数值，不是正确的字节段则返回-1，不抛出异常，例如：
+    输入 "254" 输出 254
+    输入 "0001" 输出 1 ，带多个前导0的写法查表查不到，才逐字符判断
+    输入 "256" 输出 -1
+    """
+    ipv4_seg_int = IPV4_SEG_STR_TO_INT_DICT.get(ipv4_seg, -1)
+    if ipv4_seg_int < 0 and ipv4_seg.isascii() and ipv4_seg.isdigit():
+        ipv4_seg_int = int(ipv4_seg)
+        if ipv4_seg_int > 255:
+            return -1
+    return ipv4_seg_int
+
+
+def local__parse_maskint(maskint_str: str) -> int:
+    """
+    解析子网掩码位数的字符串，返回0-32的数值，不是正确的掩码位数则返回-1，不抛出异常，例如：
+    输入 "24" 输出 24
+    输入 "33" 输出 -1
+    """
+    maskint = IPV4_MASKINT_STR_TO_INT_DICT.get(maskint_str, -1)
+    if maskint < 0 and maskint_str.isascii() and maskint_str.isdigit():
+        maskint = int(maskint_str)
+        if maskint > 32:
+            return -1
+    return maskint
+
+
+def parse_ip_addr(input_str: str) -> tuple:
+    """
+    单次扫描解析 ipv4地址（不带掩码），返回二元组 (是否为ipv4地址, 32bit数值)，不报错，不抛出异常，例如：
+    输入 "10.99.1.1"     输出 (True, 174260481)
+    输入 "10.99.1.1/24"  输出 (False, 0)
+    判断的同时得到了数值，调用方无需再用 ip_or_maskbyte_to_int() 重复解析
+    标准写法先交给系统的inet_pton（C实现）一次解析完，它不认的写法（如带前导0的 "010"）再查表逐段判断
+    """
+    if HAS_INET_PTON:
+        try:
+            return True, int.from_bytes(socket.inet_pton(socket.AF_INET, input_str), "big")
+        except (OSError, ValueError):
+            pass
+    seg_list = input_str.split(".")
+    if len(seg_list) != 4:
+        return False, 0
+    seg_get = IPV4_SEG_STR_TO_INT_DICT.get
+    seg0 = seg_get(seg_list[0], -1)
+    seg1 = seg_get(seg_list[1], -1)
+    seg2 = seg_get(seg_list[2], -1)
+    seg3 = seg_get(seg_list[3], -1)
+    if seg0 < 0 or seg1 < 0 or seg2 < 0 or seg3 < 0:  # 查表未命中，可能是带多个前导0的写法，逐段再判断一次
+        seg0 = local__parse_ipv4_seg(seg_list[0])
+        seg1 = local__parse_ipv4_seg(seg_list[1])
+        seg2 = local__parse_ipv4_seg(seg_list[2])
+        seg3 = local__parse_ipv4_seg(seg_list[3])
+        if seg0 < 0 or seg1 < 0 or seg2 < 0 or seg3 < 0:
+            return False, 0
+    return True, seg0 << 24 | seg1 << 16 | seg2 << 8 | seg3
+
+
+def parse_ip_with_maskint(input_str: str) -> tuple:
+    """
+    单次扫描解析 ip/子网掩码位数 的格式，返回三元组 (是否为此格式, ip的32bit数值, 掩码位数)，不报错，不抛出异常，例如：
+    输入 "10.99.1.55/24" 输出 (True, 174260535, 24)
+    输入 "10.99.1.55/255.255.255.0" 输出 (False, 0, 0)
+    """
+    ip_maskint_seg_list = input_str.split("/")
+    if len(ip_maskint_seg_list) != 2:
+        return False, 0, 0
+    maskint = local__parse_maskint(ip_maskint_seg_list[1])
+    if maskint < 0:
+        return False, 0, 0
+    is_ip, ip_int = parse_ip_addr(ip_maskint_seg_list[0])
+    if not is_ip:
+        return False, 0, 0
+    return True, ip_int, maskint
+
+
+def parse_cidr(input_str: str) -> tuple:
+    """
+    单次扫描解析 cidr地址块，返回三元组 (是否为cidr, 网段的32bit数值, 掩码位数)，不报错，不抛出异常，例如：
+    输入 "10.99.1.0/24" 输出 (True, 174260480, 24)
+    输入 "10.99.1.1/24" 输出 (False, 0, 0) ，24位掩码的最后一字节必须为0
+    """
+    is_ip_with_mask, netseg_int, maskint = parse_ip_with_maskint(input_str)
+    if not is_ip_with_mask:
+        return False, 0, 0
+    if netseg_int & IPV4_MASKINT_TO_INT32_LIST[maskint] != netseg_int:
+        return False, 0, 0
+    return True, netseg_int, maskint
+
+
 def is_ip_addr(input_str: str) -> bool:
     """
     判断 输入的字符串 是否为 ipv4地址（不带掩码），返回bool值，是则返回True，否则返回False。例如：
     输入 "10.99.1.1"  返回  True
     输入  "10.99.1.1/24"  返回  False，纯ipv4地址不能带掩码
     """
-    seg_list = input_str.split(".")
-    if len(seg_list) != 4:
-        return False
-    if seg_list[0].isdigit():
-        if 0 > int(seg_list[0]) or int(seg_list[0]) > 255:
-            return False
-    else:
-        return False
-    if seg_list[1].isdigit():
-        if 0 > int(seg_list[1]) or int(seg_list[1]) > 255:
-            return False
-    else:
-        return False
-    if seg_list[2].isdigit():
-        if 0 > int(seg_list[2]) or int(seg_list[2]) > 255:
-            return False
-    else:
-        return False
-    if seg_list[3].isdigit():
-        if 0 > int(seg_list[3]) or int(seg_list[3]) > 255:
-            return False
-    else:
-        return False
-    return True
+    return parse_ip_addr(input_str)[0]
 
 
 def is_cidr(input_str: str) -> bool:
@@ -79,41 +243,7 @@ def is_cidr(input_str: str) -> bool:
     输入 "10.99.1.0/24" 输出 True
     输入 "10.99.1.1/24" 输出 False ，不是正确的cidr地址块写法，24位掩码，的最后一字节必须为0
     """
-    netseg_maskint_seg_list = input_str.split("/")
-    if len(netseg_maskint_seg_list) != 2:
-        return False
-    if not netseg_maskint_seg_list[1].isdigit():
-        return False
-    if int(netseg_maskint_seg_list[1]) > 32 or int(netseg_maskint_seg_list[1]) < 0:
-        return False
-    ipv4_seg_list = netseg_maskint_seg_list[0].split(".")
-    if len(ipv4_seg_list) != 4:
-        return False
-    if ipv4_seg_list[0].isdigit():
-        if 0 > int(ipv4_seg_list[0]) or int(ipv4_seg_list[0]) > 255:
-            return False
-    else:
-        return False
-    if ipv4_seg_list[1].isdigit():
-        if 0 > int(ipv4_seg_list[1]) or int(ipv4_seg_list[1]) > 255:
-            return False
-    else:
-        return False
-    if ipv4_seg_list[2].isdigit():
-        if 0 > int(ipv4_seg_list[2]) or int(ipv4_seg_list[2]) > 255:
-            return False
-    else:
-        return False
-    if ipv4_seg_list[3].isdigit():
-        if 0 > int(ipv4_seg_list[3]) or int(ipv4_seg_list[3]) > 255:
-            return False
-    else:
-        return False
-    netseg_int = int(ipv4_seg_list[0]) << 24 | int(ipv4_seg_list[1]) << 16 | int(ipv4_seg_list[2]) << 8 | int(ipv4_seg_list[3])
-    netseg_int_and = netseg_int & (0xFFFFFFFF << (32 - int(netseg_maskint_seg_list[1])))
-    if netseg_int != netseg_int_and:
-        return False
-    return True
+    return parse_cidr(input_str)[0]
 
 
 def is_netseg_with_maskbyte(netseg: str, maskbyte: str) -> bool:
@@ -139,37 +269,7 @@ def is_ip_with_maskint(input_str: str) -> bool:
     输入 "10.99.1.55/24" 输出 True
     输入 "10.99.1.55/255.255.255.0" 输出 False，原因是 / 后面只能接数字，不能接子网掩码byte型
     """
-    ip_maskint_seg_list = input_str.split("/")
-    if len(ip_maskint_seg_list) != 2:
-        return False
-    if not ip_maskint_seg_list[1].isdigit():
-        return False
-    if int(ip_maskint_seg_list[1]) > 32 or int(ip_maskint_seg_list[1]) < 0:
-        return False
-    ipv4_seg_list = ip_maskint_seg_list[0].split(".")
-    if len(ipv4_seg_list) != 4:
-        return False
-    if ipv4_seg_list[0].isdigit():
-        if 0 > int(ipv4_seg_list[0]) or int(ipv4_seg_list[0]) > 255:
-            return False
-    else:
-        return False
-    if ipv4_seg_list[1].isdigit():
-        if 0 > int(ipv4_seg_list[1]) or int(ipv4_seg_list[1]) > 255:
-            return False
-    else:
-        return False
-    if ipv4_seg_list[2].isdigit():
-        if 0 > int(ipv4_seg_list[2]) or int(ipv4_seg_list[2]) > 255:
-            return False
-    else:
-        return False
-    if ipv4_seg_list[3].isdigit():
-        if 0 > int(ipv4_seg_list[3]) or int(ipv4_seg_list[3]) > 255:
-            return False
-    else:
-        return False
-    return True
+    return parse_ip_with_maskint(input_str)[0]
 
 
 def is_ip_range(input_str: str) -> bool:
@@ -243,75 +343,8 @@ def is_maskbyte(input_str: str) -> bool:
     """
     if not is_ip_addr(input_str):
         return False
-    maskbyte_to_int32 = ip_or_maskbyte_to_int(input_str)
-    # 大力出奇迹，只能一个一个地对比了（可以把常用的掩码放前面）
-    if maskbyte_to_int32 == 0xFFFFFF00:  # 24 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFFFFFFFF:  # 32 位掩码
-        return True
-    if maskbyte_to_int32 == 0x00000000:  # 0 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFFFFFFFC:  # 30 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFFFFF000:  # 20 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFFFFF800:  # 21 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFFFFFC00:  # 22 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFFFFFE00:  # 23 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFFFFFF80:  # 25 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFFFFFFC0:  # 26 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFFFFFFE0:  # 27 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFFFFFFF0:  # 28 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFFFFFFF8:  # 29 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFFF00000:  # 12 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFFF80000:  # 13 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFFFC0000:  # 14 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFFFE0000:  # 15 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFFFF0000:  # 16 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFFFF8000:  # 17 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFFFFC000:  # 18 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFFFFE000:  # 19 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFF000000:  # 8 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFF800000:  # 9 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFFC00000:  # 10 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFFE00000:  # 11 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFFFFFFFE:  # 31 位掩码
-        return True
-    if maskbyte_to_int32 == 0x80000000:  # 1 位掩码
-        return True
-    if maskbyte_to_int32 == 0xC0000000:  # 2 位掩码
-        return True
-    if maskbyte_to_int32 == 0xE0000000:  # 3 位掩码
-        return True
-    if maskbyte_to_int32 == 0xF0000000:  # 4 位掩码
-        return True
-    if maskbyte_to_int32 == 0xF8000000:  # 5 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFC000000:  # 6 位掩码
-        return True
-    if maskbyte_to_int32 == 0xFE000000:  # 7 位掩码
-        return True
-    return False
+    # 查表，33种掩码已预先计算好，见模块开头的 IPV4_MASKBYTE_INT32_TO_MASKINT_DICT
+    return ip_or_maskbyte_to_int(input_str) in IPV4_MASKBYTE_INT32_TO_MASKINT_DICT
 
 
 def maskint_to_maskbyte(maskint: int) -> str:
@@ -323,15 +356,7 @@ def maskint_to_maskbyte(maskint: int) -> str:
     """
     if maskint < 0 or maskint > 32:
         raise Exception("子网掩码数值应在[0-32]", maskint)
-    mask = [0, 0, 0, 0]
-    i = 0
-    while maskint >= 8:
-        mask[i] = 255
-        i += 1
-        maskint -= 8
-    if i < 4:
-        mask[i] = 255 - (2 ** (8 - maskint) - 1)
-    return ".".join(map(str, mask))
+    return IPV4_MASKINT_TO_MASKBYTE_LIST[maskint]
 
 
 def maskint_to_wildcard_mask(maskint: int) -> str:
@@ -343,30 +368,7 @@ def maskint_to_wildcard_mask(maskint: int) -> str:
     """
     if maskint < 0 or maskint > 32:
         raise Exception("子网掩码数值应在[0-32]", maskint)
-    wildcard_mask = [255, 255, 255, 255]
-    i = 0
-    while maskint >= 8:
-        wildcard_mask[i] = 0
-        i += 1
-        maskint -= 8
-    if i < 4:
-        wildcard_mask[i] = 2 ** (8 - maskint) - 1
-    return ".".join(map(str, wildcard_mask))
-
-
-def local__mask_seg_to_cidr(mask_seg: str) -> int:
-    """
-    将掩码其中一个字节的数字 转为 二进制数最开头的1的个数, 例如：
-    输入 "192" 输出 2 ，即 1100 0000
-    输入 "248" 输出 5 ，即 1111 1000
-    输入 "255" 输出 8 ，即 1111 1111
-    """
-    mask_seg_1_number = 0
-    mask_seg_int = int(mask_seg)
-    while mask_seg_int != 0:
-        mask_seg_1_number += 1
-        mask_seg_int = (mask_seg_int << 1) & 0xFF
-    return mask_seg_1_number
+    return IPV4_MASKINT_TO_WILDCARD_MASK_LIST[maskint]
 
 
 def maskbyte_to_maskint(maskbyte: str) -> int:
@@ -378,17 +380,8 @@ def maskbyte_to_maskint(maskbyte: str) -> int:
     """
     if not is_ip_addr(maskbyte):
         raise Exception("不是正确的子网掩码,E1", maskbyte)
-    mask_seg_list = maskbyte.split(".")
-    mask_seg_index = 0
-    maskint = 0
-    while mask_seg_list[mask_seg_index] == "255":
-        maskint += 8
-        mask_seg_index += 1
-        if mask_seg_index == 4:
-            break
-    if mask_seg_index < 4 and mask_seg_list[mask_seg_index] != "":
-        maskint += local__mask_seg_to_cidr(mask_seg_list[mask_seg_index])  # 依赖 local_mask_seg_to_cidr()
-    if maskbyte != maskint_to_maskbyte(maskint):
+    maskint = IPV4_MASKBYTE_TO_MASKINT_DICT.get(maskbyte)  # 查表，"255.255.255.000" 这类非标准写法查不到
+    if maskint is None:
         raise Exception("不是正确的子网掩码,E2", maskbyte)
     return maskint
 
@@ -399,9 +392,10 @@ def ip_to_hex_string(ip_addresss: str) -> str:
     输入 "10.99.1.254" 输出 "0A6301FE"
     【输入错误会抛出Exception异常】
     """
-    if not is_ip_addr(ip_addresss):
+    is_ip, ip_int = parse_ip_addr(ip_addresss)
+    if not is_ip:
         raise Exception("不是正确的ip地址,E1", ip_addresss)
-    return "".join("{:0>2X}".format(int(ip_seg_int)) for ip_seg_int in ip_addresss.split("."))
+    return "{:0>8X}".format(ip_int)
 
 
 def ip_or_maskbyte_to_int(ip_or_mask: str) -> int:
@@ -411,10 +405,9 @@ def ip_or_maskbyte_to_int(ip_or_mask: str) -> int:
     输入 "192.168.1.1"   输出 3232235777
     【输入错误会抛出Exception异常】
     """
-    if not is_ip_addr(ip_or_mask):
+    is_ip, ip_mask_int = parse_ip_addr(ip_or_mask)
+    if not is_ip:
         raise Exception("不是正确的ip地址或掩码", ip_or_mask)
-    seg_list = ip_or_mask.split(".")
-    ip_mask_int = int(seg_list[0]) << 24 | int(seg_list[1]) << 16 | int(seg_list[2]) << 8 | int(seg_list[3])
     return ip_mask_int
 
 
@@ -469,22 +462,22 @@ def get_netseg_int(ip_address: str, maskintorbyte: str) -> int:
     输入 "10.99.1.1","255.255.255.0"  输出 174260480 （输出值是网段的int值）
     【输入错误会抛出Exception异常】
     """
-    if not is_ip_addr(ip_address):
+    is_ip, ip_int = parse_ip_addr(ip_address)
+    if not is_ip:
         raise Exception("不是正确的ip地址", ip_address)
     maskintorbyte_seg = str(maskintorbyte).split(".")
     if len(maskintorbyte_seg) == 1:
         if not maskintorbyte_seg[0].isdigit():
             raise Exception("不是正确的子网掩码", maskintorbyte_seg)
-        if int(maskintorbyte_seg[0]) < 0 or int(maskintorbyte_seg[0]) > 32:
+        maskint = local__parse_maskint(maskintorbyte_seg[0])
+        if maskint < 0:
             raise Exception("子网掩码数值应在[0-32]范围内", maskintorbyte_seg)
         else:
-            maskint2bin = 0xFFFFFFFF << (32 - int(maskintorbyte_seg[0]))
-            return ip_or_maskbyte_to_int(ip_address) & maskint2bin
+            return ip_int & IPV4_MASKINT_TO_INT32_LIST[maskint]
     elif len(maskintorbyte_seg) == 4:
         if not is_maskbyte(maskintorbyte):
             raise Exception("不是正确的子网掩码", maskintorbyte)
-        maskint2bin = 0xFFFFFFFF << (32 - int(maskbyte_to_maskint(maskintorbyte)))
-        return ip_or_maskbyte_to_int(ip_address) & maskint2bin
+        return ip_int & ip_or_maskbyte_to_int(maskintorbyte)
     else:
         raise Exception("不是正确的子网掩码", maskintorbyte)
 
@@ -526,25 +519,59 @@ def get_hostseg_int(ip: str, maskintorbyte: str) -> int:
     输入 "10.99.1.145","255.255.255.0"  输出 145
     【输入错误会抛出Exception异常】
     """
-    if not is_ip_addr(ip):
+    is_ip, ip_int = parse_ip_addr(ip)
+    if not is_ip:
         raise Exception("不是正确的ip地址,E1", ip)
     maskintorbyte_seg = str(maskintorbyte).split(".")
     if len(maskintorbyte_seg) == 1:
-        if int(maskintorbyte_seg[0]) < 0 or int(maskintorbyte_seg[0]) > 32:
+        maskint = local__parse_maskint(maskintorbyte_seg[0])
+        if maskint < 0:
             raise Exception("子网掩码数值应在[0-32]", maskintorbyte_seg)
         else:
-            maskint2bin = 0xFFFFFFFF << (32 - int(maskintorbyte_seg[0]))
-            return ip_or_maskbyte_to_int(ip) & ~maskint2bin
+            return ip_int & ~IPV4_MASKINT_TO_INT32_LIST[maskint]
     elif len(maskintorbyte_seg) == 4:
         if not is_maskbyte(maskintorbyte):
             raise Exception("不是正确的掩码,E2", maskintorbyte)
         else:
-            maskint2bin = 0xFFFFFFFF << (32 - int(maskbyte_to_maskint(maskintorbyte)))
-            return ip_or_maskbyte_to_int(ip) & ~maskint2bin
+            return ip_int & ~ip_or_maskbyte_to_int(maskintorbyte)
     else:
         raise Exception("不是正确的掩码,E3", maskintorbyte)
 
 
+def calculate_ip_info(ip_int: int, maskint: int) -> dict:
+    """
+    计算ipv4地址在指定掩码下的各项信息（界面的ipv4页面及批量标注共用），只做整数运算，返回dict，例如：
+    输入 174260625, 24 （即 10.99.1.145/24）输出
+    {"ip": "10.99.1.145", "ip_hex": "0A630191", "ip_int": 174260625, "ip_binary": "00001010 01100011 00000001 10010001",
+     "maskint": 24, "maskbyte": "255.255.255.0", "maskbyte_hex": "FFFFFF00", "wildcard_mask": "0.0.0.255",
+     "netseg": "10.99.1.0", "netseg_hex": "0A630100", "netseg_int": 174260480, "hostseg": 145, "host_num": 256,
+     "last_ip": "10.99.1.255"}
+    hostseg为此ip在本网段内的序号（从0开始），host_num为本网段的ip总量
+    【输入错误会抛出Exception异常】
+    """
+    if ip_int < 0 or ip_int > 0xFFFFFFFF:
+        raise Exception("ipv4地址数值应在[0-4294967295]范围内", ip_int)
+    if maskint < 0 or maskint > 32:
+        raise Exception("子网掩码数值应在[0-32]", maskint)
+    mask_int32 = IPV4_MASKINT_TO_INT32_LIST[maskint]
+    netseg_int = ip_int & mask_int32
+    host_num = IPV4_MASKINT_TO_HOSTSEG_NUM_LIST[maskint]
+    return {"ip": int32_to_ip(ip_int),
+            "ip_hex": "{:0>8X}".format(ip_int),
+            "ip_int": ip_int,
+            "ip_binary": " ".join("{:0>8b}".format(0xFF & (ip_int >> shift)) for shift in (24, 16, 8, 0)),
+            "maskint": maskint,
+            "maskbyte": IPV4_MASKINT_TO_MASKBYTE_LIST[maskint],
+            "maskbyte_hex": "{:0>8X}".format(mask_int32),
+            "wildcard_mask": IPV4_MASKINT_TO_WILDCARD_MASK_LIST[maskint],
+            "netseg": int32_to_ip(netseg_int),
+            "netseg_hex": "{:0>8X}".format(netseg_int),
+            "netseg_int": netseg_int,
+            "hostseg": ip_int - netseg_int,
+            "host_num": host_num,
+            "last_ip": int32_to_ip(netseg_int + host_num - 1)}
+
+
 def get_hostseg_num(maskint: int) -> int:
     """
     根据子网掩码位数获取主机号可表示的主机ip数量
@@ -553,7 +580,7 @@ def get_hostseg_num(maskint: int) -> int:
     if maskint > 32 or maskint < 0:
         raise Exception("不是正确的子网掩码位数", maskint)
     else:
-        return (0xFFFFFFFF >> maskint) + 1
+        return IPV4_MASKINT_TO_HOSTSEG_NUM_LIST[maskint]
 
 
 def is_ip_in_cidr(ip: str, cidr: str) -> bool:
@@ -563,16 +590,15 @@ def is_ip_in_cidr(ip: str, cidr: str) -> bool:
     输入 "10.99.3.1","10.99.1.0/24"  输出 False
     ★若输入格式有误则返回False，且不会报错
     """
-    if not is_ip_addr(ip):
+    is_ip, ip_int = parse_ip_addr(ip)
+    if not is_ip:
         # raise Exception("不是正确的ip地址,E1", ip)
         return False
-    if not is_cidr(cidr):
+    is_cidr_ok, netseg_int_of_cidr, maskint = parse_cidr(cidr)
+    if not is_cidr_ok:
         # raise Exception("不是正确的cidr地址块,E2", cidr)
         return False
-    netseg_maskint = cidr.split("/")
-    netseg_int_of_ip = get_netseg_int(ip, netseg_maskint[1])
-    netseg_int_of_cidr = get_netseg_int(netseg_maskint[0], netseg_maskint[1])
-    if netseg_int_of_ip == netseg_int_of_cidr:
+    if ip_int & IPV4_MASKINT_TO_INT32_LIST[maskint] == netseg_int_of_cidr:
         return True
     else:
         return False
@@ -622,80 +648,83 @@ def is_ip_in_range(targetip: str, start_ip: str, end_ip: str) -> bool:
 
 
 # ################ ipv6 ################
+def local__parse_ipv6_seg_list(ipv6_seg_list: list) -> int:
+    """
+    解析若干个ipv6地址块（每块为1-4位十六进制数），返回这些块拼接后的数值，有不正确的块则返回-1，不抛出异常
+    输入 ["FD00", "1"] 输出 0xFD000001
+    """
+    value = 0
+    for ipv6_seg in ipv6_seg_list:
+        if not 0 < len(ipv6_seg) <= 4:
+            return -1
+        value = value << 16 | int(ipv6_seg, base=16)
+    return value
+
+
+def parse_ipv6_addr(input_str: str) -> tuple:
+    """
+    单次扫描解析 ipv6地址（不带前缀长度），返回二元组 (是否为ipv6地址, 128bit数值)，不报错，不抛出异常，例如：
+    输入 "FD00::1"    输出 (True, 0xFD000000000000000000000000000001)
+    输入 "FD00::1/64" 输出 (False, 0)，原因是带了前缀长度
+    先交给系统的inet_pton（C实现）一次解析完，否则用预编译的正则检查字符集，再按 :: 拆分为头尾两部分，每块只调用1次int()
+    """
+    if HAS_INET_PTON and "." not in input_str:  # 不支持内嵌ipv4的写法，如 ::FFFF:10.1.1.1
+        try:
+            return True, int.from_bytes(socket.inet_pton(socket.AF_INET6, input_str), "big")
+        except (OSError, ValueError):
+            pass
+    if IPV6_CHAR_PATTERN.match(input_str) is None:  # 只能含有十六进制字符及冒号
+        return False, 0
+    head_tail_list = input_str.split("::")
+    if len(head_tail_list) == 1:  # 没有 "::" 0位缩写，则必须有8块
+        seg_list = input_str.split(":")
+        if len(seg_list) != 8:
+            return False, 0
+        value = local__parse_ipv6_seg_list(seg_list)
+        if value < 0:
+            return False, 0
+        return True, value
+    elif len(head_tail_list) == 2:  # 只有1个 "::" 0位缩写，按RFC4291，:: 至少代表1个全0块
+        seg_list_head = head_tail_list[0].split(":") if head_tail_list[0] != "" else []
+        seg_list_tail = head_tail_list[1].split(":") if head_tail_list[1] != "" else []
+        if len(seg_list_head) + len(seg_list_tail) > 7:
+            return False, 0
+        head_value = local__parse_ipv6_seg_list(seg_list_head)
+        tail_value = local__parse_ipv6_seg_list(seg_list_tail)
+        if head_value < 0 or tail_value < 0:  # 如 ":::" 会拆出空块
+            return False, 0
+        return True, head_value << (128 - 16 * len(seg_list_head)) | tail_value
+    else:  # 超过1个 :: 块，ipv6地址最多只能有1个 ::
+        return False, 0
+
+
+def parse_ipv6_with_prefix_len(input_str: str) -> tuple:
+    """
+    单次扫描解析 ipv6地址带前缀长度的格式，返回三元组 (是否为此格式, 128bit数值, 前缀长度)，不报错，不抛出异常
+    输入 "FD00::/64" 输出 (True, 0xFD000000000000000000000000000000, 64)
+    输入 "FD00::11" 输出 (False, 0, 0) ，没有带前缀长度
+    """
+    seg_list = input_str.split("/")
+    if len(seg_list) != 2:
+        return False, 0, 0
+    if not (seg_list[1].isascii() and seg_list[1].isdigit()):
+        return False, 0, 0
+    ipv6_prefix_len = int(seg_list[1])
+    if ipv6_prefix_len > 128:
+        return False, 0, 0
+    is_ipv6, ipv6_int = parse_ipv6_addr(seg_list[0])
+    if not is_ipv6:
+        return False, 0, 0
+    return True, ipv6_int, ipv6_prefix_len
+
+
 def is_ipv6_addr(input_str: str) -> bool:
     """
     判断 输入字符串 是否为 ipv6地址（不带前缀长度），返回bool值，是则返回True，否则返回False，例：
     输入 "FD00::1"   输出 True
     输入 "FD00::1/64" 输出 False，原因是带了前缀长度
     """
-    seg_list_sp = input_str.split("/")
-    if len(seg_list_sp) > 1:
-        return False
-    match_pattern = r'\:{2,}'
-    ret = re.findall(match_pattern, input_str, flags=re.I)
-    if ret.__len__() >= 2:  # 如果 输入的地址 有超过2个 :: 块，则为错误的ipv6地址，ipv6地址最多只能有1个 ::
-        return False
-    match_pattern2 = r'\:{3,}'
-    ret2 = re.findall(match_pattern2, input_str, flags=re.I)
-    if ret2.__len__() >= 1:  # 如果 输入的地址 有连续三个及以上数量的冒号，如 ::: ，则为错误的ipv6地址，最多只有2个连续的冒号
-        return False
-    seg_list = input_str.split("::")
-    if len(seg_list) == 1:  # 没有 "::" 0位缩写，则必须有8块
-        seg_list0 = input_str.split(":")
-        if len(seg_list0) != 8:
-            return False
-        for ipv6_seg in seg_list0:
-            try:
-                if int(ipv6_seg, base=16) > 0xFFFF or int(ipv6_seg, base=16) < 0:
-                    return False
-            except ValueError:
-                return False
-        return True
-    elif len(seg_list) == 2:  # 只有1个 "::" 0位缩写，则全0缩写:: 至少为2个块
-        if seg_list[0] != "" and seg_list[1] != "":  # 例如 FD00:1234::ffff
-            seg_list_head = seg_list[0].split(":")
-            seg_list_tail = seg_list[1].split(":")
-            if len(seg_list_head) + len(seg_list_tail) > 6:
-                return False
-            for ipv6_seg in seg_list_head:
-                try:
-                    if int(ipv6_seg, base=16) > 0xFFFF or int(ipv6_seg, base=16) < 0:
-                        return False
-                except ValueError:
-                    return False
-            for ipv6_seg in seg_list_tail:
-                try:
-                    if int(ipv6_seg, base=16) > 0xFFFF or int(ipv6_seg, base=16) < 0:
-                        return False
-                except ValueError:
-                    return False
-            return True
-        elif seg_list[0] == "" and seg_list[1] != "":  # 例如 ::ffff
-            seg_list_tail = seg_list[1].split(":")
-            if len(seg_list_tail) > 6:
-                return False
-            for ipv6_seg in seg_list_tail:
-                try:
-                    if int(ipv6_seg, base=16) > 0xFFFF or int(ipv6_seg, base=16) < 0:
-                        return False
-                except ValueError:
-                    return False
-            return True
-        elif seg_list[0] != "" and seg_list[1] == "":  # 例如 FD00::
-            seg_list_head = seg_list[0].split(":")
-            if len(seg_list_head) > 6:
-                return False
-            for ipv6_seg in seg_list_head:
-                try:
-                    if int(ipv6_seg, base=16) > 0xFFFF or int(ipv6_seg, base=16) < 0:
-                        return False
-                except ValueError:
-                    return False
-            return True
-        else:  # :: 的情况（全0）
-            return True
-    else:
-        return False
+    return parse_ipv6_addr(input_str)[0]
 
 
 def is_ipv6_with_prefix_len(input_str: str) -> bool:
@@ -704,137 +733,88 @@ def is_ipv6_with_prefix_len(input_str: str) -> bool:
     输入 "FD00::/64" 输出 True
     输入 "FD00::11" 输出 False ，没有带前缀长度
     """
-    seg_list = input_str.split("/")
-    if len(seg_list) != 2:
-        return False
-    if not is_ipv6_addr(seg_list[0]):
-        return False
-    if seg_list[1].isdigit():
-        if 0 > int(seg_list[1]) or int(seg_list[1]) > 128:
-            return False
-        else:
-            return True
-    else:
-        return False
+    return parse_ipv6_with_prefix_len(input_str)[0]
 
 
-def local__convert_to_ipv6_seg_full(ipv6_seg: str) -> str:
+def ipv6_to_int128(ipv6_address: str) -> int:
     """
-    将ipv6的地址块（2字节为一块）转为4个字符的16进制数，返回的十六进制数都用大写字母表示
-    输入 "fd"  输出 "00FD"
+    将 ipv6地址 转为 128bit的数值，例如：
+    输入 "FD00::1" 输出 336294682933583715844663186250927177729
+    【输入错误会抛出Exception异常】
     """
-    if len(ipv6_seg) == 1:
-        return "000" + ipv6_seg.upper()
-    elif len(ipv6_seg) == 2:
-        return "00" + ipv6_seg.upper()
-    elif len(ipv6_seg) == 3:
-        return "0" + ipv6_seg.upper()
-    elif len(ipv6_seg) == 4:
-        return ipv6_seg.upper()
-    else:
-        raise Exception("不是正确的ipv6地址块（2字节为一块）,E1", ipv6_seg)
+    is_ipv6, ipv6_int = parse_ipv6_addr(ipv6_address)
+    if not is_ipv6:
+        raise Exception("不是正确的ipv6地址,E1", ipv6_address)
+    return ipv6_int
+
+
+def int128_to_ipv6_full(int128: int) -> str:
+    """
+    将 128bit数值 转为 完全展开式的ipv6地址，返回的十六进制数都用大写字母表示，例如：
+    输入 1 输出 "0000:0000:0000:0000:0000:0000:0000:0001"
+    【输入错误会抛出Exception异常】
+    """
+    if int128 < 0 or int128 > 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF:
+        raise Exception("ipv6地址数值应在[0-2^128-1]范围内", int128)
+    hex_str = "{:0>32X}".format(int128)
+    return ":".join(hex_str[start:end] for start, end in IPV6_FULL_HEX_SLICE_LIST)
 
 
+def int128_to_ipv6_short(int128: int) -> str:
+    """
+    将 128bit数值 转为 缩写形式的ipv6地址（第1个最长的、至少2块的全0块缩写为::），返回的十六进制数都用大写字母表示，例如：
+    输入 0xFD000123000000000000000000000011 输出 "FD00:123::11"
+    【输入错误会抛出Exception异常】
+    """
+    if int128 < 0 or int128 > 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF:
+        raise Exception("ipv6地址数值应在[0-2^128-1]范围内", int128)
+    seg_int_list = [0xFFFF & (int128 >> shift) for shift in range(112, -16, -16)]
+    # 查找第1个最长的全0块
+    longest_start = -1
+    longest_len = 0
+    run_start = -1
+    for index, seg_int in enumerate(seg_int_list):
+        if seg_int == 0:
+            if run_start < 0:
+                run_start = index
+            if index - run_start + 1 > longest_len:
+                longest_start = run_start
+                longest_len = index - run_start + 1
+        else:
+            run_start = -1
+    seg_str_list = ["{:X}".format(seg_int) for seg_int in seg_int_list]
+    if longest_len < 2:  # 至少要有2个全0块才缩写
+        return ":".join(seg_str_list)
+    return ":".join(seg_str_list[:longest_start]) + "::" + ":".join(seg_str_list[longest_start + longest_len:])
+
+
+@functools.lru_cache(maxsize=IPV6_CONVERT_CACHE_SIZE)
 def convert_to_ipv6_full(ipv6_address: str) -> str:
     """
     输入ipv6地址，转为完全展开式的ipv6地址（非缩写形式），返回的十六进制数都用大写字母表示
     输入 "FD00:123::11" 输出 "FD00:0123:0000:0000:0000:0000:0000:0011"
     【输入错误会抛出Exception异常】
     """
-    if not is_ipv6_addr(ipv6_address):
+    is_ipv6, ipv6_int = parse_ipv6_addr(ipv6_address)
+    if not is_ipv6:
         raise Exception("不是正确的ipv6地址,E1", ipv6_address)
-    ipv6_full_seg_list = []
-    seg_list = ipv6_address.split("::")
-    if len(seg_list) == 1:  # 没有 "::" 0位缩写，则必须有8块
-        seg_list0 = ipv6_address.split(":")
-        for ipv6_seg in seg_list0:
-            ipv6_full_seg_list.append(local__convert_to_ipv6_seg_full(ipv6_seg))
-        return ":".join(ipv6_full_seg_list)
-    else:  # 只有1个 "::" 0位缩写，每个::缩写至少为2个块
-        if seg_list[0] != "" and seg_list[1] != "":  # 例如 FD00:1234::ffff
-            seg_list_head = seg_list[0].split(":")
-            seg_list_tail = seg_list[1].split(":")
-            len_seg_of_abbr = len(seg_list_head) + len(seg_list_tail)  # :: 全0缩写代表的块数
-            for ipv6_seg in seg_list_head:
-                ipv6_full_seg_list.append(local__convert_to_ipv6_seg_full(ipv6_seg))
-            for seg_zero in range(8 - len_seg_of_abbr):
-                ipv6_full_seg_list.append("0000")
-            for ipv6_seg in seg_list_tail:
-                ipv6_full_seg_list.append(local__convert_to_ipv6_seg_full(ipv6_seg))
-            return ":".join(ipv6_full_seg_list)
-        elif seg_list[0] == "" and seg_list[1] != "":  # 例如 ::ffff
-            seg_list_tail = seg_list[1].split(":")
-            for seg_zero in range(8 - len(seg_list_tail)):
-                ipv6_full_seg_list.append("0000")
-            for ipv6_seg in seg_list_tail:
-                ipv6_full_seg_list.append(local__convert_to_ipv6_seg_full(ipv6_seg))
-            return ":".join(ipv6_full_seg_list)
-        elif seg_list[0] != "" and seg_list[1] == "":  # 例如 FD00::
-            seg_list_head = seg_list[0].split(":")
-            for ipv6_seg in seg_list_head:
-                ipv6_full_seg_list.append(local__convert_to_ipv6_seg_full(ipv6_seg))
-            for seg_zero in range(8 - len(seg_list_head)):
-                ipv6_full_seg_list.append("0000")
-            return ":".join(ipv6_full_seg_list)
-        else:  # ::的情况（全0）
-            return "0000:0000:0000:0000:0000:0000:0000:0000"
-
-
-def local__convert_to_ipv6_seg_short(ipv6_seg: str) -> str:
-    """
-    将ipv6的地址块（2字节为一块）转为缩写形式的地址块（最前面的0省略），返回的十六进制数都用大写字母表示
-    输入 "00FD"  输出 "FD"
-    """
-    return str(hex(int(ipv6_seg, base=16))).replace("0x", "").upper()
+    return int128_to_ipv6_full(ipv6_int)
 
 
+@functools.lru_cache(maxsize=IPV6_CONVERT_CACHE_SIZE)
 def convert_to_ipv6_short(ipv6_address: str) -> str:
     """
     输入ipv6地址，转为缩写形式的ipv6地址（全0块缩写为::），返回的十六进制数都用大写字母表示
     输入 "FD00:0123:0000:0000:0000:0000:0000:0011" 输出 "FD00:123::11"
     【输入错误会抛出Exception异常】
     """
-    if not is_ipv6_addr(ipv6_address):
+    is_ipv6, ipv6_int = parse_ipv6_addr(ipv6_address)
+    if not is_ipv6:
         raise Exception("不是正确的ipv6地址,E1", ipv6_address)
-    # 先转为完全展开形式的ipv6地址，再转为缩写形式
-    ipv6_full_address_seg_list = convert_to_ipv6_full(ipv6_address).split(":")
-    ipv6_full_address_short = []
-    ipv6_full_address_short_re = []
-    for ipv6_seg in ipv6_full_address_seg_list:
-        ipv6_seg_short = local__convert_to_ipv6_seg_short(ipv6_seg)
-        ipv6_full_address_short.append(ipv6_seg_short)
-        if ipv6_seg_short != "0":
-            ipv6_full_address_short_re.append("1")
-        else:
-            ipv6_full_address_short_re.append("0")
-    # 使用re去查找最长的全0块
-    match_pattern = r'(?:0)+'
-    ret2 = re.finditer(match_pattern, "".join(ipv6_full_address_short_re), flags=re.I)
-    ret_list = []
-    ret_len_list = []
-    for ret_item in ret2:
-        ret_len_list.append(ret_item.span()[1] - ret_item.span()[0])
-        ret_list.append(ret_item)
-    if len(ret_len_list) != 0:  # 查询到有全0块
-        longgest = max(ret_len_list)
-        if longgest >= 2:  # 至少要有2个全0块才缩写
-            max_index = ret_len_list.index(longgest)  # 查询到第1个最长全0块的索引
-            ipv6_full_address_short_head = ipv6_full_address_short[0:ret_list[max_index].span()[0]]
-            ipv6_full_address_short_tail = ipv6_full_address_short[ret_list[max_index].span()[1]:]
-            if len(ipv6_full_address_short_head) != 0 and len(ipv6_full_address_short_tail) != 0:
-                return ":".join(ipv6_full_address_short_head) + "::" + ":".join(ipv6_full_address_short_tail)
-            elif len(ipv6_full_address_short_head) == 0 and len(ipv6_full_address_short_tail) != 0:
-                return "::" + ":".join(ipv6_full_address_short_tail)
-            elif len(ipv6_full_address_short_head) != 0 and len(ipv6_full_address_short_tail) == 0:
-                return ":".join(ipv6_full_address_short_head) + "::"
-            else:
-                return "::"
-        else:
-            return ":".join(ipv6_full_address_short)
-    else:  # 没有查询到全0块
-        return ":".join(ipv6_full_address_short)
+    return int128_to_ipv6_short(ipv6_int)
 
 
+@functools.lru_cache(maxsize=IPV6_CONVERT_CACHE_SIZE)
 def get_ipv6_prefix(ipv6_address: str, ipv6_prefix_len: int) -> str:
     """
     获取ipv6地址前缀（不带/前缀长度）
@@ -843,28 +823,14 @@ def get_ipv6_prefix(ipv6_address: str, ipv6_prefix_len: int) -> str:
     输入 "FD00:0000:0000:0000:000A:0000:0000:8811, 80"  输出 "FD00::A:0:0:0"  不带前缀长度时，最后3个0不能删除
     【输入错误会抛出Exception异常】
     """
-    if not is_ipv6_addr(ipv6_address):
+    is_ipv6, ipv6_int = parse_ipv6_addr(ipv6_address)
+    if not is_ipv6:
         raise Exception("不是正确的ipv6地址,E1", ipv6_address)
     if 0 > ipv6_prefix_len or ipv6_prefix_len > 128:
         raise Exception("不是正确的ipv6地址前缀大小,E2", ipv6_prefix_len)
-    # 先转为完全展开形式的ipv6地址，再去截取前缀
-    ipv6_full_address = convert_to_ipv6_full(ipv6_address)
-    ipv6_full_address_seg_list = ipv6_full_address.split(":")
-    prefix_seg_num = ipv6_prefix_len // 16
-    prefix_last_seg_remainder = ipv6_prefix_len % 16
-    if prefix_last_seg_remainder == 0:
-        ipv6_prefix_seg_list = ipv6_full_address_seg_list[0:prefix_seg_num]
-    else:
-        ipv6_prefix_seg_list = ipv6_full_address_seg_list[0:prefix_seg_num]
-        ipv6_prefix_last_seg = int(ipv6_full_address_seg_list[prefix_seg_num], base=16) >> (16 - prefix_last_seg_remainder) << (
-                16 - prefix_last_seg_remainder)
-        ipv6_prefix_seg_list.append(str(hex(ipv6_prefix_last_seg)).replace("0x", ""))
-    if len(ipv6_prefix_seg_list) == 8:
-        return convert_to_ipv6_short(":".join(ipv6_prefix_seg_list))
-    else:
-        for i in range(8 - len(ipv6_prefix_seg_list)):
-            ipv6_prefix_seg_list.append("0000")
-        return convert_to_ipv6_short(":".join(ipv6_prefix_seg_list))
+    # 直接对128bit数值做掩码运算，再转为缩写形式
+    prefix_mask = (0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF << (128 - ipv6_prefix_len)) & 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF
+    return int128_to_ipv6_short(ipv6_int & prefix_mask)
 
 
 def get_ipv6_prefix_cidrv6(ipv6_address: str, ipv6_prefix_len: int) -> str:
@@ -887,6 +853,781 @@ def get_ipv6_prefix_cidrv6(ipv6_address: str, ipv6_prefix_len: int) -> str:
         return ipv6_prefix_split[0] + "::" + ":".join(new_ipv6_seg_tail_list) + "/" + str(ipv6_prefix_len)
 
 
+def get_ipv6_convert_cache_info() -> dict:
+    """
+    获取ipv6地址转换LRU缓存的命中统计，返回字典，key为函数名，value为 {"hits","misses","maxsize","currsize"} ，例如：
+    {"convert_to_ipv6_full": {"hits": 12, "misses": 3, "maxsize": 4096, "currsize": 3}, ...}
+    缓存以输入的字符串为key，被缓存的函数有: convert_to_ipv6_full() convert_to_ipv6_short() get_ipv6_prefix()
+    """
+    cache_info_dict = {}
+    for cached_func in (convert_to_ipv6_full, convert_to_ipv6_short, get_ipv6_prefix):
+        cache_info = cached_func.cache_info()
+        cache_info_dict[cached_func.__name__] = {"hits": cache_info.hits, "misses": cache_info.misses,
+                                                 "maxsize": cache_info.maxsize, "currsize": cache_info.currsize}
+    return cache_info_dict
+
+
+def clear_ipv6_convert_cache():
+    """
+    清空ipv6地址转换LRU缓存，命中统计也一并清零
+    """
+    convert_to_ipv6_full.cache_clear()
+    convert_to_ipv6_short.cache_clear()
+    get_ipv6_prefix.cache_clear()
+
+
+def get_maskint_by_host_num(host_num: int) -> int:
+    """
+    根据需要的可用主机ip数量，获取能容纳这些主机的最小子网的掩码位数（ipv4），
+    /0-/30 的子网要扣除网络号及广播号，/31 按RFC3021可用2个ip（点对点链路），/32 可用1个ip，例如：
+    输入 1 输出 32
+    输入 2 输出 31
+    输入 200 输出 24
+    输入 254 输出 24
+    输入 255 输出 23
+    【输入错误会抛出Exception异常】
+    """
+    if host_num < 1 or host_num > 0xFFFFFFFF - 1:
+        raise Exception("主机ip数量应在[1-4294967294]范围内", host_num)
+    if host_num <= 2:
+        return 33 - host_num
+    return 32 - (host_num + 1).bit_length()
+
+
+def get_ipv6_prefix_len_by_host_num(host_num: int) -> int:
+    """
+    根据需要的主机ip数量，获取能容纳这些主机的最小ipv6地址块的前缀长度（不扣除任何地址），例如：
+    输入 1 输出 128
+    输入 65536 输出 112
+    输入 65537 输出 111
+    【输入错误会抛出Exception异常】
+    """
+    if host_num < 1 or host_num > 1 << 128:
+        raise Exception("主机ip数量应在[1-2^128]范围内", host_num)
+    return 128 - (host_num - 1).bit_length()
+
+
+def local__merge_free_block_list(free_block_list: list, address_bits: int) -> list:
+    """
+    将空闲地址块 [(起始数值, 前缀长度), ...] 按起始数值排序，并把互为伙伴（buddy）的相邻地址块逐级合并为更大的地址块
+    """
+    merged_block_list = []
+    for block_start, prefix_len in sorted(free_block_list):
+        merged_block_list.append((block_start, prefix_len))
+        while len(merged_block_list) >= 2:
+            left_start, left_prefix_len = merged_block_list[-2]
+            right_start, right_prefix_len = merged_block_list[-1]
+            if left_prefix_len != right_prefix_len or left_prefix_len == 0:
+                break
+            block_size = 1 << (address_bits - left_prefix_len)
+            # 伙伴：大小相同、相邻，且左块按2倍大小对齐
+            if left_start + block_size != right_start or left_start & (block_size << 1) - 1 != 0:
+                break
+            merged_block_list[-2:] = [(left_start, left_prefix_len - 1)]
+    return merged_block_list
+
+
+def vlsm_allocate_int(parent_start: int, parent_prefix_len: int, address_bits: int, prefix_len_list: list) -> tuple:
+    """
+    VLSM伙伴（buddy）分配器，只做整数运算，不逐个枚举主机ip，/8的ipv4或/32的ipv6父地址块也能很快规划完
+    parent_start 为父地址块的网段数值，parent_prefix_len 为父地址块的前缀长度，address_bits 为地址位数（ipv4为32，ipv6为128）
+    prefix_len_list 为每个子网需要的前缀长度，
+    返回二元组 (分配结果列表, 剩余空闲地址块列表):
+        分配结果列表与 prefix_len_list 一一对应，每项为分到的子网网段数值，父地址块空间不足时为 -1
+        剩余空闲地址块列表为 [(起始数值, 前缀长度), ...]，已按起始数值排序，伙伴地址块已合并
+    ★按前缀长度由小到大（子网由大到小）的顺序分配，每次都从能容纳它的最小空闲块中取地址最小的一块，
+    多余的部分对半拆分放回空闲链表，这样各子网紧密排列，只要总大小不超过父地址块就一定能全部分配成功
+    【输入错误会抛出Exception异常】
+    """
+    if parent_prefix_len < 0 or parent_prefix_len > address_bits:
+        raise Exception("父地址块前缀长度应在[0-地址位数]范围内", parent_prefix_len)
+    if parent_start & ((1 << (address_bits - parent_prefix_len)) - 1) != 0:
+        raise Exception("父地址块网段数值的主机位不为0", parent_start)
+    # free_start_list_list[前缀长度] 为该长度的空闲块起始数值列表，按最大子网优先分配时每个长度最多只会剩1块
+    free_start_list_list = [[] for _ in range(address_bits + 1)]
+    free_start_list_list[parent_prefix_len].append(parent_start)
+    allocated_start_list = [-1] * len(prefix_len_list)
+    for index in sorted(range(len(prefix_len_list)), key=lambda i: prefix_len_list[i]):
+        prefix_len = prefix_len_list[index]
+        if prefix_len < parent_prefix_len or prefix_len > address_bits:
+            continue  # 比父地址块还大，或前缀长度不合法，无法分配
+        # 找能容纳它的最小空闲块（前缀长度最大的那一级）
+        free_prefix_len = prefix_len
+        while free_prefix_len >= parent_prefix_len and len(free_start_list_list[free_prefix_len]) == 0:
+            free_prefix_len -= 1
+        if free_prefix_len < parent_prefix_len:
+            continue  # 空间不足
+        free_start_list = free_start_list_list[free_prefix_len]
+        block_start = min(free_start_list)
+        free_start_list.remove(block_start)
+        # 逐级对半拆分，左半继续拆，右半放回空闲链表
+        while free_prefix_len < prefix_len:
+            free_prefix_len += 1
+            free_start_list_list[free_prefix_len].append(block_start + (1 << (address_bits - free_prefix_len)))
+        allocated_start_list[index] = block_start
+    free_block_list = [(block_start, prefix_len) for prefix_len, free_start_list in enumerate(free_start_list_list)
+                       for block_start in free_start_list]
+    return allocated_start_list, local__merge_free_block_list(free_block_list, address_bits)
+
+
+def vlsm_allocate(parent_cidr: str, host_num_list: list) -> tuple:
+    """
+    ipv4子网规划（VLSM），在父地址块内为每个主机数量需求分配一个最小的子网，返回二元组 (分配到的cidr列表, 剩余空闲cidr列表)
+    分配到的cidr列表与 host_num_list 一一对应，空间不足时该项为 ""，例如：
+    输入 "10.0.0.0/24", [100, 50, 20, 2]
+    输出 (["10.0.0.0/25", "10.0.0.128/26", "10.0.0.192/27", "10.0.0.224/31"], ["10.0.0.226/31", "10.0.0.228/30", "10.0.0.232/29", "10.0.0.240/28"])
+    【输入错误会抛出Exception异常】
+    """
+    is_cidr, parent_netseg_int, parent_maskint = parse_cidr(parent_cidr)
+    if not is_cidr:
+        raise Exception("不是正确的cidr,E1", parent_cidr)
+    maskint_list = [get_maskint_by_host_num(host_num) for host_num in host_num_list]
+    allocated_start_list, free_block_list = vlsm_allocate_int(parent_netseg_int, parent_maskint, 32, maskint_list)
+    allocated_cidr_list = ["" if netseg_int < 0 else int32_to_ip(netseg_int) + "/" + str(maskint)
+                           for netseg_int, maskint in zip(allocated_start_list, maskint_list)]
+    free_cidr_list = [int32_to_ip(netseg_int) + "/" + str(maskint) for netseg_int, maskint in free_block_list]
+    return allocated_cidr_list, free_cidr_list
+
+
+def vlsm_allocate_ipv6(parent_cidrv6: str, host_num_list: list) -> tuple:
+    """
+    ipv6子网规划，在父地址块内为每个主机数量需求分配一个最小的地址块，返回二元组 (分配到的cidrv6列表, 剩余空闲cidrv6列表)
+    分配到的cidrv6列表与 host_num_list 一一对应，空间不足时该项为 ""，
+    如每个站点分配/48，主机数量填 2**80 即可，例如：
+    输入 "FD00::/32", [2**80, 2**80, 2**64]
+    输出 (["FD00::/48", "FD00:0:1::/48", "FD00:0:2::/64"], ["FD00:0:2:1::/64", ..., "FD00:0:3::/48", ..., "FD00:0:8000::/33"])
+    【输入错误会抛出Exception异常】
+    """
+    is_ipv6_with_len, ipv6_int, ipv6_prefix_len = parse_ipv6_with_prefix_len(parent_cidrv6)
+    if not is_ipv6_with_len:
+        raise Exception("不是正确的ipv6地址块,E1", parent_cidrv6)
+    prefix_len_list = [get_ipv6_prefix_len_by_host_num(host_num) for host_num in host_num_list]
+    host_mask = (1 << (128 - ipv6_prefix_len)) - 1
+    allocated_start_list, free_block_list = vlsm_allocate_int(ipv6_int & ~host_mask, ipv6_prefix_len, 128, prefix_len_list)
+    allocated_cidrv6_list = ["" if prefix_int < 0 else int128_to_ipv6_short(prefix_int) + "/" + str(prefix_len)
+                             for prefix_int, prefix_len in zip(allocated_start_list, prefix_len_list)]
+    free_cidrv6_list = [int128_to_ipv6_short(prefix_int) + "/" + str(prefix_len) for prefix_int, prefix_len in free_block_list]
+    return allocated_cidrv6_list, free_cidrv6_list
+
+
+def range_to_cidr_int_list(start_int: int, end_int: int, address_bits: int) -> list:
+    """
+    把地址范围 [start_int, end_int] 拆分为最少的cidr地址块，返回 [(网段数值, 前缀长度), ...]，按网段数值排序，
+    address_bits 为地址位数（ipv4为32，ipv6为128），例如（ipv4）：
+    输入 10.0.0.1的数值, 10.0.0.6的数值, 32  输出 [(10.0.0.1, 32), (10.0.0.2, 31), (10.0.0.4, 31), (10.0.0.6, 32)]
+    【输入错误会抛出Exception异常】
+    """
+    if start_int < 0 or end_int >= 1 << address_bits or start_int > end_int:
+        raise Exception("地址范围不正确", start_int, end_int)
+    cidr_int_list = []
+    while start_int <= end_int:
+        # 块大小受起始地址的对齐（最低位的1）及剩余长度两者限制
+        block_bits = (start_int & -start_int).bit_length() - 1 if start_int != 0 else address_bits
+        block_bits = min(block_bits, (end_int - start_int + 1).bit_length() - 1)
+        cidr_int_list.append((start_int, address_bits - block_bits))
+        start_int += 1 << block_bits
+    return cidr_int_list
+
+
+def get_child_prefix_num(prefix_len: int, child_prefix_len: int) -> int:
+    """
+    返回地址块按 child_prefix_len 划分的子地址块数量，例如：
+    输入 48, 64  输出 65536 ，1个/48可划分为2^16个/64
+    【输入错误会抛出Exception异常】
+    """
+    if child_prefix_len < prefix_len:
+        raise Exception("子地址块的前缀长度不能小于父地址块的前缀长度", prefix_len, child_prefix_len)
+    return 1 << (child_prefix_len - prefix_len)
+
+
+def get_next_prefix_int(prefix_int: int, prefix_len: int, address_bits=128) -> int:
+    """
+    返回同样大小的下一个地址块的网段数值（prefix_int的主机位会先清0），address_bits 为地址位数（ipv4为32，ipv6为128），例如（ipv6）：
+    输入 FD00::的数值, 64  输出 FD00:0:0:1::的数值
+    【输入错误或已是最后一个地址块时会抛出Exception异常】
+    """
+    if prefix_len < 0 or prefix_len > address_bits:
+        raise Exception("前缀长度应在[0-地址位数]范围内", prefix_len)
+    block_size = 1 << (address_bits - prefix_len)
+    next_prefix_int = (prefix_int & -block_size) + block_size
+    if next_prefix_int >= 1 << address_bits:
+        raise Exception("已是最后一个地址块", prefix_int, prefix_len)
+    return next_prefix_int
+
+
+def get_previous_prefix_int(prefix_int: int, prefix_len: int, address_bits=128) -> int:
+    """
+    返回同样大小的上一个地址块的网段数值（prefix_int的主机位会先清0），例如（ipv6）：
+    输入 FD00:0:0:1::的数值, 64  输出 FD00::的数值
+    【输入错误或已是第一个地址块时会抛出Exception异常】
+    """
+    if prefix_len < 0 or prefix_len > address_bits:
+        raise Exception("前缀长度应在[0-地址位数]范围内", prefix_len)
+    block_size = 1 << (address_bits - prefix_len)
+    previous_prefix_int = (prefix_int & -block_size) - block_size
+    if previous_prefix_int < 0:
+        raise Exception("已是第一个地址块", prefix_int, prefix_len)
+    return previous_prefix_int
+
+
+def get_nth_child_prefix_int(prefix_int: int, prefix_len: int, child_prefix_len: int, index: int, address_bits=128) -> int:
+    """
+    返回地址块的第index个（从0开始）子地址块的网段数值，直接用移位计算，不逐个枚举，例如（ipv6）：
+    输入 FD00::的数值, 48, 64, 255  输出 FD00:0:0:FF::的数值
+    【输入错误会抛出Exception异常】
+    """
+    if index < 0 or index >= get_child_prefix_num(prefix_len, child_prefix_len) or child_prefix_len > address_bits:
+        raise Exception("子地址块序号超出范围", index)
+    return (prefix_int & -(1 << (address_bits - prefix_len))) | index << (address_bits - child_prefix_len)
+
+
+def get_child_prefix_index(prefix_len: int, child_prefix_len: int, ip_int: int, address_bits=128) -> int:
+    """
+    返回ip_int落在其所属 /prefix_len 地址块的第几个（从0开始）/child_prefix_len 子地址块中
+    【输入错误会抛出Exception异常】
+    """
+    child_prefix_num = get_child_prefix_num(prefix_len, child_prefix_len)
+    return (ip_int >> (address_bits - child_prefix_len)) & (child_prefix_num - 1)
+
+
+def iter_child_prefix_int(prefix_int: int, prefix_len: int, child_prefix_len: int, start_index=0, count=None, address_bits=128):
+    """
+    从第start_index个子地址块开始，按需逐个产生子地址块的网段数值，最多count个（None表示直到最后一个），
+    内存占用为O(1)，/32划分为/64时也可以直接翻到任意位置
+    【输入错误会抛出Exception异常】
+    """
+    child_prefix_num = get_child_prefix_num(prefix_len, child_prefix_len)
+    end_index = child_prefix_num if count is None else min(child_prefix_num, start_index + count)
+    if start_index >= end_index:
+        return
+    child_size = 1 << (address_bits - child_prefix_len)
+    child_prefix_int = get_nth_child_prefix_int(prefix_int, prefix_len, child_prefix_len, start_index, address_bits)
+    for _ in range(end_index - start_index):
+        yield child_prefix_int
+        child_prefix_int += child_size
+
+
+def local__classify_interval_pair(former: tuple, latter: tuple) -> tuple:
+    """
+    对两个有交集的地址范围 (起始数值, 结束数值, 标签) 分类，返回冲突事件 (类型, 地址范围a, 地址范围b)，
+    完全相同为 duplicate，一个包含另一个为 contain（a为父，b为子），否则为 overlap
+    """
+    if former[0] == latter[0] and former[1] == latter[1]:
+        return "duplicate", former, latter
+    if former[0] <= latter[0] and latter[1] <= former[1]:
+        return "contain", former, latter
+    if latter[0] <= former[0] and former[1] <= latter[1]:
+        return "contain", latter, former
+    return "overlap", former, latter
+
+
+def local__iter_heap_end_below(active_heap: list, end_limit: int):
+    """
+    按堆的结构深度优先遍历，产生活动集中结束数值小于 end_limit 的项，子节点的结束数值不小于父节点，
+    遇到不小于 end_limit 的节点即整棵剪掉，耗时与产生的项数成正比
+    """
+    index_stack = [0] if len(active_heap) != 0 else []
+    while len(index_stack) != 0:
+        index = index_stack.pop()
+        if active_heap[index][0] >= end_limit:
+            continue
+        yield active_heap[index]
+        for child_index in (2 * index + 1, 2 * index + 2):
+            if child_index < len(active_heap):
+                index_stack.append(child_index)
+
+
+def iter_interval_conflict(sorted_interval_iter):
+    """
+    扫描线冲突检测，流式处理，输入为按 (起始数值, -结束数值) 排序的地址范围 (起始数值, 结束数值, 标签)，逐个产生冲突事件:
+        ("duplicate", a, b)      a与b完全相同
+        ("contain", a, b)        a包含b，a为包含b的最内层地址范围，沿着各事件的父子关系即可得到完整的包含链
+        ("overlap", a, b)        a与b部分重叠
+        ("gap", 起始数值, 结束数值) 已扫描过的地址范围之间的空隙
+    ★按排序顺序，之前的地址范围起始数值都不大于当前的，因此：
+    结束数值不小于当前结束数值的，都包含当前地址范围（或与之相同），其中最后扫描到的就是最内层的父地址范围；
+    结束数值落在 [当前起始数值, 当前结束数值) 内的，都与当前地址范围部分重叠
+    父地址范围用结束数值单调不增的栈二分查找，部分重叠的在按结束数值的最小堆（活动集）中剪枝遍历，不必访问每一个祖先，
+    总耗时为 O(n log n + 冲突事件数)，各地址范围层层嵌套时也一样
+    【输入未按顺序排列会抛出Exception异常】
+    """
+    active_heap = []  # 与当前地址范围仍可能有交集的，每项为 (结束数值, 序号, 地址范围)，序号用于结束数值相同时比较
+    # 候选父地址范围栈：从栈底到栈顶按扫描顺序，结束数值单调不增，被后扫描且结束数值更大的挡住的不会再成为父地址范围
+    parent_stack = []
+    parent_neg_end_list = []  # 与 parent_stack 一一对应的 -结束数值，单调不减，用于二分查找
+    covered_end = -1  # 已扫描过的地址范围的最大结束数值
+    last_key = None
+    for sequence, interval in enumerate(sorted_interval_iter):
+        start_int, end_int = interval[0], interval[1]
+        if start_int > end_int:
+            raise Exception("地址范围的结束值不能小于起始值", interval)
+        key = (start_int, -end_int)
+        if last_key is not None and key < last_key:
+            raise Exception("地址范围未按 (起始数值, -结束数值) 排序", interval)
+        last_key = key
+        while len(active_heap) != 0 and active_heap[0][0] < start_int:
+            heapq.heappop(active_heap)
+        if covered_end >= 0 and start_int > covered_end + 1:
+            yield "gap", covered_end + 1, start_int - 1
+        for _, _, active_interval in local__iter_heap_end_below(active_heap, end_int):
+            yield local__classify_interval_pair(active_interval, interval)
+        # 结束数值不小于当前的候选中最靠近栈顶的，跳过与当前完全相同的（它们一定紧挨着排在最后）
+        parent_index = bisect.bisect_right(parent_neg_end_list, -end_int) - 1
+        while parent_index >= 0 and parent_stack[parent_index][0] == start_int and parent_stack[parent_index][1] == end_int:
+            yield "duplicate", parent_stack[parent_index], interval
+            parent_index -= 1
+        if parent_index >= 0:
+            yield "contain", parent_stack[parent_index], interval
+        heapq.heappush(active_heap, (end_int, sequence, interval))
+        while len(parent_neg_end_list) != 0 and parent_neg_end_list[-1] > -end_int:
+            parent_stack.pop()
+            parent_neg_end_list.pop()
+        parent_stack.append(interval)
+        parent_neg_end_list.append(-end_int)
+        covered_end = max(covered_end, end_int)
+
+
+def local__collect_interval_conflict(sorted_interval_list: list) -> dict:
+    result = {"duplicate_list": [], "contain_list": [], "overlap_list": [], "gap_list": []}
+    for event in iter_interval_conflict(sorted_interval_list):
+        result[event[0] + "_list"].append(event[1:])
+    return result
+
+
+def find_interval_conflict(interval_list: list) -> dict:
+    """
+    检查地址范围清单 [(起始数值, 结束数值, 标签), ...] 的冲突，先排序再做扫描线检测，返回:
+    {"duplicate_list": [(a, b), ...], "contain_list": [(父, 子), ...], "overlap_list": [(a, b), ...], "gap_list": [(起始数值, 结束数值), ...]}
+    【输入错误会抛出Exception异常】
+    """
+    return local__collect_interval_conflict(sorted(interval_list, key=lambda interval: (interval[0], -interval[1])))
+
+
+def find_cidr_conflict(cidr_list: list) -> dict:
+    """
+    检查cidr清单的冲突（ipv4与ipv6可混在一起，分别检测），返回格式同 find_interval_conflict() ，地址范围的标签为原cidr文本，
+    空隙为 (起始ip, 结束ip)，例如：
+    输入 ["10.0.0.0/16", "10.0.1.0/24", "10.0.1.0/24", "10.0.4.0/24"]
+    输出 {"duplicate_list": [("10.0.1.0/24", "10.0.1.0/24")], "contain_list": [("10.0.0.0/16", "10.0.1.0/24"), ...],
+         "overlap_list": [], "gap_list": []}
+    ★各项只输出cidr文本，需要数值时请直接调用 find_interval_conflict()
+    【输入错误会抛出Exception异常】
+    """
+    ipv4_interval_list = []
+    ipv6_interval_list = []
+    for cidr in cidr_list:
+        is_ipv4, ip_int, prefix_len = parse_ip_with_maskint(cidr)
+        if is_ipv4:
+            host_mask = (1 << (32 - prefix_len)) - 1
+            ipv4_interval_list.append((ip_int & ~host_mask, ip_int | host_mask, cidr))
+            continue
+        is_ipv6, ip_int, prefix_len = parse_ipv6_with_prefix_len(cidr)
+        if not is_ipv6:
+            raise Exception("不是正确的cidr或ipv6地址块", cidr)
+        host_mask = (1 << (128 - prefix_len)) - 1
+        ipv6_interval_list.append((ip_int & ~host_mask, ip_int | host_mask, cidr))
+    result = {"duplicate_list": [], "contain_list": [], "overlap_list": [], "gap_list": []}
+    for interval_list, int_to_ip_func in ((ipv4_interval_list, int32_to_ip), (ipv6_interval_list, int128_to_ipv6_short)):
+        for key, item_list in find_interval_conflict(interval_list).items():
+            if key == "gap_list":
+                result[key].extend((int_to_ip_func(start_int), int_to_ip_func(end_int)) for start_int, end_int in item_list)
+            else:
+                result[key].extend((former[2], latter[2]) for former, latter in item_list)
+    return result
+
+
+class IntervalTreeNode:
+    """
+    IntervalConflictDetector 的树节点，树为treap：按 (起始数值, -结束数值, 序号) 有序的二叉搜索树，同时按随机优先级成堆，
+    期望高度为O(log n)；max_end 为以本节点为根的子树中最大的结束数值，查询时据此整棵剪掉不可能有交集的子树
+    """
+    __slots__ = ("interval", "key", "priority", "left", "right", "max_end")
+
+    def __init__(self, interval: tuple, sequence: int):
+        self.interval = interval  # (起始数值, 结束数值, 标签)
+        self.key = (interval[0], -interval[1], sequence)  # 起始数值相同时大的地址范围在前，完全相同时先加入的在前
+        self.priority = random.random()
+        self.left = None
+        self.right = None
+        self.max_end = interval[1]
+
+    def update_max_end(self):
+        max_end = self.interval[1]
+        if self.left is not None and self.left.max_end > max_end:
+            max_end = self.left.max_end
+        if self.right is not None and self.right.max_end > max_end:
+            max_end = self.right.max_end
+        self.max_end = max_end
+
+
+def local__interval_tree_insert(node, new_node: IntervalTreeNode) -> IntervalTreeNode:
+    """
+    把 new_node 插入以 node 为根的treap，沿途更新 max_end ，返回新的根
+    """
+    if node is None:
+        return new_node
+    if new_node.key < node.key:
+        node.left = local__interval_tree_insert(node.left, new_node)
+        if node.left.priority > node.priority:  # 右旋
+            child = node.left
+            node.left = child.right
+            node.update_max_end()
+            child.right = node
+            node = child
+    else:
+        node.right = local__interval_tree_insert(node.right, new_node)
+        if node.right.priority > node.priority:  # 左旋
+            child = node.right
+            node.right = child.left
+            node.update_max_end()
+            child.left = node
+            node = child
+    node.update_max_end()
+    return node
+
+
+def local__interval_tree_collect_overlap(node, start_int: int, end_int: int, event_interval: tuple, event_list: list):
+    """
+    按顺序（中序）收集与 [start_int, end_int] 有交集的节点，生成冲突事件，耗时为 O(log n + 有交集的项数*log n)
+    """
+    if node is None or node.max_end < start_int:
+        return  # 子树内所有地址范围都在新地址范围之前结束
+    local__interval_tree_collect_overlap(node.left, start_int, end_int, event_interval, event_list)
+    if node.interval[0] > end_int:
+        return  # 本节点及右子树都在新地址范围之后开始
+    if node.interval[1] >= start_int:
+        event_list.append(local__classify_interval_pair(node.interval, event_interval))
+    local__interval_tree_collect_overlap(node.right, start_int, end_int, event_interval, event_list)
+
+
+class IntervalConflictDetector:
+    """
+    增量冲突检测，地址范围保存在按最大结束数值增强的平衡二叉搜索树（treap）中，
+    新增或检查1个分配时只访问与它有交集的部分，耗时为 O(log n + 有交集的项数*log n)，不必整体重新扫描
+    用法:
+    detector = IntervalConflictDetector(interval_list)
+    detector.add(start_int, end_int, "site-a vlan10")  # 返回新地址范围与已有地址范围的冲突事件列表，并将其加入清单
+    detector.check()                                   # 对整个清单做一次扫描线检测，返回格式同 find_interval_conflict()
+    ★add() 不报告空隙，空隙需要全局信息，请用 check()
+    """
+
+    def __init__(self, interval_list=None):
+        self.root = None  # 树根，IntervalTreeNode
+        self.interval_num = 0  # 已加入的地址范围数量，同时作为节点序号
+        sorted_interval_list = sorted(interval_list if interval_list is not None else [],
+                                      key=lambda interval: (interval[0], -interval[1]))
+        # 已排好序，用栈一次性建成笛卡尔树（treap），O(n)
+        stack = []
+        for interval in sorted_interval_list:
+            if interval[0] > interval[1]:
+                raise Exception("地址范围的结束值不能小于起始值", interval)
+            node = IntervalTreeNode(interval, self.interval_num)
+            self.interval_num += 1
+            last_popped = None
+            while len(stack) != 0 and stack[-1].priority < node.priority:
+                last_popped = stack.pop()
+                last_popped.update_max_end()  # 弹出后其子树不再变化
+            node.left = last_popped
+            if len(stack) != 0:
+                stack[-1].right = node
+            stack.append(node)
+        if len(stack) != 0:
+            self.root = stack[0]
+        while len(stack) != 0:
+            stack.pop().update_max_end()  # 栈中为最右链，由下往上更新
+
+    def __len__(self) -> int:
+        return self.interval_num
+
+    def find_conflict(self, start_int: int, end_int: int, tag=None) -> list:
+        """
+        返回地址范围 [start_int, end_int] 与清单中已有地址范围的冲突事件列表（不加入清单），按已有地址范围的顺序排列，
+        事件格式同 iter_interval_conflict()：新地址范围被已有地址范围包含时，与扫描线检测一样只报告最内层的父地址范围；
+        新地址范围包含已有地址范围时，每个被包含的都报告1个 ("contain", 新地址范围, 已有地址范围)
+        【输入错误会抛出Exception异常】
+        """
+        if start_int > end_int:
+            raise Exception("地址范围的结束值不能小于起始值", start_int, end_int)
+        interval = (start_int, end_int, tag)
+        event_list = []
+        local__interval_tree_collect_overlap(self.root, start_int, end_int, interval, event_list)
+        # 包含新地址范围的按顺序排列，最后一个即最内层的父地址范围
+        parent_event_index_list = [index for index, event in enumerate(event_list)
+                                   if event[0] == "contain" and event[2] is interval]
+        if len(parent_event_index_list) > 1:
+            outer_parent_event_index_set = set(parent_event_index_list[:-1])
+            event_list = [event for index, event in enumerate(event_list) if index not in outer_parent_event_index_set]
+        return event_list
+
+    def add(self, start_int: int, end_int: int, tag=None) -> list:
+        """
+        新增1个地址范围，返回它与清单中已有地址范围的冲突事件列表
+        【输入错误会抛出Exception异常】
+        """
+        event_list = self.find_conflict(start_int, end_int, tag)
+        self.root = local__interval_tree_insert(self.root, IntervalTreeNode((start_int, end_int, tag), self.interval_num))
+        self.interval_num += 1
+        return event_list
+
+    def get_interval_list(self) -> list:
+        """
+        按 (起始数值, -结束数值) 的顺序返回所有地址范围
+        """
+        interval_list = []
+        stack = []
+        node = self.root
+        while node is not None or len(stack) != 0:
+            while node is not None:
+                stack.append(node)
+                node = node.left
+            node = stack.pop()
+            interval_list.append(node.interval)
+            node = node.right
+        return interval_list
+
+    def check(self) -> dict:
+        return local__collect_interval_conflict(self.get_interval_list())
+
+
+def local__is_prime(number: int) -> bool:
+    """
+    确定性Miller-Rabin素数判断，对 2^64 以内的数结果准确
+    """
+    if number < 2:
+        return False
+    for small_prime in (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37):
+        if number % small_prime == 0:
+            return number == small_prime
+    odd_part = number - 1
+    shift = 0
+    while odd_part & 1 == 0:
+        odd_part >>= 1
+        shift += 1
+    for base in (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37):
+        x = pow(base, odd_part, number)
+        if x == 1 or x == number - 1:
+            continue
+        for _ in range(shift - 1):
+            x = x * x % number
+            if x == number - 1:
+                break
+        else:
+            return False
+    return True
+
+
+def local__get_prime_factor_list(number: int) -> list:
+    """
+    试除法分解质因数，返回不重复的质因数列表
+    """
+    prime_factor_list = []
+    factor = 2
+    while factor * factor <= number:
+        if number % factor == 0:
+            prime_factor_list.append(factor)
+            while number % factor == 0:
+                number //= factor
+        factor += 1 if factor == 2 else 2
+    if number > 1:
+        prime_factor_list.append(number)
+    return prime_factor_list
+
+
+def local__build_special_purpose_index(special_purpose_list: list, address_bits: int) -> tuple:
+    """
+    把可嵌套的特殊用途地址表编译为互不重叠、按起始数值排序的区间索引，每个区间取覆盖它的最长匹配地址块的分类，
+    返回三元组 (起始数值列表, 结束数值列表, 分类列表)，分类为 (类别, 说明) ，模块加载时只编译一次
+    """
+    block_list = []  # 每项为 (起始数值, 结束数值, 前缀长度, 分类)
+    for cidr, category, description in special_purpose_list:
+        if address_bits == 32:
+            is_cidr_ok, start_int, prefix_len = parse_cidr(cidr)
+        else:
+            is_cidr_ok, start_int, prefix_len = parse_ipv6_with_prefix_len(cidr)
+        if not is_cidr_ok:
+            raise Exception("特殊用途地址表中的地址块不正确", cidr)
+        block_list.append((start_int, start_int + (1 << (address_bits - prefix_len)) - 1, prefix_len, (category, description)))
+    boundary_list = sorted({block[0] for block in block_list} | {block[1] + 1 for block in block_list})
+    start_list = []
+    end_list = []
+    category_list = []
+    for index in range(len(boundary_list) - 1):
+        piece_start = boundary_list[index]
+        piece_end = boundary_list[index + 1] - 1
+        covering_block_list = [block for block in block_list if block[0] <= piece_start and piece_end <= block[1]]
+        if len(covering_block_list) == 0:
+            continue
+        category = max(covering_block_list, key=lambda block: block[2])[3]
+        if len(end_list) != 0 and end_list[-1] + 1 == piece_start and category_list[-1] == category:
+            end_list[-1] = piece_end  # 与前一区间相邻且分类相同，合并
+        else:
+            start_list.append(piece_start)
+            end_list.append(piece_end)
+            category_list.append(category)
+    return start_list, end_list, category_list
+
+
+IPV4_SPECIAL_PURPOSE_INDEX = local__build_special_purpose_index(IPV4_SPECIAL_PURPOSE_LIST, 32)
+IPV6_SPECIAL_PURPOSE_INDEX = local__build_special_purpose_index(IPV6_SPECIAL_PURPOSE_LIST, 128)
+
+
+def local__lookup_special_purpose_index(special_purpose_index: tuple, ip_int: int, default_category: tuple) -> tuple:
+    start_list, end_list, category_list = special_purpose_index
+    index = bisect.bisect_right(start_list, ip_int) - 1
+    if index >= 0 and ip_int <= end_list[index]:
+        return category_list[index]
+    return default_category
+
+
+def classify_ipv4_int(ip_int: int) -> tuple:
+    """
+    按特殊用途地址表对ipv4地址分类，二分查找，返回二元组 (类别, 说明)，例如：
+    输入 10.1.1.1的数值   输出 ("private", "私网地址（RFC1918）")
+    输入 100.64.0.1的数值 输出 ("cgnat", "运营商级NAT共享地址（RFC6598）")
+    输入 8.8.8.8的数值    输出 ("global", "公网地址")
+    """
+    return local__lookup_special_purpose_index(IPV4_SPECIAL_PURPOSE_INDEX, ip_int, IPV4_GLOBAL_CATEGORY)
+
+
+def classify_ipv6_int(ipv6_int: int) -> tuple:
+    """
+    按特殊用途地址表对ipv6地址分类，二分查找，返回二元组 (类别, 说明)，例如：
+    输入 FD00::1的数值 输出 ("ula", "唯一本地地址 ULA（RFC4193）")
+    输入 2002::1的数值 输出 ("6to4", "6to4（RFC3056）")
+    """
+    return local__lookup_special_purpose_index(IPV6_SPECIAL_PURPOSE_INDEX, ipv6_int, IPV6_UNASSIGNED_CATEGORY)
+
+
+def classify_ip_int_list(ip_int_list: list, address_bits=32) -> list:
+    """
+    批量分类，address_bits 为32时按ipv4，为128时按ipv6，返回与 ip_int_list 一一对应的 (类别, 说明) 列表
+    """
+    if address_bits == 32:
+        start_list, end_list, category_list = IPV4_SPECIAL_PURPOSE_INDEX
+        default_category = IPV4_GLOBAL_CATEGORY
+    else:
+        start_list, end_list, category_list = IPV6_SPECIAL_PURPOSE_INDEX
+        default_category = IPV6_UNASSIGNED_CATEGORY
+    bisect_right = bisect.bisect_right
+    result_list = []
+    for ip_int in ip_int_list:
+        index = bisect_right(start_list, ip_int) - 1
+        result_list.append(category_list[index] if index >= 0 and ip_int <= end_list[index] else default_category)
+    return result_list
+
+
+def classify_ip(ip_address: str) -> tuple:
+    """
+    对ipv4或ipv6地址分类，返回二元组 (类别, 说明)，例如：
+    输入 "169.254.1.1" 输出 ("link_local", "链路本地地址（RFC3927）")
+    输入 "FE80::1"     输出 ("link_local", "链路本地地址（RFC4291）")
+    【输入错误会抛出Exception异常】
+    """
+    is_ip, ip_int = parse_ip_addr(ip_address)
+    if is_ip:
+        return classify_ipv4_int(ip_int)
+    is_ipv6, ipv6_int = parse_ipv6_addr(ip_address)
+    if is_ipv6:
+        return classify_ipv6_int(ipv6_int)
+    raise Exception("不是正确的ip地址", ip_address)
+
+
+def get_ipv4_class(ip_int: int) -> str:
+    """
+    获取ipv4地址的传统（有类）分类，按首字节判断，返回 "A" "B" "C" "D" "E" ，例如：
+    输入 10.1.1.1的数值 输出 "A"
+    输入 224.0.0.5的数值 输出 "D"
+    """
+    first_byte = ip_int >> 24
+    if first_byte < 128:
+        return "A"
+    if first_byte < 192:
+        return "B"
+    if first_byte < 224:
+        return "C"
+    if first_byte < 240:
+        return "D"
+    return "E"
+
+
+class CyclicPermutation:
+    """
+    以伪随机顺序遍历整数范围 [start_int, end_int] 内的每个数，每个数恰好出现1次（类似zmap），内存占用为O(1)
+    ★原理: 取大于范围大小n的最小素数p，及模p乘法循环群的一个随机生成元g，从随机起点x开始反复做 x = x*g mod p，
+    x会不重复地走遍 [1, p-1]，跳过大于n的值，x-1 加上 start_int 即为本次的数
+    用法:
+    permutation = CyclicPermutation.from_cidr("10.1.0.0/16", seed=1)
+    for ip_int in permutation: ...
+    中途保存 state = permutation.get_state() ，之后用 CyclicPermutation.from_state(state) 从断点继续遍历
+    """
+
+    def __init__(self, start_int=0, end_int=0, seed=None):
+        if end_int < start_int:
+            raise Exception("范围的结束值不能小于起始值", start_int, end_int)
+        self.start_int = start_int
+        self.size = end_int - start_int + 1  # 范围内数的个数n
+        if self.size > CYCLIC_PERMUTATION_SIZE_MAX:
+            raise Exception("范围过大，不支持乱序遍历", self.size)
+        rand = random.Random(seed)
+        self.prime = self.size + 1  # 大于n的最小素数p
+        while not local__is_prime(self.prime):
+            self.prime += 1
+        prime_factor_list = local__get_prime_factor_list(self.prime - 1)
+        while True:  # 随机选取生成元g：对p-1的每个质因数q，都有 g^((p-1)/q) != 1 (mod p)
+            self.generator = rand.randint(1, self.prime - 1)
+            if all(pow(self.generator, (self.prime - 1) // factor, self.prime) != 1 for factor in prime_factor_list):
+                break
+        self.current = rand.randint(1, self.prime - 1)  # 群元素x，下一个要检查的值
+        self.emitted_count = 0  # 已产生的数的个数，等于n时遍历结束
+
+    @classmethod
+    def from_cidr(cls, cidr: str, seed=None):
+        """
+        乱序遍历 ipv4地址块 内的所有ip（含网络号及广播号），产生的是ip的32bit数值
+        【输入错误会抛出Exception异常】
+        """
+        is_cidr, netseg_int, maskint = parse_cidr(cidr)
+        if not is_cidr:
+            raise Exception("不是正确的cidr,", cidr)
+        return cls(netseg_int, netseg_int + IPV4_MASKINT_TO_HOSTSEG_NUM_LIST[maskint] - 1, seed)
+
+    @classmethod
+    def from_state(cls, state: dict):
+        """
+        从 get_state() 保存的断点状态恢复，不需要重新找素数及生成元
+        """
+        permutation = cls.__new__(cls)
+        permutation.start_int = state["start_int"]
+        permutation.size = state["size"]
+        permutation.prime = state["prime"]
+        permutation.generator = state["generator"]
+        permutation.current = state["current"]
+        permutation.emitted_count = state["emitted_count"]
+        return permutation
+
+    def get_state(self) -> dict:
+        """
+        返回断点状态，都是整数，可直接保存为json
+        """
+        return {"start_int": self.start_int, "size": self.size, "prime": self.prime, "generator": self.generator,
+                "current": self.current, "emitted_count": self.emitted_count}
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> int:
+        while self.emitted_count < self.size:
+            index = self.current - 1
+            self.current = self.current * self.generator % self.prime
+            if index < self.size:
+                self.emitted_count += 1
+                return self.start_int + index
+        raise StopIteration
+
+    def __len__(self) -> int:
+        return self.size - self.emitted_count
+
+
 # #################################  end of module's function  ##############################
 if __name__ == '__main__':
     print("Hello, this is cofnet.py")
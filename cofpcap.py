@@ -0,0 +1,408 @@
+#!/usr/bin/env python3
+# coding=utf-8
+# module name: cofpcap
+# author: Cof-Lee <cof8007@gmail.com>
+# this module uses the GPL-3.0 open source protocol
+# update: 2024-11-28
+
+"""
+离线分析抓包文件（pcap/pcapng）里的icmp echo，按流（源ip-->目的ip）统计RTT及丢包，运行方式:
+python3 cofpcap.py capture.pcap                  分析抓包文件，打印每个流的统计
+python3 cofpcap.py capture.pcapng --timeout 5    echo请求超过5秒（按抓包时间）没有回包则计为丢包，默认2秒
+
+★只能抓包、不能主动探测时使用，报文头的解析与 cofping.PingOnePacket.parse_recv_packet 一致：
+echo请求与echo响应按 (源ip, 目的ip, icmp_id, icmp_sequence) 配对，
+ttl超时及终点不可达等差错报文按其带回的原数据包ip头及icmp头配对，失败原因由 cofping.PingOnePacket.generate_icmp_failed_info 给出
+★文件用mmap映射，逐个报文用 struct.unpack_from 在原地解析，不复制整个文件；
+在途的echo请求按抓包时间超时后即计为丢包并移除，所以内存占用只与流的数量及超时时间内的在途请求数有关，与文件大小无关
+★支持的链路类型: Ethernet（含VLAN标签）、Linux cooked（SLL/SLL2）、raw ip、BSD loopback
+"""
+
+import sys
+import mmap
+import struct
+import argparse
+import collections
+import cofnet
+import cofping
+
+PCAP_MAGIC_US = 0xA1B2C3D4  # pcap文件头魔数，时间戳单位为微秒
+PCAP_MAGIC_NS = 0xA1B23C4D  # pcap文件头魔数，时间戳单位为纳秒
+PCAPNG_BLOCK_TYPE_SHB = 0x0A0D0D0A  # pcapng Section Header Block
+PCAPNG_BLOCK_TYPE_IDB = 0x00000001  # pcapng Interface Description Block
+PCAPNG_BLOCK_TYPE_SPB = 0x00000003  # pcapng Simple Packet Block，没有时间戳，无法计算RTT，跳过
+PCAPNG_BLOCK_TYPE_EPB = 0x00000006  # pcapng Enhanced Packet Block
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+PCAPNG_OPTION_IF_TSRESOL = 9  # IDB选项：时间戳精度
+LINKTYPE_NULL = 0  # BSD loopback，4字节协议族（抓包主机字节序）
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_RAW_BSD = 12  # 部分BSD系统上的raw ip
+LINKTYPE_IPV4 = 228
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_LINUX_SLL2 = 276
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN_SET = {0x8100, 0x88A8, 0x9100}
+PCAP_TIMEOUT_S_DEFAULT = 2.0
+
+
+def get_ipv4_offset(buffer, offset: int, length: int, linktype: int) -> int:
+    """
+    根据链路类型跳过链路层头部，返回ipv4头在buffer中的偏移，不是ipv4报文时返回-1，本函数不会抛出异常
+    """
+    if linktype == LINKTYPE_ETHERNET:
+        ethertype_offset = offset + 12
+        end = offset + length
+        while ethertype_offset + 2 <= end:
+            ethertype = (buffer[ethertype_offset] << 8) | buffer[ethertype_offset + 1]
+            if ethertype in ETHERTYPE_VLAN_SET:
+                ethertype_offset += 4  # 跳过VLAN标签
+                continue
+            return ethertype_offset + 2 if ethertype == ETHERTYPE_IPV4 else -1
+        return -1
+    if linktype in (LINKTYPE_RAW, LINKTYPE_RAW_BSD, LINKTYPE_IPV4):
+        return offset if length >= 1 and buffer[offset] >> 4 == 4 else -1
+    if linktype == LINKTYPE_LINUX_SLL:
+        if length >= 16 and (buffer[offset + 14] << 8) | buffer[offset + 15] == ETHERTYPE_IPV4:
+            return offset + 16
+        return -1
+    if linktype == LINKTYPE_LINUX_SLL2:
+        if length >= 20 and (buffer[offset] << 8) | buffer[offset + 1] == ETHERTYPE_IPV4:
+            return offset + 20
+        return -1
+    if linktype == LINKTYPE_NULL:
+        # 协议族为抓包主机字节序，AF_INET在各系统上都是2
+        if length >= 4 and (buffer[offset] == 2 or buffer[offset + 3] == 2):
+            return offset + 4
+        return -1
+    return -1
+
+
+class PcapReader:
+    """
+    流式读取pcap/pcapng文件，用mmap映射文件，逐个报文产出 (时间戳_纳秒, 链路类型, buffer, 报文偏移, 报文抓取长度)
+    buffer为整个文件的mmap对象，调用方应就地解析，不要保存它的切片；文件格式不对时抛出异常
+    用法:
+    with PcapReader("capture.pcapng") as reader:
+        for timestamp_ns, linktype, buffer, offset, length in reader:
+            pass
+    """
+
+    def __init__(self, file_path=""):
+        self.file_path = file_path
+        self.file = None
+        self.buffer = None  # mmap对象
+        self.packet_count = 0  # 已读出的报文数
+        self.truncated_count = 0  # 文件末尾不完整的报文/块数量（抓包进程被中断时常见）
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        self.file = open(self.file_path, "rb")
+        try:
+            self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise Exception("抓包文件为空", self.file_path)
+
+    def close(self):
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __iter__(self):
+        if self.buffer is None:
+            self.open()
+        if len(self.buffer) < 24:
+            raise Exception("不是pcap/pcapng文件，文件太小", self.file_path)
+        if struct.unpack_from("<I", self.buffer, 0)[0] == PCAPNG_BLOCK_TYPE_SHB:
+            return self.iter_pcapng()
+        return self.iter_pcap()
+
+    def iter_pcap(self):
+        buffer = self.buffer
+        magic_le = struct.unpack_from("<I", buffer, 0)[0]
+        magic_be = struct.unpack_from(">I", buffer, 0)[0]
+        if magic_le in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            endian = "<"
+            magic = magic_le
+        elif magic_be in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            endian = ">"
+            magic = magic_be
+        else:
+            raise Exception("不是pcap/pcapng文件，魔数不对", hex(magic_le))
+        frac_to_ns = 1 if magic == PCAP_MAGIC_NS else 1000
+        linktype = struct.unpack_from(endian + "I", buffer, 20)[0] & 0x0FFFFFFF  # 高4位可能是FCS长度等标志
+        record_header = struct.Struct(endian + "IIII")
+        offset = 24
+        file_size = len(buffer)
+        while offset + 16 <= file_size:
+            ts_sec, ts_frac, incl_len, orig_len = record_header.unpack_from(buffer, offset)
+            offset += 16
+            if offset + incl_len > file_size:
+                self.truncated_count += 1
+                return
+            self.packet_count += 1
+            yield ts_sec * 1000000000 + ts_frac * frac_to_ns, linktype, buffer, offset, incl_len
+            offset += incl_len
+        if offset != file_size:
+            self.truncated_count += 1
+
+    def iter_pcapng(self):
+        buffer = self.buffer
+        file_size = len(buffer)
+        offset = 0
+        endian = "<"
+        interface_list = []  # 当前section的接口列表，每项为 (链路类型, 每秒的时间戳单位数)
+        while offset + 12 <= file_size:
+            block_type = struct.unpack_from(endian + "I", buffer, offset)[0]
+            if block_type == PCAPNG_BLOCK_TYPE_SHB:  # 每个section可以有不同的字节序，先按字节序魔数确定
+                if struct.unpack_from("<I", buffer, offset + 8)[0] == PCAPNG_BYTE_ORDER_MAGIC:
+                    endian = "<"
+                elif struct.unpack_from(">I", buffer, offset + 8)[0] == PCAPNG_BYTE_ORDER_MAGIC:
+                    endian = ">"
+                else:
+                    raise Exception("pcapng字节序魔数不对", offset)
+                interface_list = []
+            block_len = struct.unpack_from(endian + "I", buffer, offset + 4)[0]
+            if block_len < 12 or block_len % 4 != 0:
+                raise Exception("pcapng块长度不对", offset, block_len)
+            if offset + block_len > file_size:
+                self.truncated_count += 1
+                return
+            if block_type == PCAPNG_BLOCK_TYPE_IDB:
+                linktype = struct.unpack_from(endian + "H", buffer, offset + 8)[0]
+                interface_list.append((linktype, self.parse_if_tsresol(offset + 16, offset + block_len - 4, endian)))
+            elif block_type == PCAPNG_BLOCK_TYPE_EPB:
+                interface_id, ts_high, ts_low, cap_len = struct.unpack_from(endian + "IIII", buffer, offset + 8)
+                if interface_id < len(interface_list) and 28 + cap_len <= block_len:
+                    linktype, units_per_second = interface_list[interface_id]
+                    ts_units = (ts_high << 32) | ts_low
+                    if units_per_second == 1000000:
+                        timestamp_ns = ts_units * 1000
+                    else:
+                        timestamp_ns = ts_units * 1000000000 // units_per_second
+                    self.packet_count += 1
+                    yield timestamp_ns, linktype, buffer, offset + 28, cap_len
+            offset += block_len
+
+    def parse_if_tsresol(self, option_offset: int, option_end: int, endian: str) -> int:
+        """
+        从IDB的选项里取出时间戳精度，返回每秒的时间戳单位数，没有此选项时默认为微秒
+        """
+        buffer = self.buffer
+        while option_offset + 4 <= option_end:
+            option_code, option_len = struct.unpack_from(endian + "HH", buffer, option_offset)
+            if option_code == 0:  # opt_endofopt
+                break
+            if option_code == PCAPNG_OPTION_IF_TSRESOL and option_len >= 1:
+                tsresol = buffer[option_offset + 4]
+                if tsresol & 0x80:
+                    return 1 << (tsresol & 0x7F)
+                return 10 ** tsresol
+            option_offset += 4 + (option_len + 3) // 4 * 4
+        return 1000000
+
+
+class IcmpFlowStats:
+    """
+    一个流（源ip-->目的ip）的echo统计，源ip为发出echo请求的一方
+    """
+
+    def __init__(self, source_ip="", destination_ip=""):
+        self.source_ip = source_ip
+        self.destination_ip = destination_ip
+        self.request_count = 0  # echo请求数（重传的相同id及sequence也各计1次）
+        self.respond_count = 0  # 收到echo响应的请求数
+        self.error_count = 0  # 收到差错报文的请求数
+        self.lost_count = 0  # 超时仍没有任何回包的请求数
+        self.duplicate_count = 0  # 已配对的请求又收到的回包数
+        self.rtt_ms_min = 0.0
+        self.rtt_ms_max = 0.0
+        self.rtt_ms_sum = 0.0
+        self.failed_info_count_dict = {}  # key为 generate_icmp_failed_info() 给出的失败原因，value为次数
+        self.error_source_ip_set = set()  # 回复差错报文的ip（路由器或目标主机）
+
+    def add_rtt(self, rtt_ms: float):
+        if self.respond_count == 0:
+            self.rtt_ms_min = self.rtt_ms_max = rtt_ms
+        else:
+            self.rtt_ms_min = min(self.rtt_ms_min, rtt_ms)
+            self.rtt_ms_max = max(self.rtt_ms_max, rtt_ms)
+        self.rtt_ms_sum += rtt_ms
+        self.respond_count += 1
+
+    @property
+    def rtt_ms_avg(self) -> float:
+        return self.rtt_ms_sum / self.respond_count if self.respond_count != 0 else 0.0
+
+    @property
+    def loss_rate(self) -> float:
+        """
+        没有收到echo响应的请求（丢包及差错报文）所占比例
+        """
+        finished_count = self.respond_count + self.error_count + self.lost_count
+        return 1 - self.respond_count / finished_count if finished_count != 0 else 0.0
+
+
+class IcmpPcapAnalyzer:
+    """
+    分析抓包文件中的icmp echo，结果在 self.flow_stats_dict 中，key为 (源ip, 目的ip)，value为 IcmpFlowStats
+    用法:
+    analyzer = IcmpPcapAnalyzer(file_path="capture.pcapng", timeout=2.0)
+    analyzer.start()  # 阻塞型
+    print(analyzer.format_report())
+    """
+
+    def __init__(self, file_path="", timeout=PCAP_TIMEOUT_S_DEFAULT):
+        self.file_path = file_path
+        self.timeout = timeout  # echo请求超过此时长（按抓包时间）没有回包则计为丢包，单位：秒
+        self.flow_stats_dict = {}
+        self.packet_count = 0  # 抓包文件中的报文总数
+        self.icmp_packet_count = 0  # 其中的ipv4 icmp报文数
+        self.unmatched_respond_count = 0  # 找不到对应请求的回包数（如请求不在抓包范围内）
+        self.truncated_count = 0
+        self.pending_request_dict = collections.OrderedDict()  # 在途的echo请求，按抓包时间先后排列，key为配对键，value为 (发包时刻_纳秒, 流统计)
+        self.finished_key_dict = collections.OrderedDict()  # 已配对过的请求，用于识别重复回包，同样按时间淘汰，value为 (配对时刻_纳秒, 流统计)
+
+    def start(self):
+        self.flow_stats_dict = {}
+        self.packet_count = 0
+        self.icmp_packet_count = 0
+        self.unmatched_respond_count = 0
+        self.pending_request_dict = collections.OrderedDict()
+        self.finished_key_dict = collections.OrderedDict()
+        timeout_ns = int(self.timeout * 1000000000)
+        ipv4_header_struct = struct.Struct("!BBHHHBBHII")
+        icmp_header_struct = struct.Struct("!BBHHH")
+        with PcapReader(self.file_path) as reader:
+            for timestamp_ns, linktype, buffer, offset, length in reader:
+                self.expire_pending_request(timestamp_ns - timeout_ns)
+                ipv4_offset = get_ipv4_offset(buffer, offset, length, linktype)
+                end = offset + length
+                if ipv4_offset < 0 or ipv4_offset + 20 > end:
+                    continue
+                version_ihl, _, _, _, flags_fragment, ttl, protocol, _, source_ip_int, destination_ip_int = \
+                    ipv4_header_struct.unpack_from(buffer, ipv4_offset)
+                if protocol != 1 or flags_fragment & 0x1FFF != 0:  # 不是icmp，或不是首个分片（没有icmp头）
+                    continue
+                icmp_offset = ipv4_offset + (version_ihl & 0x0F) * 4
+                if icmp_offset + 8 > end:
+                    continue
+                self.icmp_packet_count += 1
+                icmp_type, icmp_code, _, icmp_id, icmp_sequence = icmp_header_struct.unpack_from(buffer, icmp_offset)
+                if icmp_type == cofping.ICMP_TYPE_8_ECHO_REQUEST:
+                    self.handle_request(timestamp_ns, (source_ip_int, destination_ip_int, icmp_id, icmp_sequence))
+                elif icmp_type == cofping.ICMP_TYPE_0_ECHO_RESPOND:
+                    self.handle_respond(timestamp_ns, (destination_ip_int, source_ip_int, icmp_id, icmp_sequence), "", 0)
+                elif icmp_type in (cofping.ICMP_TYPE_11_TIME_TO_LIVE_EXCEEDED, cofping.ICMP_TYPE_3_DESTINATION_UNREACHABLE):
+                    # 差错报文带回原数据包的ip头及其后的8字节（即icmp头），按原数据包的 源ip、目的ip、id、sequence 配对
+                    carrier_ipv4_offset = icmp_offset + 8
+                    if carrier_ipv4_offset + 20 > end:
+                        continue
+                    carrier_version_ihl = buffer[carrier_ipv4_offset]
+                    carrier_struct_tuple = ipv4_header_struct.unpack_from(buffer, carrier_ipv4_offset)
+                    carrier_icmp_offset = carrier_ipv4_offset + (carrier_version_ihl & 0x0F) * 4
+                    if carrier_icmp_offset + 8 > end or buffer[carrier_icmp_offset] != cofping.ICMP_TYPE_8_ECHO_REQUEST:
+                        continue
+                    _, _, _, carrier_icmp_id, carrier_icmp_sequence = icmp_header_struct.unpack_from(buffer, carrier_icmp_offset)
+                    self.handle_respond(timestamp_ns, (carrier_struct_tuple[8], carrier_struct_tuple[9], carrier_icmp_id,
+                                                       carrier_icmp_sequence),
+                                        cofping.PingOnePacket.generate_icmp_failed_info(icmp_type, icmp_code), source_ip_int)
+            self.packet_count = reader.packet_count
+            self.truncated_count = reader.truncated_count
+        self.expire_pending_request(-1, is_all=True)  # 文件结束时仍在途的请求计为丢包
+        self.finished_key_dict = collections.OrderedDict()
+
+    def get_flow_stats(self, source_ip_int: int, destination_ip_int: int) -> IcmpFlowStats:
+        flow_key = (source_ip_int, destination_ip_int)
+        flow_stats = self.flow_stats_dict.get(flow_key)
+        if flow_stats is None:
+            flow_stats = IcmpFlowStats(cofnet.int32_to_ip(source_ip_int), cofnet.int32_to_ip(destination_ip_int))
+            self.flow_stats_dict[flow_key] = flow_stats
+        return flow_stats
+
+    def handle_request(self, timestamp_ns: int, match_key: tuple):
+        flow_stats = self.get_flow_stats(match_key[0], match_key[1])
+        flow_stats.request_count += 1
+        previous = self.pending_request_dict.pop(match_key, None)
+        if previous is not None:  # 相同id及sequence的请求又发了一次（重传或环回抓到两次），前一个计为丢包
+            previous[1].lost_count += 1
+        self.finished_key_dict.pop(match_key, None)
+        self.pending_request_dict[match_key] = (timestamp_ns, flow_stats)
+
+    def handle_respond(self, timestamp_ns: int, match_key: tuple, failed_info: str, error_source_ip_int: int):
+        """
+        failed_info为空表示echo响应，否则为差错报文
+        """
+        pending = self.pending_request_dict.pop(match_key, None)
+        if pending is None:
+            finished = self.finished_key_dict.get(match_key)
+            if finished is not None:
+                finished[1].duplicate_count += 1
+            else:
+                self.unmatched_respond_count += 1
+            return
+        send_ns, flow_stats = pending
+        if failed_info == "":
+            flow_stats.add_rtt((timestamp_ns - send_ns) / 1000000)
+        else:
+            flow_stats.error_count += 1
+            flow_stats.failed_info_count_dict[failed_info] = flow_stats.failed_info_count_dict.get(failed_info, 0) + 1
+            flow_stats.error_source_ip_set.add(cofnet.int32_to_ip(error_source_ip_int))
+        self.finished_key_dict[match_key] = (timestamp_ns, flow_stats)
+
+    def expire_pending_request(self, deadline_ns: int, is_all=False):
+        """
+        发包时刻早于deadline_ns的在途请求计为丢包并移除，已配对记录同样按时间淘汰，使内存占用不随文件增长
+        """
+        pending_request_dict = self.pending_request_dict
+        while len(pending_request_dict) != 0:
+            match_key, (send_ns, flow_stats) = next(iter(pending_request_dict.items()))
+            if not is_all and send_ns >= deadline_ns:
+                break
+            pending_request_dict.popitem(last=False)
+            flow_stats.lost_count += 1
+        finished_key_dict = self.finished_key_dict
+        while len(finished_key_dict) != 0:
+            match_key, (finish_ns, flow_stats) = next(iter(finished_key_dict.items()))
+            if not is_all and finish_ns >= deadline_ns:
+                break
+            finished_key_dict.popitem(last=False)
+
+    def format_report(self) -> str:
+        line_list = [f"packets={self.packet_count} icmp={self.icmp_packet_count} flows={len(self.flow_stats_dict)} "
+                     f"unmatched_respond={self.unmatched_respond_count} truncated={self.truncated_count}"]
+        for flow_stats in sorted(self.flow_stats_dict.values(), key=lambda stats: (cofnet.ip_or_maskbyte_to_int(stats.source_ip),
+                                                                                   cofnet.ip_or_maskbyte_to_int(stats.destination_ip))):
+            line_list.append(f"{flow_stats.source_ip:>15} --> {flow_stats.destination_ip:<15} "
+                             f"sent={flow_stats.request_count} recv={flow_stats.respond_count} error={flow_stats.error_count} "
+                             f"lost={flow_stats.lost_count} dup={flow_stats.duplicate_count} loss={flow_stats.loss_rate:.1%} "
+                             f"rtt_ms min/avg/max={flow_stats.rtt_ms_min:.3f}/{flow_stats.rtt_ms_avg:.3f}/{flow_stats.rtt_ms_max:.3f}")
+            for failed_info, count in flow_stats.failed_info_count_dict.items():
+                line_list.append(f"{'':>20}{count:>8} x {failed_info} from {','.join(sorted(flow_stats.error_source_ip_set))}")
+        return "\n".join(line_list)
+
+
+def main(argv: list) -> int:
+    parser = argparse.ArgumentParser(prog="cofpcap.py", description="离线分析抓包文件中icmp echo的RTT及丢包")
+    parser.add_argument("file_path", help="pcap或pcapng抓包文件")
+    parser.add_argument("--timeout", type=float, default=PCAP_TIMEOUT_S_DEFAULT, help="echo请求超过此秒数没有回包则计为丢包")
+    args = parser.parse_args(argv[1:])
+    analyzer = IcmpPcapAnalyzer(file_path=args.file_path, timeout=args.timeout)
+    analyzer.start()
+    print(analyzer.format_report())
+    return 0
+
+
+# #################################  end of module  ##############################
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -7,17 +7,59 @@
 
 import array
 import ctypes
+import ctypes.util
+import enum
+import errno
+import os
+import select
 import struct
 import time
 import socket
 import random
 import string
+import sys
+import threading
+import multiprocessing
+import queue
 import cofnet
+import cofmetrics
 
 ICMP_TYPE_8_ECHO_REQUEST = 0x08
 ICMP_TYPE_0_ECHO_RESPOND = 0x00
 ICMP_TYPE_3_DESTINATION_UNREACHABLE = 3
 ICMP_TYPE_11_TIME_TO_LIVE_EXCEEDED = 11
+# 内核收包时间戳（Linux的SO_TIMESTAMPNS），收包时间以内核收到报文的时刻为准，不受python线程调度及GIL等待的影响
+# python的socket模块没有导出这个常量，Linux（x86/arm）下其值为35，辅助数据的cmsg_type（SCM_TIMESTAMPNS）与其相同
+SO_TIMESTAMPNS = getattr(socket, "SO_TIMESTAMPNS", 35 if sys.platform.startswith("linux") else 0)
+HAS_SO_TIMESTAMPNS = SO_TIMESTAMPNS != 0
+ICMP_TIMESTAMP_DATA_SIZE = 8  # 数据部分不小于8字节时，在数据开头嵌入发包时刻（perf_counter_ns，8字节大端）
+# Linux的批量收发系统调用sendmmsg/recvmmsg，一次系统调用收发多个报文，python标准库没有封装，通过ctypes调用libc
+MSG_DONTWAIT = 0x40
+MMSG_BATCH_SIZE_DEFAULT = 256  # 每次批量收发的报文数量
+MMSG_RECV_BUFFER_SIZE = 2048  # 批量收包时每个报文的预分配缓冲区大小，单位：字节，超出部分会被截断
+MMSG_CONTROL_BUFFER_SIZE = 64  # 批量收包时每个报文的辅助数据缓冲区大小，用于接收内核时间戳
+SWEEP_RECV_BUFFER_SIZE = 8 << 20  # 存活扫描时套接字的接收缓冲区大小，单位：字节，回包集中到达时缓冲区太小会丢包（受系统rmem_max限制）
+try:
+    LIBC = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True) if sys.platform.startswith("linux") else None
+except OSError:
+    LIBC = None
+HAS_MMSG = LIBC is not None and hasattr(LIBC, "sendmmsg") and hasattr(LIBC, "recvmmsg")
+if HAS_MMSG:
+    LIBC.sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+    LIBC.sendmmsg.restype = ctypes.c_int
+    LIBC.recvmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    LIBC.recvmmsg.restype = ctypes.c_int
+# ipv4设置不分片（DF位）的套接字选项，python的socket模块都没有导出，按系统取值：
+# Linux为 IP_MTU_DISCOVER=10 设为 IP_PMTUDISC_DO=2 ；Windows为 IP_DONTFRAGMENT=14 ；macOS/BSD为 IP_DONTFRAG=28
+IP_MTU_DISCOVER = getattr(socket, "IP_MTU_DISCOVER", 10)
+IP_PMTUDISC_DO = getattr(socket, "IP_PMTUDISC_DO", 2)
+IP_DONTFRAGMENT = 14
+IP_DONTFRAG = 28
+ICMP_CODE_4_FRAGMENTATION_NEEDED = 4  # 终点不可达-->需要分片但设置了DF位，icmp头的后2字节为下一跳的MTU（RFC1191）
+IPV4_MTU_MIN = 68  # ipv4链路的最小MTU
+RTO_MIN_S_DEFAULT = 0.05  # 自适应超时的下限，单位：秒，RFC6298建议1秒，对局域网来说太大了，这里取50毫秒
+METRICS = cofmetrics.INSTRUMENTATION  # 各阶段耗时统计，默认关闭，由 cofmetrics.enable() 开启
+LOGGER = cofmetrics.get_logger("cofping")  # 限频日志，收发线程中不再直接print
 
 
 def stop_thread_silently(thread):
@@ -27,39 +69,239 @@ def stop_thread_silently(thread):
     本函数不会抛出异常
     """
     if thread is None:
-        print("cofping.stop_thread_silently: thread obj is None")
+        LOGGER.warning("stop_thread_silently: thread obj is None")
         return
     thread_id = ctypes.c_long(thread.ident)
     res = ctypes.pythonapi.PyThreadState_SetAsyncExc(thread_id, ctypes.py_object(SystemExit))
     # 正常结束线程时会返回数值1
     if res == 0:
-        print("cofping.stop_thread_silently: invalid thread id")
+        LOGGER.warning("stop_thread_silently: invalid thread id")
     elif res == 1:
-        print("cofping.stop_thread_silently: thread stopped")
+        LOGGER.debug("stop_thread_silently: thread stopped")
     else:
         # 如果返回的值不为0，也不为1，则:
         ctypes.pythonapi.PyThreadState_SetAsyncExc(thread_id, None)
-        print("cofping.stop_thread_silently: PyThreadState_SetAsyncExc failed")
+        LOGGER.error("stop_thread_silently: PyThreadState_SetAsyncExc failed")
+
+
+def set_dont_frag(icmp_socket) -> bool:
+    """
+    为ipv4套接字设置不分片（发出的报文带DF位），设置成功返回True，否则返回False，本函数不会抛出异常
+    Linux下设置后，超过本机已知路径MTU的报文在sendto时直接报EMSGSIZE（OSError）
+    """
+    if sys.platform.startswith("linux"):
+        option_tuple = (IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+    elif sys.platform == "win32":
+        option_tuple = (IP_DONTFRAGMENT, 1)
+    else:
+        option_tuple = (IP_DONTFRAG, 1)
+    try:
+        icmp_socket.setsockopt(socket.IPPROTO_IP, option_tuple[0], option_tuple[1])
+    except OSError:
+        return False
+    return True
+
+
+def enable_kernel_timestamp(icmp_socket) -> bool:
+    """
+    为套接字开启内核收包时间戳，开启成功返回True，系统不支持或套接字不支持recvmsg（如模拟套接字）时返回False，本函数不会抛出异常
+    """
+    if not HAS_SO_TIMESTAMPNS or not hasattr(icmp_socket, "recvmsg"):
+        return False
+    try:
+        icmp_socket.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+    except OSError:
+        return False
+    return True
+
+
+def recv_packet_with_timestamp(icmp_socket, is_kernel_timestamp_enabled: bool) -> tuple:
+    """
+    接收1个报文，返回二元组 (报文, 收包时刻)，收包时刻为 time.perf_counter_ns() 时钟下的纳秒数，
+    开启了内核收包时间戳时，把内核给的系统时间换算到perf_counter_ns时钟上，否则取recv返回后的时刻
+    超时等异常与 socket.recv 相同
+    """
+    recv_start_ns = time.perf_counter_ns() if METRICS.is_enabled else 0
+    if not is_kernel_timestamp_enabled:
+        recv_packet = icmp_socket.recv(65535)
+        recv_perf_ns = time.perf_counter_ns()
+        if METRICS.is_enabled:
+            METRICS.observe(cofmetrics.STAGE_RECV, recv_perf_ns - recv_start_ns)
+        return recv_packet, recv_perf_ns
+    recv_packet, ancdata, msg_flags, address = icmp_socket.recvmsg(65535, 1024)
+    recv_perf_ns = time.perf_counter_ns()
+    if METRICS.is_enabled:
+        METRICS.observe(cofmetrics.STAGE_RECV, recv_perf_ns - recv_start_ns)
+    for cmsg_level, cmsg_type, cmsg_data in ancdata:
+        if cmsg_level == socket.SOL_SOCKET and cmsg_type == SO_TIMESTAMPNS and len(cmsg_data) >= 16:
+            tv_sec, tv_nsec = struct.unpack("qq", cmsg_data[:16])  # struct timespec
+            # 系统时间与perf_counter_ns时钟的差值，在收包后立即取，两者间隔只有微秒级
+            realtime_offset_ns = time.time_ns() - time.perf_counter_ns()
+            kernel_recv_perf_ns = tv_sec * 1000000000 + tv_nsec - realtime_offset_ns
+            if METRICS.is_enabled:
+                METRICS.observe(cofmetrics.STAGE_QUEUE_WAIT, max(recv_perf_ns - kernel_recv_perf_ns, 0))
+            return recv_packet, kernel_recv_perf_ns
+    return recv_packet, recv_perf_ns
+
+
+class PingStatus(enum.IntEnum):
+    """
+    单次ping的结果状态，结果里只存此整数，失败信息（字符串）用到时才生成
+    """
+    PENDING = 0  # 还没有结果
+    SUCCESS = 1  # 收到echo响应
+    TIMEOUT = 2  # 超时没有收到回包
+    ICMP_ERROR = 3  # 收到差错报文（ttl超时、终点不可达等），失败信息由icmp_type及icmp_code生成
+    SEND_ERROR = 4  # 发包时本机报错（如无路由），失败信息为异常信息
 
 
 class ResultOfPingOnePacket:
-    def __init__(self, respond_source_ip="", respond_destination_ip="", rtt_ms=0.0, icmp_data_size=0, ttl=0, is_success=False,
-                 icmp_type=0, icmp_code=0, icmp_checksum=0x0000, icmp_id=0x0000, icmp_sequence=0x0000, icmp_data=b'',
-                 received_a_respond=False, failed_info=""):
-        self.respond_source_ip = respond_source_ip
-        self.respond_destination_ip = respond_destination_ip
+    """
+    单次ping的结果，使用__slots__，ip以整数存储，回包数据默认不保留（PingOnePacket的keep_payload=True时才保留），
+    is_success、received_a_respond、failed_info、respond_source_ip等为按需计算的只读属性
+    """
+    __slots__ = ("status", "rtt_ms", "icmp_data_size", "ttl", "icmp_type", "icmp_code", "icmp_checksum", "icmp_id",
+                 "icmp_sequence", "respond_source_ip_int", "respond_destination_ip_int", "icmp_data", "error_message")
+
+    def __init__(self, status=PingStatus.PENDING, rtt_ms=0.0, icmp_data_size=0, ttl=0, icmp_type=0, icmp_code=0,
+                 icmp_checksum=0x0000, icmp_id=0x0000, icmp_sequence=0x0000, respond_source_ip_int=0,
+                 respond_destination_ip_int=0, icmp_data=b'', error_message=""):
+        self.status = status  # PingStatus
         self.rtt_ms = rtt_ms  # RTT时间，单位：毫秒
         self.icmp_data_size = icmp_data_size  # icmp数据大小，单位：字节
         self.ttl = ttl  # ip报文里的ttl
-        self.is_success = is_success  # 检测是否成功，成功则置为True
         self.icmp_type = icmp_type
         self.icmp_code = icmp_code
         self.icmp_checksum = icmp_checksum
         self.icmp_id = icmp_id
         self.icmp_sequence = icmp_sequence
-        self.icmp_data = icmp_data  # bytes类型数据
-        self.received_a_respond = received_a_respond
-        self.failed_info = failed_info  # 如果检测不成功，必须提示失败信息
+        self.respond_source_ip_int = respond_source_ip_int
+        self.respond_destination_ip_int = respond_destination_ip_int
+        self.icmp_data = icmp_data  # bytes类型数据，默认不保留，为b''
+        self.error_message = error_message  # 只有status为SEND_ERROR时才有
+
+    @property
+    def is_success(self) -> bool:
+        return self.status == PingStatus.SUCCESS
+
+    @property
+    def received_a_respond(self) -> bool:
+        return self.status in (PingStatus.SUCCESS, PingStatus.ICMP_ERROR)
+
+    @property
+    def failed_info(self) -> str:
+        """
+        检测不成功时的失败信息，成功时为空字符串
+        """
+        if self.status == PingStatus.TIMEOUT:
+            return "timeout"
+        if self.status == PingStatus.ICMP_ERROR:
+            return PingOnePacket.generate_icmp_failed_info(self.icmp_type, self.icmp_code)
+        if self.status == PingStatus.SEND_ERROR:
+            return self.error_message
+        return ""
+
+    @property
+    def respond_source_ip(self) -> str:
+        return cofnet.int32_to_ip(self.respond_source_ip_int) if self.received_a_respond else ""
+
+    @property
+    def respond_destination_ip(self) -> str:
+        return cofnet.int32_to_ip(self.respond_destination_ip_int) if self.received_a_respond else ""
+
+
+class PingResultBatch:
+    """
+    批量ping结果的紧凑容器（array-of-structs），每个结果为1条16字节的定长记录，连续存放在1个bytearray里，
+    100万个结果约占16MB，远小于100万个 ResultOfPingOnePacket 对象
+    记录格式: 目标ip(I) 状态(B) ttl(B) icmp_type(B) icmp_code(B) rtt_ms(f) 回包源ip(I)
+    用法:
+    batch = PingResultBatch()
+    batch.append(target_ip_int, PingStatus.SUCCESS, rtt_ms=1.5, ttl=64, respond_source_ip_int=target_ip_int)
+    for target_ip_int, status, ttl, icmp_type, icmp_code, rtt_ms, respond_source_ip_int in batch:
+        pass
+    batch.get_result(0)  # 第0条记录转为 ResultOfPingOnePacket
+    """
+    RECORD_STRUCT = struct.Struct("=IBBBBfI")
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def __len__(self) -> int:
+        return len(self.buffer) // self.RECORD_STRUCT.size
+
+    def __iter__(self):
+        return self.RECORD_STRUCT.iter_unpack(self.buffer)
+
+    def __getitem__(self, index: int) -> tuple:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("PingResultBatch下标超出范围", index)
+        return self.RECORD_STRUCT.unpack_from(self.buffer, index * self.RECORD_STRUCT.size)
+
+    def append(self, target_ip_int: int, status: int, rtt_ms=0.0, ttl=0, icmp_type=0, icmp_code=0, respond_source_ip_int=0):
+        self.buffer += self.RECORD_STRUCT.pack(target_ip_int, status, ttl, icmp_type, icmp_code, rtt_ms, respond_source_ip_int)
+
+    def append_result(self, target_ip_int: int, result: ResultOfPingOnePacket):
+        self.append(target_ip_int, result.status, result.rtt_ms, result.ttl, result.icmp_type, result.icmp_code,
+                    result.respond_source_ip_int)
+
+    def get_result(self, index: int) -> ResultOfPingOnePacket:
+        """
+        把第index条记录转为 ResultOfPingOnePacket （没有icmp_id等记录里不保存的字段）
+        """
+        target_ip_int, status, ttl, icmp_type, icmp_code, rtt_ms, respond_source_ip_int = self[index]
+        return ResultOfPingOnePacket(status=PingStatus(status), rtt_ms=rtt_ms, ttl=ttl, icmp_type=icmp_type,
+                                     icmp_code=icmp_code, respond_source_ip_int=respond_source_ip_int)
+
+    def clear(self):
+        self.buffer = bytearray()
+
+
+class RttEstimator:
+    """
+    单个目标的RTT估计器（RFC6298），根据历次RTT平滑估算出下一个探测包的超时时间，
+    超时时间限制在 [min_rto_s, max_rto_s] 内，局域网主机很快就能收敛到下限，不必每个包都等满固定的超时
+    用法:
+    estimator = RttEstimator(min_rto_s=0.05, max_rto_s=2)
+    timeout = estimator.get_timeout()
+    收到回包时 estimator.update(rtt_s) ，超时时 estimator.on_timeout()
+    """
+
+    def __init__(self, min_rto_s=RTO_MIN_S_DEFAULT, max_rto_s=2.0, clock_granularity_s=0.001):
+        self.min_rto_s = min_rto_s  # 超时下限，单位：秒
+        self.max_rto_s = max_rto_s  # 超时上限，单位：秒，一般为用户设置的超时时间
+        self.clock_granularity_s = clock_granularity_s  # 时钟精度G，单位：秒
+        self.srtt_s = 0.0  # 平滑RTT
+        self.rttvar_s = 0.0  # RTT偏差
+        self.rto_s = max_rto_s  # 当前超时时间，还没有RTT样本时使用上限
+        self.has_sample = False
+
+    def clamp(self, rto_s: float) -> float:
+        return min(max(rto_s, self.min_rto_s), self.max_rto_s)
+
+    def update(self, rtt_s: float):
+        """
+        收到回包后，用本次RTT更新估计值（alpha=1/8, beta=1/4, K=4）
+        """
+        if not self.has_sample:
+            self.srtt_s = rtt_s
+            self.rttvar_s = rtt_s / 2
+            self.has_sample = True
+        else:
+            self.rttvar_s = 0.75 * self.rttvar_s + 0.25 * abs(self.srtt_s - rtt_s)
+            self.srtt_s = 0.875 * self.srtt_s + 0.125 * rtt_s
+        self.rto_s = self.clamp(self.srtt_s + max(self.clock_granularity_s, 4 * self.rttvar_s))
+
+    def on_timeout(self):
+        """
+        超时后超时时间加倍（不超过上限），避免目标变慢后一直误判为超时
+        """
+        self.rto_s = self.clamp(self.rto_s * 2)
+
+    def get_timeout(self) -> float:
+        return self.rto_s
 
 
 class PingOnePacket:
@@ -67,12 +309,13 @@ class PingOnePacket:
     单次ping检测，只会发送1个icmp_echo_request报文，然后等待回复
     """
 
-    def __init__(self, target_ip="", timeout=2, size=1, ttl=128, dont_frag=False):
+    def __init__(self, target_ip="", timeout=2, size=1, ttl=128, dont_frag=False, socket_factory=None, keep_payload=False):
         self.target_ip = target_ip  # 目标ip（ipv4地址）
-        self.timeout = timeout  # 超时，单位：秒
+        self.timeout = timeout  # 超时，单位：秒，可以为小数
         self.size = size  # 发包数据大小，单位：字节，当整个报文长度小于mac帧长度要求时，会自动以0填充
         self.ttl = ttl
         self.dont_frag = dont_frag  # 置True时不分片，置False时分片
+        self.keep_payload = keep_payload  # 置True时结果里保留回包的icmp数据（result.icmp_data），默认不保留
         self.result = ResultOfPingOnePacket()
         self.is_finished = False
         self.icmp_send_type = ICMP_TYPE_8_ECHO_REQUEST  # icmp_echo_request
@@ -81,132 +324,204 @@ class PingOnePacket:
         self.icmp_send_id = 0xFFFF & random.randint(0, 0xFFFF)  # 为进程号，echo响应消息与echo请求消息中的id保持一致，取值随机
         self.icmp_send_sequence = 0xFFFF & random.randint(0, 0xFFFF)  # 序列号，echo响应消息与echo请求消息中的sequence保持一致，取值随机
         self.icmp_send_data = b''
+        self.icmp_send_partial_sum = 0  # 请求报文（嵌入发包时刻的8字节按0计）按2字节累加的和，发包时只需再加上发包时刻
         self.icmp_send_packet = b''
         self.icmp_socket = None
         self.start_time = 0.0
+        self.send_perf_ns = 0  # 发包时刻，time.perf_counter_ns()时钟，不受系统时间调整的影响
+        self.is_kernel_timestamp_enabled = False
         self.recv_thread = None
+        # 创建套接字的函数，默认为socket.socket，测试及性能基准时可传入模拟的套接字类，无需真实网络
+        self.socket_factory = socket.socket if socket_factory is None else socket_factory
 
     def start(self):
-        self.icmp_send_packet = self.generate_icmp_packet()
+        if not METRICS.is_enabled:
+            self.send_and_recv_icmp_packet()
+            return
+        cofmetrics.TARGET_METRICS.probe_started()
+        try:
+            self.send_and_recv_icmp_packet()
+        finally:
+            cofmetrics.TARGET_METRICS.probe_finished(self.target_ip, self.result.is_success, self.result.rtt_ms)
+
+    def send_and_recv_icmp_packet(self):
         # 创建icmp套接字
-        self.icmp_socket = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+        self.icmp_socket = self.socket_factory(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
         self.icmp_socket.settimeout(self.timeout)  # 设置socket超时时间，当收到数据包后，会重置超时时间为指定的
         self.icmp_socket.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, self.ttl)  # 设置ip报文的ttl
         if self.dont_frag:
-            self.icmp_socket.setsockopt(socket.IPPROTO_IP, socket.IPV6_DONTFRAG, 2)  # 设置ip报文不分片，没有IPV4_DONTFRAG常量，这就有点坑
+            set_dont_frag(self.icmp_socket)  # 设置ip报文不分片
+        self.is_kernel_timestamp_enabled = enable_kernel_timestamp(self.icmp_socket)
         self.start_time = time.time()
+        build_start_ns = time.perf_counter_ns() if METRICS.is_enabled else 0
+        self.prepare_icmp_packet()  # 耗时与报文大小成正比的部分（随机数据、校验和）在取发包时刻之前做完
+        if METRICS.is_enabled:
+            send_start_ns = time.perf_counter_ns()
+            METRICS.observe(cofmetrics.STAGE_BUILD, send_start_ns - build_start_ns)
         try:
+            self.icmp_send_packet = self.generate_icmp_packet()  # 最后才取发包时刻，与sendto之间只差固定的几步，RTT不含生成报文的耗时
             self.icmp_socket.sendto(self.icmp_send_packet, (self.target_ip, 0))  # ★发送请求报文
+            if METRICS.is_enabled:
+                METRICS.observe(cofmetrics.STAGE_SEND, time.perf_counter_ns() - send_start_ns)
+                METRICS.count("packet_sent")
         except OSError as err:
             self.is_finished = True
             stop_thread_silently(self.recv_thread)
-            self.result.is_success = False
-            self.result.failed_info = err.__str__()
+            self.result.status = PingStatus.SEND_ERROR
+            self.result.error_message = err.__str__()
             return
         self.recv_icmp_packet()  # 接收报文，阻塞型
         self.icmp_socket.close()
 
     @staticmethod
-    def generate_icmp_checksum(packet: bytes) -> int:
+    def sum_icmp_words(packet: bytes) -> int:
+        """
+        按2字节一块累加（不折叠、不取反），用于分段计算校验和，各段的和相加后传给 generate_icmp_checksum(后一段, 前面各段的和)
+        ★除最后一段外，各段的长度须为偶数
+        """
         if len(packet) & 1:  # 长度的末位为1表示：长度不是2的倍数（即最后一bit不为0），则：
             packet = packet + b'\x00'  # 需要以0填充
         words = array.array('h', packet)
         checksum = 0
         for word in words:
             checksum += (word & 0xffff)
+        return checksum
+
+    @staticmethod
+    def generate_icmp_checksum(packet: bytes, partial_sum=0) -> int:
+        """
+        计算icmp校验和，partial_sum 为报文前面部分用 sum_icmp_words() 算好的和，为0时 packet 即整个报文
+        """
+        checksum = partial_sum + PingOnePacket.sum_icmp_words(packet)
         while checksum > 0xFFFF:
             checksum = (checksum >> 16) + (checksum & 0xffff)  # checksum只能为2字节，溢出部分需要继续进行+运算，直到不溢出为止
         return (~checksum) & 0xffff  # 反回2字节校验和的反码
 
-    def generate_icmp_packet(self) -> bytes:
+    def prepare_icmp_packet(self):
+        """
+        生成请求报文中与发包时刻无关的部分：随机数据，及报文按2字节累加的和（校验和字段及嵌入发包时刻的8字节按0计）
+        """
         self.icmp_send_data = "".join(random.SystemRandom().choice(string.ascii_letters) for _ in range(self.size)).encode('utf8')
+        if self.size >= ICMP_TIMESTAMP_DATA_SIZE:
+            self.icmp_send_data = b'\x00' * ICMP_TIMESTAMP_DATA_SIZE + self.icmp_send_data[ICMP_TIMESTAMP_DATA_SIZE:]
         # 字节序默认跟随系统，x86_64为LE小端字节序
-        icmp_temp_header = struct.pack('bbHHH', self.icmp_send_type, self.icmp_send_code, self.icmp_send_checksum,
-                                       self.icmp_send_id, self.icmp_send_sequence)
-        icmp_temp_packet = icmp_temp_header + self.icmp_send_data
-        self.icmp_send_checksum = self.generate_icmp_checksum(icmp_temp_packet)
+        icmp_temp_header = struct.pack('bbHHH', self.icmp_send_type, self.icmp_send_code, 0, self.icmp_send_id,
+                                       self.icmp_send_sequence)
+        self.icmp_send_partial_sum = self.sum_icmp_words(icmp_temp_header + self.icmp_send_data)
+
+    def generate_icmp_packet(self) -> bytes:
+        """
+        紧挨着sendto调用：取发包时刻并嵌入数据开头（echo响应会原样带回），校验和只需在 prepare_icmp_packet() 算好的和上
+        再加上这8字节，耗时与报文大小无关
+        """
+        self.send_perf_ns = time.perf_counter_ns()
+        if self.size >= ICMP_TIMESTAMP_DATA_SIZE:  # 时刻位于icmp头（8字节）之后，按2字节对齐，可以单独累加
+            timestamp_data = struct.pack("!Q", self.send_perf_ns)
+            self.icmp_send_checksum = self.generate_icmp_checksum(timestamp_data, self.icmp_send_partial_sum)
+            self.icmp_send_data = timestamp_data + self.icmp_send_data[ICMP_TIMESTAMP_DATA_SIZE:]
+        else:
+            self.icmp_send_checksum = self.generate_icmp_checksum(b'', self.icmp_send_partial_sum)
         icmp_header = struct.pack('bbHHH', self.icmp_send_type, self.icmp_send_code, self.icmp_send_checksum,
                                   self.icmp_send_id, self.icmp_send_sequence)
         return icmp_header + self.icmp_send_data
 
     def recv_icmp_packet(self):
         while True:
-            print(f"{self.target_ip} 开始接收回包，")
-            used_time = time.time() - self.start_time
+            used_time = (time.perf_counter_ns() - self.send_perf_ns) / 1000000000
             if used_time >= self.timeout:
-                print(f"PingOnePacket.recv_icmp_packet: {self.target_ip}接收超时了 {used_time}")
-                self.result.is_success = False
-                self.result.failed_info = "timeout"
+                LOGGER.debug("PingOnePacket.recv_icmp_packet: %s接收超时了 %s", self.target_ip, used_time)
+                if METRICS.is_enabled:
+                    METRICS.count("reply_timeout")
+                self.result.status = PingStatus.TIMEOUT
                 self.result.rtt_ms = self.timeout * 1000
                 self.is_finished = True
                 return
             try:
                 # recv_packet, addr = self.icmp_socket.recvfrom(65535)  # ★★接收到整个ip报文，阻塞型函数
-                recv_packet = self.icmp_socket.recv(65535)  # ★★接收到整个ip报文，阻塞型函数
+                recv_packet, recv_perf_ns = recv_packet_with_timestamp(self.icmp_socket, self.is_kernel_timestamp_enabled)
             except Exception as e:  # 超时会报异常
-                print("\nPingOnePacket.recv_icmp_packet: 接收报异常超时了", e)
-                self.result.is_success = False
-                self.result.failed_info = "timeout"
+                LOGGER.debug("PingOnePacket.recv_icmp_packet: %s接收报异常超时了 %s", self.target_ip, e)
+                if METRICS.is_enabled:
+                    METRICS.count("reply_timeout")
+                self.result.status = PingStatus.TIMEOUT
                 self.result.rtt_ms = self.timeout * 1000
                 self.is_finished = True
                 return
             # 如果接收到报文了：
-            rtt_s = time.time() - self.start_time
-            ipv4_header = recv_packet[:20]
-            icmp_header = recv_packet[20:28]
-            icmp_data = recv_packet[28:]
-            ipv4_struct_tuple = struct.unpack("!BBHHHBBHII", ipv4_header)
-            icmp_type, icmp_code, icmp_checksum, icmp_id, icmp_sequence = struct.unpack("bbHHH", icmp_header)
-            if icmp_id == self.icmp_send_id and icmp_sequence == self.icmp_send_sequence and icmp_type != ICMP_TYPE_8_ECHO_REQUEST:
-                self.result.received_a_respond = True
-                self.result.rtt_ms = rtt_s * 1000
-                if icmp_type == ICMP_TYPE_0_ECHO_RESPOND and icmp_code == 0x00:
-                    self.result.is_success = True
-                else:
-                    self.result.is_success = False
-                    self.result.failed_info = self.generate_icmp_failed_info(icmp_type, icmp_code)
-                self.result.ttl = ipv4_struct_tuple[5]
-                # self.result.respond_source_ip = addr[0]  # 同 ipv4_struct_tuple[8]
-                self.result.respond_source_ip = cofnet.int32_to_ip(ipv4_struct_tuple[8])
-                self.result.respond_destination_ip = cofnet.int32_to_ip(ipv4_struct_tuple[9])
-                self.result.icmp_data_size = len(icmp_data)  # 大小为icmp数据部分的长度
-                self.result.icmp_type = icmp_type
-                self.result.icmp_code = icmp_code
-                self.result.icmp_checkum = icmp_checksum
-                self.result.icmp_id = icmp_id
-                self.result.icmp_sequence = icmp_sequence
-                self.result.icmp_data = icmp_data
-                self.is_finished = True
-                return
-            elif icmp_type == ICMP_TYPE_11_TIME_TO_LIVE_EXCEEDED:  # 这种类型常见于tracepath中，由中间路由器返回的ttl超时消息
-                # 它本身是icmp报文，其icmp_id和icmp_sequence为空，其数据内容为 原数据包的ip报文（含ip报文中的icmp载荷）
-                carrier_ipv4_header = recv_packet[28:48]
-                carrier_icmp_packet = recv_packet[48:]
-                # carrier_icmp_header = recv_packet[48:56]
-                # carrier_icmp_data = recv_packet[56:]
-                carrier_ipv4_struct_tuple = struct.unpack("!BBHHHBBHII", carrier_ipv4_header)
-                if carrier_ipv4_struct_tuple[9] == cofnet.ip_or_maskbyte_to_int(
-                        self.target_ip) and carrier_icmp_packet == self.icmp_send_packet:
-                    self.result.received_a_respond = True
-                    self.result.rtt_ms = rtt_s * 1000
-                    self.result.is_success = False
-                    self.result.failed_info = self.generate_icmp_failed_info(icmp_type, icmp_code)
-                    self.result.ttl = ipv4_struct_tuple[5]
-                    self.result.respond_source_ip = cofnet.int32_to_ip(ipv4_struct_tuple[8])
-                    self.result.respond_destination_ip = cofnet.int32_to_ip(ipv4_struct_tuple[9])
-                    self.result.icmp_data_size = len(icmp_data)  # 大小为icmp数据部分的长度
-                    self.result.icmp_type = icmp_type
-                    self.result.icmp_code = icmp_code
-                    self.result.icmp_checkum = icmp_checksum
-                    self.result.icmp_id = icmp_id
-                    self.result.icmp_sequence = icmp_sequence
-                    self.result.icmp_data = icmp_data
-                    self.is_finished = True
+            if not METRICS.is_enabled:
+                if self.parse_recv_packet(recv_packet, recv_perf_ns):
+                    return
+            else:
+                METRICS.count("packet_received")
+                parse_start_ns = time.perf_counter_ns()
+                is_matched = self.parse_recv_packet(recv_packet, recv_perf_ns)
+                METRICS.observe(cofmetrics.STAGE_PARSE, time.perf_counter_ns() - parse_start_ns)
+                if is_matched:
+                    METRICS.count("reply_matched")
                     return
-            time_left = self.timeout - rtt_s
+                if self.is_dropped_reply(recv_packet):
+                    METRICS.count("reply_dropped")
+            time_left = self.timeout - (time.perf_counter_ns() - self.send_perf_ns) / 1000000000
             if time_left > 0:
                 self.icmp_socket.settimeout(time_left)
 
+    def parse_recv_packet(self, recv_packet: bytes, recv_perf_ns: int) -> bool:
+        """
+        解析收到的报文，是本次请求的回包（echo响应或差错报文）则填写结果并返回True，否则返回False
+        """
+        if len(recv_packet) < 28:
+            return False  # 不足ip头+icmp头，无法解析
+        rtt_ms = (recv_perf_ns - self.send_perf_ns) / 1000000
+        icmp_type, icmp_code, icmp_checksum, icmp_id, icmp_sequence = struct.unpack_from("bbHHH", recv_packet, 20)
+        if icmp_id == self.icmp_send_id and icmp_sequence == self.icmp_send_sequence and icmp_type != ICMP_TYPE_8_ECHO_REQUEST:
+            if icmp_type == ICMP_TYPE_0_ECHO_RESPOND and icmp_code == 0x00:
+                status = PingStatus.SUCCESS
+                if self.size >= ICMP_TIMESTAMP_DATA_SIZE and len(recv_packet) >= 28 + ICMP_TIMESTAMP_DATA_SIZE:
+                    # 以回包数据里带回的发包时刻计算RTT
+                    echo_send_perf_ns = struct.unpack_from("!Q", recv_packet, 28)[0]
+                    rtt_ms = (recv_perf_ns - echo_send_perf_ns) / 1000000
+            else:
+                status = PingStatus.ICMP_ERROR
+            self.fill_result(recv_packet, status, rtt_ms, icmp_type, icmp_code, icmp_checksum, icmp_id, icmp_sequence)
+            return True
+        elif icmp_type in (ICMP_TYPE_11_TIME_TO_LIVE_EXCEEDED, ICMP_TYPE_3_DESTINATION_UNREACHABLE) and len(recv_packet) >= 56:
+            # ttl超时常见于tracepath中，由中间路由器返回；终点不可达由路由器或目标主机返回
+            # 它本身是icmp报文，其icmp_id和icmp_sequence为空，其数据内容为 原数据包的ip报文（含ip报文中的icmp载荷）
+            # 按RFC792，原数据包至少会带回ip头及其后的8字节（即icmp头），所以只比较icmp头
+            carrier_destination_ip_int = struct.unpack_from("!I", recv_packet, 44)[0]
+            if carrier_destination_ip_int == cofnet.ip_or_maskbyte_to_int(
+                    self.target_ip) and recv_packet[48:56] == self.icmp_send_packet[:8]:
+                self.fill_result(recv_packet, PingStatus.ICMP_ERROR, rtt_ms, icmp_type, icmp_code, icmp_checksum, icmp_id,
+                                 icmp_sequence)
+                return True
+        return False
+
+    def is_dropped_reply(self, recv_packet: bytes) -> bool:
+        """
+        未匹配上的报文是否计为 reply_dropped：无法解析，或带本次请求的icmp_id但序号对不上的echo响应
+        ★原始套接字会收到本机所有的icmp报文，并发的其他探测的回包不算丢弃，否则N个并发探测会把每个回包多算N-1次
+        """
+        if len(recv_packet) < 28:
+            return True
+        icmp_type, icmp_code, icmp_checksum, icmp_id = struct.unpack_from("bbHH", recv_packet, 20)
+        return icmp_type == ICMP_TYPE_0_ECHO_RESPOND and icmp_id == self.icmp_send_id
+
+    def fill_result(self, recv_packet: bytes, status: PingStatus, rtt_ms: float, icmp_type: int, icmp_code: int,
+                    icmp_checksum: int, icmp_id: int, icmp_sequence: int):
+        self.result.status = status
+        self.result.rtt_ms = rtt_ms
+        self.result.ttl = recv_packet[8]
+        self.result.respond_source_ip_int, self.result.respond_destination_ip_int = struct.unpack_from("!II", recv_packet, 12)
+        self.result.icmp_data_size = len(recv_packet) - 28  # 大小为icmp数据部分的长度
+        self.result.icmp_type = icmp_type
+        self.result.icmp_code = icmp_code
+        self.result.icmp_checksum = icmp_checksum
+        self.result.icmp_id = icmp_id
+        self.result.icmp_sequence = icmp_sequence
+        if self.keep_payload:
+            self.result.icmp_data = recv_packet[28:]
+        self.is_finished = True
+
     @staticmethod
     def generate_icmp_failed_info(icmp_type, icmp_code) -> str:
         if icmp_type == ICMP_TYPE_3_DESTINATION_UNREACHABLE:  # ★终点不可达
@@ -240,7 +555,7 @@ class PingOnePacket:
                 failed_info = f"终点不可达-->communication_administratively_prohibited icmp_type={icmp_type} icmp_code={icmp_code}"
             elif icmp_code == 14:
                 failed_info = f"终点不可达-->host_precedence_violation icmp_type={icmp_type} icmp_code={icmp_code}"
-            elif icmp_code == 13:
+            elif icmp_code == 15:
                 failed_info = f"终点不可达-->precedence_cutoff icmp_type={icmp_type} icmp_code={icmp_code}"
             else:
                 failed_info = f"终点不可达-->UNKNOWN_CODE icmp_type={icmp_type} icmp_code={icmp_code}"
@@ -278,6 +593,713 @@ class PingOnePacket:
         return failed_info
 
 
+class SockaddrIn(ctypes.Structure):
+    _fields_ = [("sin_family", ctypes.c_ushort), ("sin_port", ctypes.c_uint16), ("sin_addr", ctypes.c_uint32),
+                ("sin_zero", ctypes.c_ubyte * 8)]
+
+
+class Iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class Msghdr(ctypes.Structure):
+    _fields_ = [("msg_name", ctypes.c_void_p), ("msg_namelen", ctypes.c_uint32), ("msg_iov", ctypes.POINTER(Iovec)),
+                ("msg_iovlen", ctypes.c_size_t), ("msg_control", ctypes.c_void_p), ("msg_controllen", ctypes.c_size_t),
+                ("msg_flags", ctypes.c_int)]
+
+
+class Mmsghdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", Msghdr), ("msg_len", ctypes.c_uint)]
+
+
+class BatchIcmpIo:
+    """
+    icmp批量收发，Linux下用sendmmsg/recvmmsg一次系统调用收发多个报文（收包缓冲区预先分配好，反复使用），
+    系统不支持或套接字没有fileno()（如模拟套接字）时，退化为逐个sendto/recv，调用方式不变
+    """
+
+    def __init__(self, icmp_socket, batch_size=MMSG_BATCH_SIZE_DEFAULT, is_kernel_timestamp_enabled=False):
+        self.icmp_socket = icmp_socket
+        self.batch_size = batch_size
+        self.is_kernel_timestamp_enabled = is_kernel_timestamp_enabled
+        self.is_mmsg_enabled = HAS_MMSG and batch_size > 1 and hasattr(icmp_socket, "fileno")
+        if not self.is_mmsg_enabled:
+            return
+        self.fd = icmp_socket.fileno()
+        # 等待可读/可写用poll，select()不支持大于等于1024的fd，打开的文件多了就会报ValueError
+        self.recv_poller = select.poll()
+        self.recv_poller.register(self.fd, select.POLLIN)
+        self.send_poller = select.poll()
+        self.send_poller.register(self.fd, select.POLLOUT)
+        # 发包：同一批报文内容相同，只是目的地址不同，所有消息共用1个iovec
+        self.send_packet_buffer = None
+        self.send_iovec = Iovec()
+        self.send_address_array = (SockaddrIn * batch_size)()
+        self.send_msg_array = (Mmsghdr * batch_size)()
+        for index in range(batch_size):
+            self.send_address_array[index].sin_family = socket.AF_INET
+            msg_hdr = self.send_msg_array[index].msg_hdr
+            msg_hdr.msg_name = ctypes.addressof(self.send_address_array[index])
+            msg_hdr.msg_namelen = ctypes.sizeof(SockaddrIn)
+            msg_hdr.msg_iov = ctypes.pointer(self.send_iovec)
+            msg_hdr.msg_iovlen = 1
+        # 收包：每个消息各有1块报文缓冲区及辅助数据缓冲区
+        self.recv_buffer = ctypes.create_string_buffer(batch_size * MMSG_RECV_BUFFER_SIZE)
+        self.recv_control_buffer = ctypes.create_string_buffer(batch_size * MMSG_CONTROL_BUFFER_SIZE)
+        self.recv_iovec_array = (Iovec * batch_size)()
+        self.recv_msg_array = (Mmsghdr * batch_size)()
+        for index in range(batch_size):
+            self.recv_iovec_array[index].iov_base = ctypes.addressof(self.recv_buffer) + index * MMSG_RECV_BUFFER_SIZE
+            self.recv_iovec_array[index].iov_len = MMSG_RECV_BUFFER_SIZE
+            msg_hdr = self.recv_msg_array[index].msg_hdr
+            msg_hdr.msg_iov = ctypes.pointer(self.recv_iovec_array[index])
+            msg_hdr.msg_iovlen = 1
+            msg_hdr.msg_control = ctypes.addressof(self.recv_control_buffer) + index * MMSG_CONTROL_BUFFER_SIZE
+
+    def send_batch(self, icmp_packet: bytes, target_list: list) -> int:
+        """
+        把同一个报文发给 target_list 里的每个目标，target_list 每项为 (ip数值, ip字符串)，
+        返回发送成功的报文数，发送失败（如本机无路由）的目标直接跳过
+        """
+        if not self.is_mmsg_enabled:
+            sent_count = 0
+            for ip_int, target_ip in target_list:
+                try:
+                    self.icmp_socket.sendto(icmp_packet, (target_ip, 0))
+                except OSError:
+                    continue
+                sent_count += 1
+            return sent_count
+        if self.send_packet_buffer is None or self.send_packet_buffer.raw != icmp_packet:
+            self.send_packet_buffer = ctypes.create_string_buffer(icmp_packet, len(icmp_packet))
+            self.send_iovec.iov_base = ctypes.addressof(self.send_packet_buffer)
+            self.send_iovec.iov_len = len(icmp_packet)
+        sent_count = 0
+        for batch_start in range(0, len(target_list), self.batch_size):
+            batch_target_list = target_list[batch_start:batch_start + self.batch_size]
+            for index, (ip_int, target_ip) in enumerate(batch_target_list):
+                self.send_address_array[index].sin_addr = socket.htonl(ip_int)
+            offset = 0
+            while offset < len(batch_target_list):
+                result = LIBC.sendmmsg(self.fd, ctypes.addressof(self.send_msg_array) + offset * ctypes.sizeof(Mmsghdr),
+                                       len(batch_target_list) - offset, 0)
+                if result > 0:
+                    sent_count += result
+                    offset += result
+                    continue
+                error_number = ctypes.get_errno()
+                if error_number in (errno.EAGAIN, errno.EWOULDBLOCK):  # 发送缓冲区满了，等它可写
+                    self.send_poller.poll(1000)
+                elif error_number != errno.EINTR:
+                    offset += 1  # 这个目标发送失败，跳过
+        return sent_count
+
+    def recv_batch(self) -> list:
+        """
+        接收报文，返回列表，每项为 (报文, 收包时刻perf_counter_ns)，一次最多 batch_size 个，
+        在套接字超时时间内没有报文时抛出socket.timeout，与 recv_packet_with_timestamp() 相同
+        """
+        if not self.is_mmsg_enabled:
+            packet_with_timestamp = recv_packet_with_timestamp(self.icmp_socket, self.is_kernel_timestamp_enabled)
+            if METRICS.is_enabled:
+                METRICS.count("packet_received")
+            return [packet_with_timestamp]
+        recv_start_ns = time.perf_counter_ns() if METRICS.is_enabled else 0
+        socket_timeout = self.icmp_socket.gettimeout()
+        if len(self.recv_poller.poll(None if socket_timeout is None else socket_timeout * 1000)) == 0:
+            raise socket.timeout("timed out")
+        for index in range(self.batch_size):
+            self.recv_msg_array[index].msg_hdr.msg_controllen = MMSG_CONTROL_BUFFER_SIZE
+        result = LIBC.recvmmsg(self.fd, ctypes.addressof(self.recv_msg_array), self.batch_size, MSG_DONTWAIT, None)
+        recv_perf_ns = time.perf_counter_ns()
+        if result < 0:
+            error_number = ctypes.get_errno()
+            if error_number in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR):
+                return []
+            raise OSError(error_number, os.strerror(error_number))
+        if METRICS.is_enabled:
+            METRICS.observe(cofmetrics.STAGE_RECV, recv_perf_ns - recv_start_ns)
+            METRICS.count("packet_received", result)
+        realtime_offset_ns = time.time_ns() - time.perf_counter_ns()
+        packet_list = []
+        for index in range(result):
+            recv_packet = ctypes.string_at(self.recv_iovec_array[index].iov_base, self.recv_msg_array[index].msg_len)
+            packet_recv_perf_ns = recv_perf_ns
+            if self.is_kernel_timestamp_enabled:
+                kernel_recv_ns = self.parse_kernel_timestamp_ns(index)
+                if kernel_recv_ns > 0:
+                    packet_recv_perf_ns = kernel_recv_ns - realtime_offset_ns
+                    if METRICS.is_enabled:
+                        METRICS.observe(cofmetrics.STAGE_QUEUE_WAIT, max(recv_perf_ns - packet_recv_perf_ns, 0))
+            packet_list.append((recv_packet, packet_recv_perf_ns))
+        return packet_list
+
+    def parse_kernel_timestamp_ns(self, index: int) -> int:
+        """
+        从第index个消息的辅助数据中取出SO_TIMESTAMPNS时间戳（系统时间，纳秒），没有则返回0
+        """
+        control_data = ctypes.string_at(self.recv_msg_array[index].msg_hdr.msg_control,
+                                        self.recv_msg_array[index].msg_hdr.msg_controllen)
+        size_t_size = ctypes.sizeof(ctypes.c_size_t)
+        cmsg_header_size = (size_t_size + 8 + size_t_size - 1) & ~(size_t_size - 1)  # cmsghdr: cmsg_len, cmsg_level, cmsg_type
+        offset = 0
+        while offset + cmsg_header_size <= len(control_data):
+            cmsg_len = int.from_bytes(control_data[offset:offset + size_t_size], sys.byteorder)
+            cmsg_level, cmsg_type = struct.unpack("ii", control_data[offset + size_t_size:offset + size_t_size + 8])
+            if cmsg_len < cmsg_header_size:
+                break
+            if cmsg_level == socket.SOL_SOCKET and cmsg_type == SO_TIMESTAMPNS and cmsg_len >= cmsg_header_size + 16:
+                tv_sec, tv_nsec = struct.unpack("qq", control_data[offset + cmsg_header_size:offset + cmsg_header_size + 16])
+                return tv_sec * 1000000000 + tv_nsec
+            offset += (cmsg_len + size_t_size - 1) & ~(size_t_size - 1)
+        return 0
+
+
+class PingSweep:
+    """
+    存活扫描（类似fping/zmap），每个目标先只发1个icmp_echo_request报文，之后只对还没回复的目标重发，重发的等待时间逐轮加倍，
+    所有目标共用1个原始套接字，由1个线程收包，不需要为每个目标等待超时，扫描一个/16网段只需几秒
+    用法:
+    sweep = PingSweep(target_ip_list=["10.1.1.1", "10.1.1.2"], timeout=1, retry_count=2)
+    sweep.start()  # 阻塞型
+    sweep.live_ip_set  # 存活的ip集合
+    """
+
+    def __init__(self, target_ip_list=None, timeout=1, retry_count=2, backoff=2.0, rate_pps=0, size=1, ttl=128,
+                 is_random_order=True, seed=None, icmp_send_id=None, live_callback=None, batch_size=MMSG_BATCH_SIZE_DEFAULT,
+                 socket_factory=None):
+        self.target_ip_list = [] if target_ip_list is None else target_ip_list  # 目标ip列表（ipv4地址）
+        self.timeout = timeout  # 第1轮发包后的等待时间，单位：秒，第n轮（从0开始）的等待时间为 timeout*backoff**n
+        self.retry_count = retry_count  # 对没回复的目标最多重发几轮
+        self.backoff = backoff  # 每轮等待时间的倍数
+        self.rate_pps = rate_pps  # 发包速率上限，单位：包/秒，为0时不限速
+        self.size = size  # 发包数据大小，单位：字节
+        self.ttl = ttl
+        self.is_random_order = is_random_order  # 置True时每轮按伪随机顺序发包，避免连续的包都打到同一网段的路由器上而被icmp限速
+        self.seed = seed  # 伪随机顺序的种子，为None时每次扫描的顺序都不同
+        self.live_ip_set = set()  # 扫描结果，存活（有echo响应）的ip
+        self.rtt_ms_dict = {}  # key为存活的ip，value为其响应的RTT时间，单位：毫秒
+        self.result_batch = PingResultBatch()  # 每个目标1条紧凑记录，存活的按回包先后追加，扫描结束时再追加没回复的（TIMEOUT）
+        self.sent_count = 0  # 总共发出的报文数
+        self.round_count = 0  # 实际进行了几轮发包
+        self.is_finished = False
+        self.is_stopped = False
+        # 本次扫描所有报文共用此id，用于识别回包，默认取随机值，多进程扫描时由主进程为各进程分配不同的id
+        self.icmp_send_id = 0xFFFF & random.randint(0, 0xFFFF) if icmp_send_id is None else icmp_send_id
+        self.live_callback = live_callback  # 每发现1个存活ip就调用一次 live_callback(target_ip, rtt_ms) ，在收包线程中调用
+        self.icmp_socket = None
+        self.recv_thread = None
+        self.pending_ip_int_dict = {}  # 还没回复的目标，key为ip数值，value为ip字符串
+        # key为 (ip数值, 轮次即icmp_sequence)，value为该轮发包的时刻（time.perf_counter_ns()），
+        # 按回包的序号查找，上一轮的迟到回包不会被算成从重发时刻开始计时
+        self.send_time_dict = {}
+        self.is_kernel_timestamp_enabled = False
+        self.batch_size = batch_size  # 批量收发的报文数量（sendmmsg/recvmmsg），为1时逐个收发
+        self.batch_io = None
+        self.lock = threading.Lock()
+        self.socket_factory = socket.socket if socket_factory is None else socket_factory
+
+    def generate_icmp_packet(self, icmp_sequence: int) -> bytes:
+        """
+        同一轮发给所有目标的报文完全相同，每轮只需生成1次
+        """
+        icmp_data = b'\x00' * self.size
+        icmp_temp_packet = struct.pack('bbHHH', ICMP_TYPE_8_ECHO_REQUEST, 0, 0, self.icmp_send_id, icmp_sequence) + icmp_data
+        icmp_checksum = PingOnePacket.generate_icmp_checksum(icmp_temp_packet)
+        return struct.pack('bbHHH', ICMP_TYPE_8_ECHO_REQUEST, 0, icmp_checksum, self.icmp_send_id, icmp_sequence) + icmp_data
+
+    def start(self):
+        self.live_ip_set = set()
+        self.rtt_ms_dict = {}
+        self.result_batch = PingResultBatch()
+        self.sent_count = 0
+        self.round_count = 0
+        self.is_finished = False
+        self.is_stopped = False
+        self.pending_ip_int_dict = {}
+        for target_ip in self.target_ip_list:
+            is_ip, ip_int = cofnet.parse_ip_addr(target_ip)
+            if not is_ip:
+                raise Exception("不是正确的ipv4地址", target_ip)
+            self.pending_ip_int_dict[ip_int] = target_ip
+        self.send_time_dict = {}
+        self.icmp_socket = self.socket_factory(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+        self.icmp_socket.settimeout(0.1)  # 收包线程每0.1秒检查一次是否该结束
+        self.icmp_socket.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, self.ttl)
+        try:
+            self.icmp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SWEEP_RECV_BUFFER_SIZE)
+        except OSError:
+            pass  # 设置不了就用系统默认大小
+        self.is_kernel_timestamp_enabled = enable_kernel_timestamp(self.icmp_socket)
+        self.batch_io = BatchIcmpIo(self.icmp_socket, self.batch_size, self.is_kernel_timestamp_enabled)
+        self.recv_thread = threading.Thread(target=self.recv_icmp_packet, daemon=True)
+        self.recv_thread.start()
+        try:
+            for round_index in range(self.retry_count + 1):
+                with self.lock:
+                    round_ip_int_list = list(self.pending_ip_int_dict)
+                if len(round_ip_int_list) == 0 or self.is_stopped:
+                    break
+                self.round_count += 1
+                build_start_ns = time.perf_counter_ns() if METRICS.is_enabled else 0
+                icmp_packet = self.generate_icmp_packet(round_index)
+                if METRICS.is_enabled:
+                    METRICS.observe(cofmetrics.STAGE_BUILD, time.perf_counter_ns() - build_start_ns)
+                self.send_round(round_ip_int_list, icmp_packet, round_index)
+                # 等待本轮回包，所有目标都回复了就提前结束
+                wait_until = time.time() + self.timeout * self.backoff ** round_index
+                while time.time() < wait_until and len(self.pending_ip_int_dict) != 0 and not self.is_stopped:
+                    time.sleep(min(0.01, max(wait_until - time.time(), 0)))
+        finally:
+            self.is_finished = True
+            self.recv_thread.join()
+            self.icmp_socket.close()
+            for ip_int in self.pending_ip_int_dict:
+                self.result_batch.append(ip_int, PingStatus.TIMEOUT)
+
+    def send_round(self, round_ip_int_list: list, icmp_packet: bytes, icmp_sequence: int):
+        round_start_time = time.time()
+        if self.is_random_order:
+            round_index_iter = cofnet.CyclicPermutation(0, len(round_ip_int_list) - 1, self.seed)
+        else:
+            round_index_iter = range(len(round_ip_int_list))
+        # 攒够一批再发，速率限制按批检查（逐个收发时每64个包检查一次）
+        batch_size = self.batch_size if self.batch_io.is_mmsg_enabled else 64
+        batch_target_list = []
+        for index, round_index in enumerate(round_index_iter):
+            if self.is_stopped:
+                return
+            ip_int = round_ip_int_list[round_index]
+            target_ip = self.pending_ip_int_dict.get(ip_int)
+            if target_ip is not None:  # 为None表示上一轮的迟到回包已到达
+                batch_target_list.append((ip_int, target_ip))
+            if len(batch_target_list) < batch_size and index != len(round_ip_int_list) - 1:
+                continue
+            if self.rate_pps > 0:  # 超速则等一等
+                ahead_s = round_start_time + (index + 1 - len(batch_target_list)) / self.rate_pps - time.time()
+                if ahead_s > 0:
+                    time.sleep(ahead_s)
+            send_perf_ns = time.perf_counter_ns()
+            with self.lock:
+                for ip_int, target_ip in batch_target_list:
+                    self.send_time_dict[(ip_int, icmp_sequence)] = send_perf_ns
+            batch_sent_count = self.batch_io.send_batch(icmp_packet, batch_target_list)  # 发送失败（如本机无路由）的下一轮再试
+            self.sent_count += batch_sent_count
+            if METRICS.is_enabled:
+                METRICS.observe(cofmetrics.STAGE_SEND, time.perf_counter_ns() - send_perf_ns)
+                METRICS.count("packet_sent", batch_sent_count)
+            batch_target_list = []
+
+    def recv_icmp_packet(self):
+        while not self.is_finished:
+            try:
+                packet_list = self.batch_io.recv_batch()
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            if not METRICS.is_enabled:
+                for recv_packet, recv_perf_ns in packet_list:
+                    self.handle_recv_packet(recv_packet, recv_perf_ns)
+                continue
+            parse_start_ns = time.perf_counter_ns()
+            matched_count = 0
+            dropped_count = 0
+            for recv_packet, recv_perf_ns in packet_list:
+                if self.handle_recv_packet(recv_packet, recv_perf_ns):
+                    matched_count += 1
+                elif self.is_dropped_reply(recv_packet):
+                    dropped_count += 1
+            METRICS.observe(cofmetrics.STAGE_PARSE, time.perf_counter_ns() - parse_start_ns)
+            METRICS.count("reply_matched", matched_count)
+            METRICS.count("reply_dropped", dropped_count)
+
+    def handle_recv_packet(self, recv_packet: bytes, recv_perf_ns: int) -> bool:
+        """
+        处理收到的1个报文，是某个目标的echo响应则记录结果并返回True，否则返回False
+        """
+        if len(recv_packet) < 20:
+            return False
+        ipv4_header_len = (recv_packet[0] & 0x0F) * 4
+        if len(recv_packet) < ipv4_header_len + 8:
+            return False
+        icmp_type, icmp_code, icmp_checksum, icmp_id, icmp_sequence = struct.unpack(
+            "bbHHH", recv_packet[ipv4_header_len:ipv4_header_len + 8])
+        if icmp_type != ICMP_TYPE_0_ECHO_RESPOND or icmp_code != 0 or icmp_id != self.icmp_send_id:
+            return False
+        source_ip_int = struct.unpack("!I", recv_packet[12:16])[0]
+        with self.lock:
+            send_perf_ns = self.send_time_dict.get((source_ip_int, icmp_sequence))
+            if send_perf_ns is None:
+                return False  # 没有向它发过此序号的报文，如其他探测程序恰好用了相同的icmp_id
+            target_ip = self.pending_ip_int_dict.pop(source_ip_int, None)
+            if target_ip is None:
+                return False  # 不是目标，或已经回复过了
+            self.live_ip_set.add(target_ip)
+            rtt_ms = (recv_perf_ns - send_perf_ns) / 1000000
+            self.rtt_ms_dict[target_ip] = rtt_ms
+            self.result_batch.append(source_ip_int, PingStatus.SUCCESS, rtt_ms, recv_packet[8], ICMP_TYPE_0_ECHO_RESPOND, 0,
+                                     source_ip_int)
+        if self.live_callback is not None:
+            self.live_callback(target_ip, rtt_ms)
+        return True
+
+    def is_dropped_reply(self, recv_packet: bytes) -> bool:
+        """
+        handle_recv_packet() 未匹配上的报文是否计为 reply_dropped：无法解析，或带本次扫描icmp_id的echo响应（序号对不上或重复）
+        本机其他程序、其他分片进程的icmp报文不计入
+        """
+        if len(recv_packet) < 20:
+            return True
+        ipv4_header_len = (recv_packet[0] & 0x0F) * 4
+        if len(recv_packet) < ipv4_header_len + 8:
+            return True
+        icmp_type, icmp_code, icmp_checksum, icmp_id = struct.unpack("bbHH", recv_packet[ipv4_header_len:ipv4_header_len + 6])
+        return icmp_type == ICMP_TYPE_0_ECHO_RESPOND and icmp_id == self.icmp_send_id
+
+    def stop(self):
+        self.is_stopped = True
+
+
+def run_sweep_shard(shard_index: int, shard_ip_list: list, icmp_send_id: int, sweep_kwargs: dict, result_queue,
+                    batch_size=256, flush_interval_s=0.2):
+    """
+    ShardedPingSweep 的工作进程入口，在本进程内用自己的套接字跑一个 PingSweep ，
+    存活结果攒成一批再放入 result_queue ，每项为 ("live", [(ip, rtt_ms), ...]) ，
+    结束时放入 ("done", shard_index, 发包数, 轮数, 本分片 PingResultBatch 的buffer)，
+    扫描出错时放入 ("error", shard_index, 异常信息) ，不再放入结束消息
+    """
+    live_batch_list = []
+    last_flush_time = time.time()
+    batch_lock = threading.Lock()
+
+    def on_live(target_ip, rtt_ms):
+        nonlocal last_flush_time
+        with batch_lock:
+            live_batch_list.append((target_ip, rtt_ms))
+            if len(live_batch_list) >= batch_size or time.time() - last_flush_time >= flush_interval_s:
+                result_queue.put(("live", live_batch_list[:]))
+                live_batch_list.clear()
+                last_flush_time = time.time()
+
+    try:
+        sweep = PingSweep(target_ip_list=shard_ip_list, icmp_send_id=icmp_send_id, live_callback=on_live, **sweep_kwargs)
+        sweep.start()
+    except Exception as e:
+        result_queue.put(("error", shard_index, repr(e)))
+        raise
+    finally:
+        with batch_lock:
+            if len(live_batch_list) != 0:
+                result_queue.put(("live", live_batch_list[:]))
+                live_batch_list.clear()
+    result_queue.put(("done", shard_index, sweep.sent_count, sweep.round_count, bytes(sweep.result_batch.buffer)))
+
+
+class ShardedPingSweep:
+    """
+    多进程存活扫描，把目标列表及icmp_id空间平均分给 process_num 个工作进程，
+    每个进程有自己的原始套接字及收发线程（见 PingSweep），不受单个进程GIL的限制，
+    各进程发现的存活ip通过队列汇总到本进程，结果属性与 PingSweep 相同
+    用法:
+    sweep = ShardedPingSweep(target_ip_list=ip_list, process_num=4, timeout=1, retry_count=2)
+    sweep.start()  # 阻塞型
+    sweep.live_ip_set
+    ★原始套接字会收到本机所有的icmp回包，各进程只认 icmp_id % process_num == 进程序号 的回包，互不干扰
+    ★工作进程出错或异常退出时，该分片的结果不完整，分片序号及原因记录在 failed_shard_dict 中，扫描结束后需检查它是否为空，
+    这种分片的目标在 result_batch 里没有记录，在 live_ip_set 里只有出错前已发现的存活ip
+    """
+
+    def __init__(self, target_ip_list=None, process_num=0, timeout=1, retry_count=2, backoff=2.0, rate_pps=0, size=1, ttl=128,
+                 is_random_order=True, seed=None, live_callback=None, socket_factory=None):
+        self.target_ip_list = [] if target_ip_list is None else target_ip_list
+        self.process_num = multiprocessing.cpu_count() if process_num <= 0 else process_num  # 为0时取cpu核数
+        self.timeout = timeout
+        self.retry_count = retry_count
+        self.backoff = backoff
+        self.rate_pps = rate_pps  # 所有进程合计的发包速率上限，单位：包/秒，为0时不限速
+        self.size = size
+        self.ttl = ttl
+        self.is_random_order = is_random_order
+        self.seed = seed
+        self.live_callback = live_callback  # 每收到1个存活ip就调用一次 live_callback(target_ip, rtt_ms) ，在本进程中调用
+        self.socket_factory = socket_factory  # 使用fork启动工作进程，所以可以传入不能pickle的模拟套接字工厂
+        self.live_ip_set = set()
+        self.rtt_ms_dict = {}
+        self.result_batch = PingResultBatch()  # 与 PingSweep.result_batch 相同，各分片正常结束时把自己的记录整块追加进来
+        self.sent_count = 0
+        self.round_count = 0
+        self.failed_shard_dict = {}  # 没有正常结束的分片，key为分片序号（第i个进程扫描 target_ip_list[i::进程数]），value为原因
+        self.is_finished = False
+
+    def start(self):
+        self.live_ip_set = set()
+        self.rtt_ms_dict = {}
+        self.result_batch = PingResultBatch()
+        self.sent_count = 0
+        self.round_count = 0
+        self.failed_shard_dict = {}
+        self.is_finished = False
+        process_num = max(min(self.process_num, len(self.target_ip_list)), 1)
+        # 随机选取icmp_id的起点，第i个进程的id满足 id % process_num == i
+        icmp_id_base = random.randint(0, 0xFFFF // process_num - 1) * process_num
+        context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else multiprocessing
+        result_queue = context.Queue()
+        process_list = []
+        for shard_index in range(process_num):
+            sweep_kwargs = {"timeout": self.timeout, "retry_count": self.retry_count, "backoff": self.backoff,
+                            "rate_pps": self.rate_pps / process_num, "size": self.size, "ttl": self.ttl,
+                            "is_random_order": self.is_random_order,
+                            "seed": None if self.seed is None else self.seed + shard_index,
+                            "socket_factory": self.socket_factory}
+            process = context.Process(target=run_sweep_shard, daemon=True,
+                                      args=(shard_index, self.target_ip_list[shard_index::process_num],
+                                            icmp_id_base + shard_index, sweep_kwargs, result_queue))
+            process.start()
+            process_list.append(process)
+        done_shard_index_set = set()
+        shard_error_dict = {}  # key为分片序号，value为工作进程报告的异常信息
+        while len(done_shard_index_set) + len(shard_error_dict) < process_num:
+            try:
+                message = result_queue.get(timeout=0.5)
+            except queue.Empty:
+                if all(not process.is_alive() for process in process_list) and result_queue.empty():
+                    break  # 有工作进程异常退出，没有发送结束消息
+                continue
+            if message[0] == "live":
+                for target_ip, rtt_ms in message[1]:
+                    self.live_ip_set.add(target_ip)
+                    self.rtt_ms_dict[target_ip] = rtt_ms
+                    if self.live_callback is not None:
+                        self.live_callback(target_ip, rtt_ms)
+            elif message[0] == "error":
+                shard_error_dict[message[1]] = message[2]
+            else:
+                done_shard_index_set.add(message[1])
+                self.result_batch.buffer += message[4]
+                self.sent_count += message[2]
+                self.round_count = max(self.round_count, message[3])
+        for shard_index, process in enumerate(process_list):
+            process.join()
+            if shard_index in done_shard_index_set:
+                continue
+            if shard_index in shard_error_dict:
+                self.failed_shard_dict[shard_index] = shard_error_dict[shard_index]
+            else:
+                self.failed_shard_dict[shard_index] = f"工作进程异常退出，exitcode={process.exitcode}"
+            LOGGER.warning("ShardedPingSweep.start: 分片%s没有正常结束，结果不完整 %s", shard_index,
+                           self.failed_shard_dict[shard_index])
+        self.is_finished = True
+
+
+class PathMtuTarget:
+    """
+    单个目标的路径MTU搜索状态，MTU指整个ip报文的长度（ip头20字节+icmp头8字节+数据）
+    """
+
+    def __init__(self, target_ip="", ip_int=0, min_mtu=IPV4_MTU_MIN, max_mtu=1500, retry_count=1):
+        self.target_ip = target_ip
+        self.ip_int = ip_int
+        self.pass_mtu = min_mtu - 1  # 已确认能通过的最大MTU，小于min_mtu表示还没有能通过的
+        self.fail_mtu = max_mtu + 1  # 已确认不能通过的最小MTU
+        self.next_hop_mtu = 0  # 路由器在“需要分片”差错报文中告知的下一跳MTU，0表示没收到
+        self.retry_left = retry_count  # 整轮都超时时还可以重试几轮
+        self.round_result_list = []  # 本轮各探测包的结果，每项为 (mtu, 结果)，结果为 "pass" "frag_needed" "timeout" "unreachable"
+
+    def is_done(self) -> bool:
+        return self.fail_mtu - self.pass_mtu <= 1
+
+
+class PathMtuDiscovery:
+    """
+    路径MTU探测，对每个目标用设置了DF位的echo请求做多路搜索：每轮在 (能通过的最大MTU, 不能通过的最小MTU) 区间内
+    同时发出 parallel_probe_num 个不同大小的探测包，收到echo响应的为能通过，收到 type=3 code=4 差错报文或本机sendto报EMSGSIZE的为不能通过，
+    差错报文带有下一跳MTU时，下一轮直接验证该值，一般2轮即可得出结果；所有目标同时进行，共用1个原始套接字
+    用法:
+    pmtu = PathMtuDiscovery(target_ip_list=["10.1.1.1", "10.2.2.2"], max_mtu=1500)
+    pmtu.start()  # 阻塞型
+    pmtu.mtu_dict  # {ip: 路径MTU} ，目标不可达时为0
+    """
+
+    def __init__(self, target_ip_list=None, min_mtu=IPV4_MTU_MIN, max_mtu=1500, parallel_probe_num=4, timeout=1,
+                 retry_count=1, ttl=128, socket_factory=None):
+        self.target_ip_list = [] if target_ip_list is None else target_ip_list
+        self.min_mtu = min_mtu
+        self.max_mtu = max_mtu  # 一般为本机出接口的MTU
+        self.parallel_probe_num = parallel_probe_num  # 每个目标每轮同时发出的探测包数量
+        self.timeout = timeout  # 每轮等待回包的时间，单位：秒
+        self.retry_count = retry_count  # 某目标整轮都没有回包时，重试几轮，重试完仍没回包的大小视为不能通过（黑洞路由）
+        self.ttl = ttl
+        self.mtu_dict = {}  # 探测结果，key为目标ip，value为路径MTU，目标不可达时为0
+        self.next_hop_mtu_dict = {}  # key为目标ip，value为路由器告知的下一跳MTU（收到过“需要分片”差错报文的目标才有）
+        self.probe_count = 0  # 总共发出的探测包数
+        self.round_count = 0
+        self.icmp_send_id = 0xFFFF & random.randint(0, 0xFFFF)
+        self.icmp_socket = None
+        self.recv_thread = None
+        self.is_finished = False
+        self.probe_dict = {}  # 本轮在途的探测包，key为icmp_sequence，value为 (PathMtuTarget, mtu)
+        self.next_sequence = 0
+        self.lock = threading.Lock()
+        self.socket_factory = socket.socket if socket_factory is None else socket_factory
+
+    def generate_icmp_packet(self, icmp_sequence: int, mtu: int) -> bytes:
+        icmp_data = b'\x00' * (mtu - 28)
+        icmp_temp_packet = struct.pack('bbHHH', ICMP_TYPE_8_ECHO_REQUEST, 0, 0, self.icmp_send_id, icmp_sequence) + icmp_data
+        icmp_checksum = PingOnePacket.generate_icmp_checksum(icmp_temp_packet)
+        return struct.pack('bbHHH', ICMP_TYPE_8_ECHO_REQUEST, 0, icmp_checksum, self.icmp_send_id, icmp_sequence) + icmp_data
+
+    @staticmethod
+    def get_round_mtu_list(pmtu_target: PathMtuTarget, parallel_probe_num: int) -> list:
+        """
+        本轮要探测的MTU：把区间 (pass_mtu, fail_mtu) 等分，有下一跳MTU提示时优先验证它
+        """
+        low = pmtu_target.pass_mtu
+        high = pmtu_target.fail_mtu
+        mtu_set = set()
+        if low < pmtu_target.next_hop_mtu < high:
+            mtu_set.add(pmtu_target.next_hop_mtu)
+        probe_num = min(parallel_probe_num, high - low - 1)
+        for index in range(1, probe_num + 1):
+            if len(mtu_set) >= probe_num:
+                break
+            mtu_set.add(low + (high - low) * index // (probe_num + 1))
+        return sorted(mtu for mtu in mtu_set if low < mtu < high)
+
+    def start(self):
+        self.mtu_dict = {}
+        self.next_hop_mtu_dict = {}
+        self.probe_count = 0
+        self.round_count = 0
+        self.is_finished = False
+        pmtu_target_list = []
+        for target_ip in self.target_ip_list:
+            is_ip, ip_int = cofnet.parse_ip_addr(target_ip)
+            if not is_ip:
+                raise Exception("不是正确的ipv4地址", target_ip)
+            pmtu_target_list.append(PathMtuTarget(target_ip, ip_int, self.min_mtu, self.max_mtu, self.retry_count))
+        self.icmp_socket = self.socket_factory(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+        self.icmp_socket.settimeout(0.1)
+        self.icmp_socket.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, self.ttl)
+        if not set_dont_frag(self.icmp_socket):
+            self.icmp_socket.close()
+            raise Exception("本系统不支持设置ipv4不分片（DF位），无法探测路径MTU")
+        self.recv_thread = threading.Thread(target=self.recv_icmp_packet, daemon=True)
+        self.recv_thread.start()
+        try:
+            active_target_list = [pmtu_target for pmtu_target in pmtu_target_list if not pmtu_target.is_done()]
+            while len(active_target_list) != 0:
+                self.round_count += 1
+                self.send_round(active_target_list)
+                wait_until = time.time() + self.timeout
+                while time.time() < wait_until and len(self.probe_dict) != 0:
+                    time.sleep(0.005)
+                with self.lock:
+                    for pmtu_target, mtu in self.probe_dict.values():  # 到时没有回包的
+                        pmtu_target.round_result_list.append((mtu, "timeout"))
+                    self.probe_dict = {}
+                for pmtu_target in active_target_list:
+                    self.update_target(pmtu_target)
+                active_target_list = [pmtu_target for pmtu_target in active_target_list if not pmtu_target.is_done()]
+        finally:
+            self.is_finished = True
+            self.recv_thread.join()
+            self.icmp_socket.close()
+        for pmtu_target in pmtu_target_list:
+            self.mtu_dict[pmtu_target.target_ip] = pmtu_target.pass_mtu if pmtu_target.pass_mtu >= self.min_mtu else 0
+            if pmtu_target.next_hop_mtu != 0:
+                self.next_hop_mtu_dict[pmtu_target.target_ip] = pmtu_target.next_hop_mtu
+
+    def send_round(self, active_target_list: list):
+        for pmtu_target in active_target_list:
+            pmtu_target.round_result_list = []
+            for mtu in self.get_round_mtu_list(pmtu_target, self.parallel_probe_num):
+                with self.lock:
+                    icmp_sequence = self.next_sequence
+                    self.next_sequence = (self.next_sequence + 1) & 0xFFFF
+                    self.probe_dict[icmp_sequence] = (pmtu_target, mtu)
+                try:
+                    self.icmp_socket.sendto(self.generate_icmp_packet(icmp_sequence, mtu), (pmtu_target.target_ip, 0))
+                    self.probe_count += 1
+                except OSError as err:
+                    with self.lock:
+                        self.probe_dict.pop(icmp_sequence, None)
+                    # EMSGSIZE：超过了本机已知的路径MTU（出接口MTU或之前收到过的“需要分片”报文）
+                    pmtu_target.round_result_list.append((mtu, "frag_needed" if err.errno == errno.EMSGSIZE else "unreachable"))
+
+    def update_target(self, pmtu_target: PathMtuTarget):
+        """
+        根据本轮结果收窄区间：能通过的抬高下限，需要分片的压低上限；
+        整轮只有超时时先重试，重试用完后把超时的大小当作不能通过（黑洞路由会静默丢弃大包）
+        """
+        is_informative = False
+        for mtu, result in pmtu_target.round_result_list:
+            if result == "pass":
+                pmtu_target.pass_mtu = max(pmtu_target.pass_mtu, mtu)
+                is_informative = True
+            elif result == "frag_needed":
+                pmtu_target.fail_mtu = min(pmtu_target.fail_mtu, mtu)
+                is_informative = True
+        if pmtu_target.next_hop_mtu != 0 and pmtu_target.pass_mtu < pmtu_target.next_hop_mtu < pmtu_target.fail_mtu:
+            pmtu_target.fail_mtu = pmtu_target.next_hop_mtu + 1
+        if pmtu_target.pass_mtu >= pmtu_target.fail_mtu:  # 同一轮里大包通过、小包却需要分片（路由变化），以通过的为准
+            pmtu_target.fail_mtu = pmtu_target.pass_mtu + 1
+        if is_informative:  # 同一轮里其他大小的超时可能只是丢包，不作判断，下一轮区间收窄后会再探测
+            pmtu_target.retry_left = self.retry_count
+            return
+        if pmtu_target.retry_left > 0:
+            pmtu_target.retry_left -= 1
+            return
+        for mtu, result in sorted(pmtu_target.round_result_list):
+            if result in ("timeout", "unreachable") and mtu > pmtu_target.pass_mtu:
+                pmtu_target.fail_mtu = min(pmtu_target.fail_mtu, mtu)
+                break  # 只压低到超时的最小那个，更大的留给下一轮
+
+    def recv_icmp_packet(self):
+        while not self.is_finished:
+            try:
+                recv_packet = self.icmp_socket.recv(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            ipv4_header_len = (recv_packet[0] & 0x0F) * 4
+            if len(recv_packet) < ipv4_header_len + 8:
+                continue
+            icmp_type, icmp_code = recv_packet[ipv4_header_len], recv_packet[ipv4_header_len + 1]
+            if icmp_type == ICMP_TYPE_0_ECHO_RESPOND:
+                icmp_id, icmp_sequence = struct.unpack("HH", recv_packet[ipv4_header_len + 4:ipv4_header_len + 8])
+                result = "pass"
+                next_hop_mtu = 0
+            elif icmp_type == ICMP_TYPE_3_DESTINATION_UNREACHABLE:
+                # 差错报文带回原报文的ip头及icmp头
+                carrier_ipv4_offset = ipv4_header_len + 8
+                if len(recv_packet) < carrier_ipv4_offset + 20:
+                    continue
+                carrier_icmp_offset = carrier_ipv4_offset + (recv_packet[carrier_ipv4_offset] & 0x0F) * 4
+                if len(recv_packet) < carrier_icmp_offset + 8 or recv_packet[carrier_icmp_offset] != ICMP_TYPE_8_ECHO_REQUEST:
+                    continue
+                icmp_id, icmp_sequence = struct.unpack("HH", recv_packet[carrier_icmp_offset + 4:carrier_icmp_offset + 8])
+                if icmp_code == ICMP_CODE_4_FRAGMENTATION_NEEDED:
+                    result = "frag_needed"
+                    next_hop_mtu = struct.unpack("!H", recv_packet[ipv4_header_len + 6:ipv4_header_len + 8])[0]
+                else:
+                    result = "unreachable"
+                    next_hop_mtu = 0
+            else:
+                continue
+            if icmp_id != self.icmp_send_id:
+                continue
+            with self.lock:
+                probe = self.probe_dict.pop(icmp_sequence, None)
+                if probe is None:
+                    continue  # 上一轮的迟到回包
+                pmtu_target, mtu = probe
+                pmtu_target.round_result_list.append((mtu, result))
+                if next_hop_mtu >= IPV4_MTU_MIN:
+                    pmtu_target.next_hop_mtu = next_hop_mtu if pmtu_target.next_hop_mtu == 0 else min(pmtu_target.next_hop_mtu, next_hop_mtu)
+
+
 class PingIPv6OnePacket:
     def __init__(self):
         pass
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# coding=utf-8
+# module name: cofrangedb
+# author: Cof-Lee <cof8007@gmail.com>
+# this module uses the GPL-3.0 open source protocol
+# update: 2024-11-30
+
+"""
+ip地址范围数据库：把“地址范围-->元数据（如ASN、站点、归属）”的csv编译为紧凑的二进制文件，查询时用mmap映射，二分查找，
+打开文件时不做任何解析，多个进程打开同一文件时共享系统的页缓存，运行方式:
+python3 cofrangedb.py compile ranges.csv ranges.db                    编译ipv4数据库
+python3 cofrangedb.py compile ranges6.csv ranges6.db --ipv6           编译ipv6数据库
+python3 cofrangedb.py query ranges.db 10.1.1.1 10.2.2.2               查询
+
+★csv要求有表头，地址范围取自 cidr 列（如 10.1.0.0/16），或 start 及 end 两列（首尾ip，含两端），列名可通过参数指定，
+其余各列（或指定的列）为元数据；地址族不符的行跳过，地址范围不能重叠（重叠时编译报错）
+★文件格式（各数组按本机字节序存放，文件头记录了字节序，与本机不同时打开会报错，需在本机重新编译）:
+文件头 | 起始数值数组 | 结束数值数组 | 元数据偏移数组 | 字符串表
+ipv4的起始/结束数值为uint32数组，用memoryview直接按下标访问；ipv6为16字节大端记录，按字节比较即按数值比较；
+字符串表中每项为 uint32长度 + utf8文本（各字段以\\x1f分隔），相同的元数据只存1份，第0项为字段名
+"""
+
+import io
+import sys
+import csv
+import mmap
+import array
+import bisect
+import struct
+import argparse
+import cofnet
+
+RANGE_DB_MAGIC = b"COFRDB01"
+RANGE_DB_VERSION = 1
+# 文件头: 魔数, 版本, 地址位数, 字节序（0为小端 1为大端）, 记录数, 起始数值数组偏移, 结束数值数组偏移, 元数据偏移数组偏移, 字符串表偏移, 字符串表大小
+RANGE_DB_HEADER_STRUCT = struct.Struct("<8sIIIxxxxQQQQQQ")
+RANGE_DB_FIELD_SEPARATOR = "\x1f"
+IPV6_RECORD_SIZE = 16
+
+
+def local__align8(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def parse_range_row(row: dict, address_bits: int, cidr_column: str, start_column: str, end_column: str) -> tuple:
+    """
+    从csv的一行中解析地址范围，返回三元组 (是否解析成功, 起始数值, 结束数值)，不报错，不抛出异常
+    """
+    if cidr_column in row:
+        cidr = row[cidr_column].strip()
+        if address_bits == 32:
+            is_ok, ip_int, maskint = cofnet.parse_ip_with_maskint(cidr)
+        else:
+            is_ok, ip_int, maskint = cofnet.parse_ipv6_with_prefix_len(cidr)
+        if not is_ok:
+            return False, 0, 0
+        host_mask = (1 << (address_bits - maskint)) - 1
+        return True, ip_int & ~host_mask, ip_int | host_mask
+    parse_func = cofnet.parse_ip_addr if address_bits == 32 else cofnet.parse_ipv6_addr
+    is_start_ok, start_int = parse_func(row.get(start_column, "").strip())
+    is_end_ok, end_int = parse_func(row.get(end_column, "").strip())
+    if not is_start_ok or not is_end_ok or start_int > end_int:
+        return False, 0, 0
+    return True, start_int, end_int
+
+
+def compile_range_db(csv_path: str, db_path: str, address_bits=32, cidr_column="cidr", start_column="start", end_column="end",
+                     value_column_list=None) -> dict:
+    """
+    把csv编译为范围数据库文件，返回统计信息 {"record_count": 记录数, "skipped_count": 跳过的行数, "value_count": 不同元数据的数量}
+    value_column_list 为None时，除地址范围列以外的所有列都作为元数据
+    【输入错误或地址范围有重叠时会抛出Exception异常】
+    """
+    if address_bits not in (32, 128):
+        raise Exception("地址位数只能为32或128", address_bits)
+    with open(csv_path, "r", encoding="utf8", newline="") as f:
+        reader = csv.DictReader(f)
+        header_list = reader.fieldnames if reader.fieldnames is not None else []
+        if cidr_column not in header_list and (start_column not in header_list or end_column not in header_list):
+            raise Exception("csv表头中找不到地址范围列", cidr_column, start_column, end_column)
+        if value_column_list is None:
+            value_column_list = [column for column in header_list if column not in (cidr_column, start_column, end_column)]
+        for column in value_column_list:
+            if column not in header_list:
+                raise Exception("csv表头中找不到元数据列", column)
+        value_index_dict = {}  # key为元数据文本，value为其编号，相同的元数据只存1份
+        range_list = []  # 每项为 (起始数值, 结束数值, 元数据编号)
+        skipped_count = 0
+        for row in reader:
+            is_ok, start_int, end_int = parse_range_row(row, address_bits, cidr_column, start_column, end_column)
+            if not is_ok:
+                skipped_count += 1
+                continue
+            value = RANGE_DB_FIELD_SEPARATOR.join((row.get(column) or "") for column in value_column_list)
+            range_list.append((start_int, end_int, value_index_dict.setdefault(value, len(value_index_dict))))
+    range_list.sort()
+    for index in range(1, len(range_list)):
+        if range_list[index][0] <= range_list[index - 1][1]:
+            raise Exception("地址范围有重叠", range_list[index - 1][:2], range_list[index][:2])
+    # 字符串表：第0项为字段名，之后按编号依次存放各元数据
+    string_table = io.BytesIO()
+    value_offset_list = []
+    for text in [RANGE_DB_FIELD_SEPARATOR.join(value_column_list)] + list(value_index_dict):
+        value_offset_list.append(string_table.tell())
+        data = text.encode("utf8")
+        string_table.write(struct.pack("<I", len(data)))
+        string_table.write(data)
+    record_count = len(range_list)
+    if address_bits == 32:
+        start_data = array.array("I", [item[0] for item in range_list]).tobytes()
+        end_data = array.array("I", [item[1] for item in range_list]).tobytes()
+    else:
+        start_data = b"".join([item[0].to_bytes(IPV6_RECORD_SIZE, "big") for item in range_list])
+        end_data = b"".join([item[1].to_bytes(IPV6_RECORD_SIZE, "big") for item in range_list])
+    offset_data = array.array("I", [value_offset_list[item[2] + 1] for item in range_list]).tobytes()
+    start_offset = local__align8(RANGE_DB_HEADER_STRUCT.size)
+    end_offset = local__align8(start_offset + len(start_data))
+    value_offset_offset = local__align8(end_offset + len(end_data))
+    string_table_offset = local__align8(value_offset_offset + len(offset_data))
+    string_table_data = string_table.getvalue()
+    with open(db_path, "wb") as f:
+        f.write(RANGE_DB_HEADER_STRUCT.pack(RANGE_DB_MAGIC, RANGE_DB_VERSION, address_bits, 0 if sys.byteorder == "little" else 1,
+                                            record_count, start_offset, end_offset, value_offset_offset, string_table_offset,
+                                            len(string_table_data)))
+        for section_offset, section_data in ((start_offset, start_data), (end_offset, end_data),
+                                             (value_offset_offset, offset_data), (string_table_offset, string_table_data)):
+            f.write(b"\x00" * (section_offset - f.tell()))
+            f.write(section_data)
+    return {"record_count": record_count, "skipped_count": skipped_count, "value_count": len(value_index_dict)}
+
+
+class RangeDb:
+    """
+    范围数据库的查询，打开时只校验文件头，数据都在mmap里，按需由系统分页读入
+    用法:
+    with RangeDb("ranges.db") as db:
+        db.field_list               # 元数据的字段名列表
+        db.lookup("10.1.1.1")       # 命中时返回元数据元组，如 ("AS4134", "bj-01", "某公司")，未命中返回None
+        db.lookup_int_list([...])   # 批量查询，返回与输入一一对应的列表
+    """
+
+    def __init__(self, db_path=""):
+        self.db_path = db_path
+        self.file = None
+        self.buffer = None  # mmap对象
+        self.address_bits = 32
+        self.record_count = 0
+        self.start_array = None  # ipv4为按下标访问的uint32 memoryview，ipv6不用（直接切片mmap得到16字节记录）
+        self.end_array = None
+        self.start_offset = 0  # 起始数值数组在文件中的偏移
+        self.end_offset = 0
+        self.value_offset_array = None
+        self.string_table_offset = 0
+        self.field_list = []
+        self.value_cache_dict = {}  # key为元数据在字符串表中的偏移，value为解码后的元组
+        self.open()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def open(self):
+        self.file = open(self.db_path, "rb")
+        try:
+            self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.file.close()
+            raise Exception("范围数据库文件为空", self.db_path)
+        if len(self.buffer) < RANGE_DB_HEADER_STRUCT.size:
+            self.close()
+            raise Exception("不是范围数据库文件", self.db_path)
+        (magic, version, self.address_bits, byte_order, self.record_count, self.start_offset, self.end_offset, value_offset_offset,
+         self.string_table_offset, string_table_size) = RANGE_DB_HEADER_STRUCT.unpack_from(self.buffer, 0)
+        if magic != RANGE_DB_MAGIC or version != RANGE_DB_VERSION:
+            self.close()
+            raise Exception("不是范围数据库文件，或版本不对", self.db_path)
+        if byte_order != (0 if sys.byteorder == "little" else 1):
+            self.close()
+            raise Exception("范围数据库文件的字节序与本机不同，请在本机重新编译", self.db_path)
+        view = memoryview(self.buffer)
+        if self.address_bits == 32:
+            self.start_array = view[self.start_offset:self.start_offset + 4 * self.record_count].cast("I")
+            self.end_array = view[self.end_offset:self.end_offset + 4 * self.record_count].cast("I")
+        self.value_offset_array = view[value_offset_offset:value_offset_offset + 4 * self.record_count].cast("I")
+        field_text = self.read_string(0)
+        self.field_list = field_text.split(RANGE_DB_FIELD_SEPARATOR) if field_text != "" else []
+        self.value_cache_dict = {}
+
+    def close(self):
+        # memoryview必须先于mmap释放
+        for view in (self.start_array, self.end_array, self.value_offset_array):
+            if view is not None:
+                view.release()
+        self.start_array = self.end_array = self.value_offset_array = None
+        if self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def read_string(self, string_offset: int) -> str:
+        offset = self.string_table_offset + string_offset
+        length = struct.unpack_from("<I", self.buffer, offset)[0]
+        return self.buffer[offset + 4:offset + 4 + length].decode("utf8")
+
+    def get_value(self, index: int) -> tuple:
+        value_offset = self.value_offset_array[index]
+        value = self.value_cache_dict.get(value_offset)
+        if value is None:
+            value = tuple(self.read_string(value_offset).split(RANGE_DB_FIELD_SEPARATOR))
+            self.value_cache_dict[value_offset] = value
+        return value
+
+    def find_index(self, ip_int: int, low=0) -> int:
+        """
+        返回包含ip_int的记录下标，未命中返回-1，low为查找的下界（批量查询时按升序推进）
+        """
+        if self.address_bits == 32:
+            index = bisect.bisect_right(self.start_array, ip_int, low) - 1
+            if index >= 0 and ip_int <= self.end_array[index]:
+                return index
+            return -1
+        key = ip_int.to_bytes(IPV6_RECORD_SIZE, "big")
+        buffer = self.buffer
+        start_offset = self.start_offset
+        high = self.record_count
+        while low < high:  # 等同于bisect_right，mmap切片得到16字节大端记录，按字节比较
+            middle = (low + high) >> 1
+            record_offset = start_offset + middle * IPV6_RECORD_SIZE
+            if key < buffer[record_offset:record_offset + IPV6_RECORD_SIZE]:
+                high = middle
+            else:
+                low = middle + 1
+        index = low - 1
+        record_offset = self.end_offset + index * IPV6_RECORD_SIZE
+        if index >= 0 and key <= buffer[record_offset:record_offset + IPV6_RECORD_SIZE]:
+            return index
+        return -1
+
+    def lookup_int(self, ip_int: int):
+        """
+        查询ip数值，命中时返回元数据元组，未命中返回None
+        """
+        index = self.find_index(ip_int)
+        return self.get_value(index) if index >= 0 else None
+
+    def lookup(self, ip_address: str):
+        """
+        查询ip地址（ipv4数据库查ipv4地址，ipv6数据库查ipv6地址），命中时返回元数据元组，未命中或地址格式不对时返回None
+        """
+        is_ip, ip_int = cofnet.parse_ip_addr(ip_address) if self.address_bits == 32 else cofnet.parse_ipv6_addr(ip_address)
+        return self.lookup_int(ip_int) if is_ip else None
+
+    def lookup_int_list(self, ip_int_list: list) -> list:
+        """
+        批量查询，先把查询按数值排序，每次二分查找的下界从上一个结果处开始，越往后查找范围越小，
+        返回与 ip_int_list 一一对应的列表，未命中的项为None
+        """
+        result_list = [None] * len(ip_int_list)
+        low = 0
+        find_index = self.find_index
+        get_value = self.get_value
+        for position in sorted(range(len(ip_int_list)), key=ip_int_list.__getitem__):
+            ip_int = ip_int_list[position]
+            index = find_index(ip_int, low)
+            if index >= 0:
+                result_list[position] = get_value(index)
+                low = index
+        return result_list
+
+
+def main(argv: list) -> int:
+    parser = argparse.ArgumentParser(prog="cofrangedb.py", description="ip地址范围数据库的编译及查询")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compile_parser = subparsers.add_parser("compile", help="把csv编译为范围数据库文件")
+    compile_parser.add_argument("csv_path")
+    compile_parser.add_argument("db_path")
+    compile_parser.add_argument("--ipv6", action="store_true", help="编译ipv6数据库")
+    compile_parser.add_argument("--cidr-column", default="cidr")
+    compile_parser.add_argument("--start-column", default="start")
+    compile_parser.add_argument("--end-column", default="end")
+    compile_parser.add_argument("--value-columns", default="", help="元数据列，以逗号分隔，默认为其余所有列")
+    query_parser = subparsers.add_parser("query", help="查询ip地址")
+    query_parser.add_argument("db_path")
+    query_parser.add_argument("ip_list", nargs="+")
+    args = parser.parse_args(argv[1:])
+    if args.command == "compile":
+        stats = compile_range_db(args.csv_path, args.db_path, 128 if args.ipv6 else 32, args.cidr_column, args.start_column,
+                                 args.end_column, args.value_columns.split(",") if args.value_columns != "" else None)
+        print(f"records={stats['record_count']} skipped={stats['skipped_count']} values={stats['value_count']}")
+        return 0
+    with RangeDb(args.db_path) as db:
+        for ip_address in args.ip_list:
+            value = db.lookup(ip_address)
+            print(ip_address, "-" if value is None else " ".join(f"{field}={item}" for field, item in zip(db.field_list, value)))
+    return 0
+
+
+# #################################  end of module  ##############################
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# coding=utf-8
+# module name: cofsim
+# author: Cof-Lee <cof8007@gmail.com>
+# this module uses the GPL-3.0 open source protocol
+# update: 2024-11-26
+
+"""
+icmpv4网络模拟器，用于在没有真实网络的环境下对cofping做可复现的负载测试及准确性测试
+用法:
+network = cofsim.FakeIcmpNetwork(seed=1)
+network.add_block("10.1.0.0/16", cofsim.FakeHostProfile(latency_ms=0.3, jitter_ms=0.1, loss_rate=0.01))
+network.add_block("10.2.0.0/24", cofsim.FakeHostProfile(respond_icmp_type=3, respond_icmp_code=1, respond_from_ip="10.2.0.254"))
+ping = cofping.PingOnePacket(target_ip="10.1.2.3", socket_factory=network.socket_factory)
+ping.start()
+
+★原理:
+FakeIcmpSocket 实现了 cofping 用到的 socket.socket 方法（settimeout/setsockopt/sendto/recv/close），
+sendto()收到echo请求后，按目标ip所属地址块的 FakeHostProfile 生成回包（完整的ipv4报文），并按时延排队，
+recv()到点才交付，因此 PingOnePacket.recv_icmp_packet() 及 generate_icmp_failed_info() 走的是与真实网络相同的代码
+★是否丢包由 (seed, 目标ip, 该目标的第几个探测包) 决定，与多线程下的发包先后顺序无关，同样的参数多次运行结果一致
+"""
+
+import bisect
+import heapq
+import random
+import socket
+import struct
+import threading
+import time
+import concurrent.futures
+import cofnet
+import cofping
+
+FAKE_LOCAL_IP_DEFAULT = "10.0.0.1"  # 模拟网络中本机的ip地址，即回包的目的ip
+
+
+class FakeHostProfile:
+    """
+    一个地址块内所有主机的响应行为
+    """
+
+    def __init__(self, latency_ms=1.0, jitter_ms=0.0, loss_rate=0.0, ttl=64, hop_count=0, respond_icmp_type=0,
+                 respond_icmp_code=0, respond_from_ip="", path_mtu=0, is_mtu_black_hole=False):
+        self.latency_ms = latency_ms  # 单程往返时延的中心值，单位：毫秒
+        self.jitter_ms = jitter_ms  # 时延抖动，实际时延在 [latency_ms-jitter_ms, latency_ms+jitter_ms] 内均匀分布
+        self.loss_rate = loss_rate  # 丢包率，[0.0-1.0]，被丢弃的探测包不会有任何回包
+        self.ttl = ttl  # 回包ip头里的ttl
+        self.hop_count = hop_count  # 到目标经过的路由器数量，探测包的ttl不大于此值时，由路由器回复ttl超时
+        self.respond_icmp_type = respond_icmp_type  # 0为echo响应，3为终点不可达，11为ttl超时
+        self.respond_icmp_code = respond_icmp_code
+        self.respond_from_ip = respond_from_ip  # 差错报文的源ip（路由器），为空时使用目标ip
+        self.path_mtu = path_mtu  # 到目标的路径MTU，0为不限制，设置了DF位且ip报文超过此值时，由路由器回复“需要分片”差错报文
+        self.is_mtu_black_hole = is_mtu_black_hole  # 为True时超过路径MTU的DF报文被静默丢弃，不回复差错报文（黑洞路由）
+
+
+class FakeIcmpNetwork:
+    """
+    模拟的网络，由若干地址块及其响应行为组成，不属于任何地址块的目标ip不会有回包（相当于100%丢包）
+    """
+
+    def __init__(self, seed=0, local_ip=FAKE_LOCAL_IP_DEFAULT):
+        self.seed = seed
+        self.local_ip = local_ip
+        self.local_ip_int = cofnet.ip_or_maskbyte_to_int(local_ip)
+        self.block_start_list = []  # 按起始ip排序，用于二分查找
+        self.block_list = []  # 与 block_start_list 一一对应，每项为 (起始ip数值, 结束ip数值, FakeHostProfile)
+        self.probe_counter_dict = {}  # key为目标ip数值，value为已收到的探测包数量
+        self.stats = {"sent": 0, "lost": 0, "no_route": 0, "echo_respond": 0, "ttl_exceeded": 0, "unreachable": 0,
+                      "frag_needed": 0, "mtu_black_hole": 0}
+        self.lock = threading.Lock()
+
+    def add_block(self, cidr: str, profile: FakeHostProfile):
+        """
+        添加一个地址块，地址块之间不能重叠
+        【输入错误会抛出Exception异常】
+        """
+        is_cidr, netseg_int, maskint = cofnet.parse_cidr(cidr)
+        if not is_cidr:
+            raise Exception("不是正确的cidr,", cidr)
+        start = netseg_int
+        end = netseg_int + cofnet.get_hostseg_num(maskint) - 1
+        index = bisect.bisect_left(self.block_start_list, start)
+        if index > 0 and self.block_list[index - 1][1] >= start:
+            raise Exception("地址块与已有地址块重叠", cidr)
+        if index < len(self.block_list) and self.block_list[index][0] <= end:
+            raise Exception("地址块与已有地址块重叠", cidr)
+        self.block_start_list.insert(index, start)
+        self.block_list.insert(index, (start, end, profile))
+
+    def find_profile(self, ip_int: int):
+        """
+        查找ip所属地址块的响应行为，不属于任何地址块则返回None
+        """
+        index = bisect.bisect_right(self.block_start_list, ip_int) - 1
+        if index < 0:
+            return None
+        start, end, profile = self.block_list[index]
+        if ip_int > end:
+            return None
+        return profile
+
+    def socket_factory(self, family=socket.AF_INET, type=socket.SOCK_RAW, proto=socket.IPPROTO_ICMP):
+        """
+        与 socket.socket 参数相同，传给 cofping.PingOnePacket(socket_factory=...) 使用
+        """
+        return FakeIcmpSocket(self, family, type, proto)
+
+    def next_probe_random(self, target_ip_int: int) -> random.Random:
+        """
+        为某目标的下一个探测包生成随机数发生器，只与 (seed, 目标ip, 该目标的第几个探测包) 有关
+        """
+        with self.lock:
+            probe_index = self.probe_counter_dict.get(target_ip_int, 0)
+            self.probe_counter_dict[target_ip_int] = probe_index + 1
+            self.stats["sent"] += 1
+        return random.Random((self.seed << 64) ^ (target_ip_int << 24) ^ probe_index)
+
+    def count(self, stats_key: str):
+        with self.lock:
+            self.stats[stats_key] += 1
+
+    def reset_stats(self):
+        with self.lock:
+            self.probe_counter_dict = {}
+            for stats_key in self.stats:
+                self.stats[stats_key] = 0
+
+
+class FakeIcmpSocket:
+    """
+    模拟的icmpv4原始套接字，由 FakeIcmpNetwork.socket_factory() 创建
+    回包按到达时间排队，recv()会阻塞到最早的回包到达（或超时），sendto()与recv()可在不同线程中同时调用
+    """
+
+    def __init__(self, network: FakeIcmpNetwork, family=socket.AF_INET, type=socket.SOCK_RAW, proto=socket.IPPROTO_ICMP):
+        self.network = network
+        self.family = family
+        self.type = type
+        self.proto = proto
+        self.timeout = None  # None表示阻塞
+        self.ttl = 64  # 探测包的ttl，由 setsockopt(IPPROTO_IP, IP_TTL, n) 设置
+        self.is_timestamp_enabled = False  # 由 setsockopt(SOL_SOCKET, SO_TIMESTAMPNS, 1) 开启，开启后recvmsg()带回包到达时刻
+        self.is_dont_frag = False  # 由 setsockopt(IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO) 设置，设置后超过路径MTU的报文不会被分片
+        self.is_closed = False
+        self.pending_packet_heap = []  # 每项为 (到达时间, 序号, 报文)
+        self.pending_counter = 0
+        self.condition = threading.Condition()
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+    def gettimeout(self):
+        return self.timeout
+
+    def setsockopt(self, level, optname, value):
+        if level == socket.IPPROTO_IP and optname == socket.IP_TTL:
+            self.ttl = value
+        elif cofping.HAS_SO_TIMESTAMPNS and level == socket.SOL_SOCKET and optname == cofping.SO_TIMESTAMPNS:
+            self.is_timestamp_enabled = bool(value)
+        elif level == socket.IPPROTO_IP and optname == cofping.IP_MTU_DISCOVER:
+            self.is_dont_frag = value == cofping.IP_PMTUDISC_DO
+
+    def sendto(self, packet: bytes, address: tuple) -> int:
+        if self.is_closed:
+            raise OSError("Bad file descriptor")
+        is_ip, target_ip_int = cofnet.parse_ip_addr(address[0])
+        if not is_ip:
+            raise OSError("Invalid argument", address)
+        if len(packet) < 8 or packet[0] != cofping.ICMP_TYPE_8_ECHO_REQUEST:
+            return len(packet)
+        rand = self.network.next_probe_random(target_ip_int)
+        profile = self.network.find_profile(target_ip_int)
+        if profile is None:
+            self.network.count("no_route")
+            return len(packet)
+        if rand.random() < profile.loss_rate:
+            self.network.count("lost")
+            return len(packet)
+        if self.is_dont_frag and 0 < profile.path_mtu < 20 + len(packet) and profile.is_mtu_black_hole:
+            self.network.count("mtu_black_hole")
+            return len(packet)
+        delay_ms = max(profile.latency_ms + (rand.random() * 2 - 1) * profile.jitter_ms, 0.0)
+        respond_packet = self.generate_respond_packet(packet, target_ip_int, profile)
+        with self.condition:
+            self.pending_counter += 1
+            heapq.heappush(self.pending_packet_heap, (time.time() + delay_ms / 1000, self.pending_counter, respond_packet))
+            self.condition.notify_all()
+        return len(packet)
+
+    def generate_respond_packet(self, packet: bytes, target_ip_int: int, profile: FakeHostProfile) -> bytes:
+        """
+        按响应行为生成完整的ipv4回包（含ip头），格式与真实原始套接字recv()得到的一致
+        """
+        next_hop_mtu = 0
+        if 0 < self.ttl <= profile.hop_count:  # 还没到达目标，ttl就减为0了
+            icmp_type = cofping.ICMP_TYPE_11_TIME_TO_LIVE_EXCEEDED
+            icmp_code = 0
+        elif self.is_dont_frag and 0 < profile.path_mtu < 20 + len(packet):  # 报文超过路径MTU又不允许分片
+            icmp_type = cofping.ICMP_TYPE_3_DESTINATION_UNREACHABLE
+            icmp_code = cofping.ICMP_CODE_4_FRAGMENTATION_NEEDED
+            next_hop_mtu = profile.path_mtu
+        else:
+            icmp_type = profile.respond_icmp_type
+            icmp_code = profile.respond_icmp_code
+        if icmp_type == cofping.ICMP_TYPE_0_ECHO_RESPOND:
+            self.network.count("echo_respond")
+            icmp_id, icmp_sequence = struct.unpack("HH", packet[4:8])
+            icmp_data = packet[8:]
+            source_ip_int = target_ip_int
+            ttl = profile.ttl
+        else:
+            if next_hop_mtu != 0:
+                self.network.count("frag_needed")
+            else:
+                self.network.count("ttl_exceeded" if icmp_type == cofping.ICMP_TYPE_11_TIME_TO_LIVE_EXCEEDED else "unreachable")
+            # 差错报文: icmp头（id及sequence位置为0）+ 原数据包的ip头 + 原数据包的icmp报文
+            icmp_id, icmp_sequence = 0, 0
+            original_ipv4_header = struct.pack("!BBHHHBBHII", 0x45, 0, 20 + len(packet), 0, 0, 1, socket.IPPROTO_ICMP, 0,
+                                               self.network.local_ip_int, target_ip_int)
+            icmp_data = original_ipv4_header + packet
+            if profile.respond_from_ip != "":
+                source_ip_int = cofnet.ip_or_maskbyte_to_int(profile.respond_from_ip)
+            elif icmp_type == cofping.ICMP_TYPE_11_TIME_TO_LIVE_EXCEEDED or next_hop_mtu != 0:
+                source_ip_int = target_ip_int & 0xFFFFFF00 | 1  # 未指定路由器ip时，以目标所在/24网段的第1个ip作为路由器
+            else:
+                source_ip_int = target_ip_int
+            ttl = 255 - self.ttl if icmp_type == cofping.ICMP_TYPE_11_TIME_TO_LIVE_EXCEEDED else profile.ttl
+        if next_hop_mtu != 0:  # “需要分片”差错报文的icmp头后4字节为 2字节未使用 + 2字节下一跳MTU（网络字节序）
+            icmp_rest_header = struct.pack("!HH", 0, next_hop_mtu)
+        else:
+            icmp_rest_header = struct.pack("HH", icmp_id, icmp_sequence)
+        icmp_packet = struct.pack("BBH", icmp_type, icmp_code, 0) + icmp_rest_header + icmp_data
+        icmp_checksum = cofping.PingOnePacket.generate_icmp_checksum(icmp_packet)
+        icmp_packet = struct.pack("BBH", icmp_type, icmp_code, icmp_checksum) + icmp_rest_header + icmp_data
+        ipv4_header = struct.pack("!BBHHHBBHII", 0x45, 0, 20 + len(icmp_packet), 0, 0, max(ttl, 1), socket.IPPROTO_ICMP, 0,
+                                  source_ip_int, self.network.local_ip_int)
+        return ipv4_header + icmp_packet
+
+    def recv(self, bufsize: int) -> bytes:
+        return self.wait_respond_packet()[1][:bufsize]
+
+    def recvmsg(self, bufsize: int, ancbufsize=0, flags=0) -> tuple:
+        """
+        与 socket.recvmsg 相同，开启了SO_TIMESTAMPNS时，辅助数据里带有回包的到达时刻（不含recvmsg被唤醒的延迟），
+        可用来检验线程调度及GIL等待对RTT测量的影响
+        """
+        arrive_time, respond_packet = self.wait_respond_packet()
+        ancdata = []
+        if self.is_timestamp_enabled and ancbufsize > 0:
+            arrive_time_ns = int(arrive_time * 1000000000)
+            ancdata.append((socket.SOL_SOCKET, cofping.SO_TIMESTAMPNS,
+                            struct.pack("qq", arrive_time_ns // 1000000000, arrive_time_ns % 1000000000)))
+        return respond_packet[:bufsize], ancdata, 0, (cofnet.int32_to_ip(struct.unpack("!I", respond_packet[12:16])[0]), 0)
+
+    def wait_respond_packet(self) -> tuple:
+        """
+        阻塞到最早的回包到达，返回 (到达时刻, 报文)，超时抛出socket.timeout
+        """
+        deadline = None if self.timeout is None else time.time() + self.timeout
+        with self.condition:
+            while True:
+                if self.is_closed:
+                    raise OSError("Bad file descriptor")
+                now = time.time()
+                if len(self.pending_packet_heap) != 0 and self.pending_packet_heap[0][0] <= now:
+                    arrive_time, counter, respond_packet = heapq.heappop(self.pending_packet_heap)
+                    return arrive_time, respond_packet
+                if deadline is not None and now >= deadline:
+                    raise socket.timeout("timed out")
+                wait_until = deadline
+                if len(self.pending_packet_heap) != 0 and (wait_until is None or self.pending_packet_heap[0][0] < wait_until):
+                    wait_until = self.pending_packet_heap[0][0]
+                self.condition.wait(None if wait_until is None else wait_until - now)
+
+    def close(self):
+        with self.condition:
+            self.is_closed = True
+            self.pending_packet_heap = []
+            self.condition.notify_all()
+
+
+def run_ping_load_test(network: FakeIcmpNetwork, target_ip_list: list, timeout=1, size=1, ttl=128, worker_num=64) -> dict:
+    """
+    用 cofping.PingOnePacket 对每个目标各发1个探测包（worker_num个线程并发），返回统计字典:
+    {"count", "elapsed_s", "pps", "success", "failed", "timeout", "failed_info_count": {failed_info: 次数}, "network_stats"}
+    与 network.stats 对比可检验检测结果的准确性（如 timeout 应等于 lost + no_route）
+    """
+    network.reset_stats()
+
+    def ping_one(target_ip):
+        ping = cofping.PingOnePacket(target_ip=target_ip, timeout=timeout, size=size, ttl=ttl, socket_factory=network.socket_factory)
+        ping.start()
+        return ping.result
+
+    result_stats = {"count": len(target_ip_list), "success": 0, "failed": 0, "timeout": 0, "failed_info_count": {}}
+    start_time = time.time()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=worker_num) as executor:
+        for result in executor.map(ping_one, target_ip_list):
+            if result.is_success:
+                result_stats["success"] += 1
+            elif result.failed_info == "timeout":
+                result_stats["timeout"] += 1
+            else:
+                result_stats["failed"] += 1
+                result_stats["failed_info_count"][result.failed_info] = result_stats["failed_info_count"].get(result.failed_info, 0) + 1
+    result_stats["elapsed_s"] = time.time() - start_time
+    result_stats["pps"] = len(target_ip_list) / result_stats["elapsed_s"] if result_stats["elapsed_s"] > 0 else 0.0
+    result_stats["network_stats"] = dict(network.stats)
+    return result_stats
+
+
+# #################################  end of module  ##############################
+if __name__ == '__main__':
+    print("Hello, this is cofsim.py")
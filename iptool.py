@@ -11,14 +11,18 @@ cmd>  cd  项目名称/venv/Scripts
 cmd>  pyinstaller.exe ../../iptool.py -F -w -n iptool-v241123.exe
 """
 
+import argparse
+import math
 import time
 import tkinter
 from tkinter import messagebox
 from tkinter import font
 import threading
 import ctypes
+import concurrent.futures
 import cofnet
 import cofping
+import cofmetrics
 
 PAGE_IPV4 = 0
 PAGE_IPV6 = 1
@@ -47,6 +51,120 @@ def stop_thread_silently(thread):
         print("iptool.stop_thread_silently: PyThreadState_SetAsyncExc failed")
 
 
+class TextUpdate:
+    """
+    记录对Text控件的insert及tag_add操作，不涉及tkinter控件，可以在后台线程中生成，
+    再由 apply() 在主线程中一次性更新到Text控件（1次delete、1次insert，再加上各个tag_add）
+    """
+
+    def __init__(self):
+        self.text_list = []  # 要插入的文本，都追加到末尾
+        self.tag_list = []  # 每项为 (tag名称, 起始位置, 结束位置)，位置格式同Text控件，如 "3.11"
+
+    def insert(self, index, text: str):
+        # index只能为tkinter.END，与原先直接操作控件的写法保持一致
+        self.text_list.append(text)
+
+    def tag_add(self, tag_name: str, start_index: str, end_index: str):
+        self.tag_list.append((tag_name, start_index, end_index))
+
+    def apply(self, text_widget):
+        text_widget.delete("1.0", tkinter.END)
+        text_widget.insert(tkinter.END, "".join(self.text_list))
+        for tag_name, start_index, end_index in self.tag_list:
+            text_widget.tag_add(tag_name, start_index, end_index)
+
+
+class BackgroundComputeExecutor:
+    """
+    界面计算的后台执行器，计算在1个后台线程中进行，结果在主线程中应用到界面，计算大网段时界面不会卡住
+    每个频道（如"ipv4"、"ipv6"）只保留最新的请求：提交新请求时，同频道还没开始的旧请求直接取消，
+    已在计算的旧请求算完后丢弃结果，不会覆盖新结果
+    ★tkinter控件只能在主线程中操作，所以后台线程不碰控件，由主线程用 after() 轮询计算结果
+    """
+
+    def __init__(self, window_obj=None, poll_interval_ms=20):
+        self.window_obj = window_obj  # 主窗口，用于 after() 轮询
+        self.poll_interval_ms = poll_interval_ms  # 轮询计算结果的间隔，单位：毫秒
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="iptool-compute")
+        self.generation_dict = {}  # key为频道，value为该频道最新请求的代数，结果的代数不是最新的就丢弃
+        self.pending_list = []  # 每项为 (频道, 代数, future, 应用结果的函数, 显示错误的函数)
+        self.is_polling = False
+        self.poll_after_id = None  # 已预约的 after() 轮询的id，关闭时要取消
+        self.is_shutdown = False
+
+    def submit(self, channel: str, compute_func, apply_func, *args, error_func=None):
+        """
+        在后台线程中执行 compute_func(*args)，算完后在主线程中执行 apply_func(结果)
+        计算或应用结果出错时，在主线程中执行 error_func(异常)，由界面显示错误信息，未指定 error_func 时只打印错误
+        """
+        if self.is_shutdown:
+            return
+        self.cancel(channel)
+        generation = self.generation_dict[channel]
+        future = self.executor.submit(compute_func, *args)
+        self.pending_list.append((channel, generation, future, apply_func, error_func))
+        if not self.is_polling:
+            self.is_polling = True
+            self.poll_after_id = self.window_obj.after(self.poll_interval_ms, self.poll)
+
+    def cancel(self, channel: str):
+        """
+        作废该频道已提交的请求，还没开始的直接取消，正在计算的算完后丢弃结果
+        """
+        self.generation_dict[channel] = self.generation_dict.get(channel, 0) + 1
+        for pending_channel, _, future, _, _ in self.pending_list:
+            if pending_channel == channel:
+                future.cancel()
+
+    def poll(self):
+        self.poll_after_id = None
+        checking_list = self.pending_list
+        self.pending_list = []  # 应用结果时新提交的请求会追加到这里
+        remaining_list = []
+        checked_num = 0
+        try:
+            for channel, generation, future, apply_func, error_func in checking_list:
+                checked_num += 1
+                if not future.done():
+                    remaining_list.append((channel, generation, future, apply_func, error_func))
+                    continue
+                if future.cancelled() or generation != self.generation_dict[channel]:
+                    continue  # 已被更新的请求取代
+                try:
+                    if future.exception() is not None:
+                        raise future.exception()
+                    apply_func(future.result())
+                except Exception as e:
+                    self.report_error(channel, error_func, e)
+        finally:
+            # 不论应用结果是否出错，都要更新待处理列表，并继续轮询或结束轮询，否则之后的请求永远不会被应用
+            self.pending_list = remaining_list + checking_list[checked_num:] + self.pending_list
+            if len(self.pending_list) != 0 and not self.is_shutdown:
+                self.poll_after_id = self.window_obj.after(self.poll_interval_ms, self.poll)
+            else:
+                self.is_polling = False
+
+    @staticmethod
+    def report_error(channel: str, error_func, error: Exception):
+        print(f"BackgroundComputeExecutor.poll: {channel} 计算出错 {error!r}")
+        if error_func is None:
+            return
+        try:
+            error_func(error)
+        except Exception as e:
+            print(f"BackgroundComputeExecutor.poll: {channel} 显示错误信息出错 {e!r}")
+
+    def shutdown(self):
+        self.is_shutdown = True
+        if self.poll_after_id is not None:
+            self.window_obj.after_cancel(self.poll_after_id)
+            self.poll_after_id = None
+        self.is_polling = False
+        self.pending_list = []
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
 class MainWindow:
     def __init__(self, width=800, height=480, title=''):
         self.about_info_list = ["ipTool，开源的ip计算工具",
@@ -90,14 +208,22 @@ class MainWindow:
         self.is_calculated6 = False  # 是否已计算过，ipv6
         self.current_ipv6_prefix_cidrv6 = "::/128"
         self.current_ipv6_prefix_len = 128
+        self.current_ipv6_int = 0  # 当前输入的ipv6地址数值
+        self.current_input_ip = ""  # 上次计算结果对应的输入框内容，ipv4
+        self.current_input_ipv6 = ""  # 上次计算结果对应的输入框内容，ipv6
+        self.compute_executor = None  # 界面计算的后台执行器，在 MainWindow.show()里创建
+        self.debounce_ms = 100  # 拖动掩码滑块或点击spinbox时，停下这么久才计算（单位：毫秒）
+        self.debounce_after_id_dict = {}  # key为防抖的名称，value为 after() 返回的id
+        self.ipv6_child_page_index = 0  # 子地址块列表当前页（从0开始）
+        self.ipv6_child_page_size = 256  # 子地址块列表每页的行数，每次只生成当前页的行
         self.detect_count_default = 3
         self.detect_count_min = 1
         self.detect_count_max = 1000000
         self.detect_interval_default = 1  # 单位：秒
         self.detect_interval_min = 0
         self.detect_interval_max = 120
-        self.detect_timeout_default = 2  # 单位：秒
-        self.detect_timeout_min = 1
+        self.detect_timeout_default = 2  # 单位：秒，为每个探测包超时时间的上限，实际超时时间根据目标的RTT自适应调整
+        self.detect_timeout_min = 0.1
         self.detect_timeout_max = 120
         self.detect_pkg_size_default = 1  # 单位：字节
         self.detect_pkg_size_min = 1
@@ -129,6 +255,7 @@ class MainWindow:
         self.window_obj.maxsize(*self.maxsize)  # 可调整的最大宽度及高度
         self.window_obj.pack_propagate(True)  # True表示窗口内的控件大小自适应
         self.window_obj.configure(bg=self.background)  # 设置主窗口背景色，RGB
+        self.compute_executor = BackgroundComputeExecutor(self.window_obj)
         # 加载初始化界面控件
         self.load_main_window_init_widget()  # ★★★ 接下来，所有的事情都在此界面操作 ★★★
         # 主窗口点击右上角的关闭按钮后，触发此函数
@@ -284,7 +411,7 @@ class MainWindow:
         button_exit = tkinter.Button(calc_btn_frame, text="退出", command=self.on_closing_main_window)
         button_exit.pack(side=tkinter.LEFT, padx=self.padx)
         # ip基础信息显示文本框
-        self.widget_dict_ipv4["text_ip_base_info"] = tkinter.Text(self.frame_main_func_ipv4_page, width=64, height=7,
+        self.widget_dict_ipv4["text_ip_base_info"] = tkinter.Text(self.frame_main_func_ipv4_page, width=64, height=8,
                                                                   font=self.text_font, bg="black", fg="white")
         self.widget_dict_ipv4["text_ip_base_info"].grid(row=3, column=0, columnspan=3, padx=self.padx, pady=self.pady)
         # ip同网段信息显示文本框
@@ -335,16 +462,16 @@ class MainWindow:
         calc_btn_frame.grid(row=2, column=0, columnspan=3)
         button_calculate = tkinter.Button(calc_btn_frame, text="计算", command=self.calculate6)
         button_calculate.pack(side=tkinter.LEFT, padx=self.padx)
-        # button_last_netseg = tkinter.Button(calc_btn_frame, text="↑上一地址块", command=self.calculate_last_cidrv6)
-        # button_last_netseg.pack(side=tkinter.LEFT, padx=self.padx)
-        # button_next_netseg = tkinter.Button(calc_btn_frame, text="↓下一地址块", command=self.calculate_next_cidrv6)
-        # button_next_netseg.pack(side=tkinter.LEFT, padx=self.padx)
+        button_last_netseg = tkinter.Button(calc_btn_frame, text="↑上一地址块", command=self.calculate_last_cidrv6)
+        button_last_netseg.pack(side=tkinter.LEFT, padx=self.padx)
+        button_next_netseg = tkinter.Button(calc_btn_frame, text="↓下一地址块", command=self.calculate_next_cidrv6)
+        button_next_netseg.pack(side=tkinter.LEFT, padx=self.padx)
         button_clear = tkinter.Button(calc_btn_frame, text="清空", command=self.clear6)
         button_clear.pack(side=tkinter.LEFT, padx=self.padx)
         button_exit = tkinter.Button(calc_btn_frame, text="退出", command=self.on_closing_main_window)
         button_exit.pack(side=tkinter.LEFT, padx=self.padx)
         # ip基础信息显示文本框
-        self.widget_dict_ipv6["text_ipv6_base_info"] = tkinter.Text(self.frame_main_func_ipv6_page, width=64, height=12,
+        self.widget_dict_ipv6["text_ipv6_base_info"] = tkinter.Text(self.frame_main_func_ipv6_page, width=64, height=13,
                                                                     font=self.text_font, bg="black", fg="white")
         self.widget_dict_ipv6["text_ipv6_base_info"].grid(row=3, column=0, columnspan=3, padx=self.padx, pady=self.pady)
         # 设置Text文本框的前景色tag_config
@@ -353,6 +480,37 @@ class MainWindow:
         self.widget_dict_ipv6["text_ipv6_base_info"].tag_config("maskbyte_fg", foreground="#0d64c0")
         self.widget_dict_ipv6["text_ipv6_base_info"].tag_config("hostseg_fg", foreground="pink")
         self.widget_dict_ipv6["text_ipv6_base_info"].tag_config("hostseg_num_fg", foreground="red")
+        # 子地址块列表，按页显示，每次只生成当前页的行，/32划分为/64（2^32个）也能即时翻页
+        child_btn_frame = tkinter.Frame(self.frame_main_func_ipv6_page, width=self.width - 25, height=30, bg=self.background)
+        child_btn_frame.grid(row=4, column=0, columnspan=3)
+        label_child_prefix_len = tkinter.Label(child_btn_frame, text="子地址块前缀长度:")
+        label_child_prefix_len.pack(side=tkinter.LEFT, padx=self.padx)
+        self.widget_dict_ipv6["sv_child_prefix_len"] = tkinter.StringVar(value="64")
+        self.widget_dict_ipv6["spinbox_child_prefix_len"] = tkinter.Spinbox(child_btn_frame, from_=0, to=128, increment=1, width=3,
+                                                                            textvariable=self.widget_dict_ipv6["sv_child_prefix_len"],
+                                                                            command=lambda: self.show_ipv6_child_prefix_page(0))
+        self.widget_dict_ipv6["spinbox_child_prefix_len"].pack(side=tkinter.LEFT, padx=self.padx)
+        button_first_page = tkinter.Button(child_btn_frame, text="首页", command=lambda: self.show_ipv6_child_prefix_page(0))
+        button_first_page.pack(side=tkinter.LEFT, padx=self.padx)
+        button_last_page = tkinter.Button(child_btn_frame, text="上一页",
+                                          command=lambda: self.show_ipv6_child_prefix_page(max(self.ipv6_child_page_index - 1, 0)))
+        button_last_page.pack(side=tkinter.LEFT, padx=self.padx)
+        button_next_page = tkinter.Button(child_btn_frame, text="下一页",
+                                          command=lambda: self.show_ipv6_child_prefix_page(self.ipv6_child_page_index + 1))
+        button_next_page.pack(side=tkinter.LEFT, padx=self.padx)
+        button_end_page = tkinter.Button(child_btn_frame, text="末页", command=lambda: self.show_ipv6_child_prefix_page(-1))
+        button_end_page.pack(side=tkinter.LEFT, padx=self.padx)
+        self.widget_dict_ipv6["sv_child_page_info"] = tkinter.StringVar()
+        label_child_page_info = tkinter.Label(child_btn_frame, textvariable=self.widget_dict_ipv6["sv_child_page_info"])
+        label_child_page_info.pack(side=tkinter.LEFT, padx=self.padx)
+        self.widget_dict_ipv6["scrollbar_child_prefix"] = tkinter.Scrollbar(self.frame_main_func_ipv6_page)
+        self.widget_dict_ipv6["text_child_prefix"] = tkinter.Text(self.frame_main_func_ipv6_page, width=64, height=5,
+                                                                  font=self.text_font, bg="black", fg="white",
+                                                                  yscrollcommand=self.widget_dict_ipv6["scrollbar_child_prefix"].set)
+        self.widget_dict_ipv6["text_child_prefix"].grid(row=5, column=0, columnspan=3, padx=self.padx, pady=self.pady)
+        self.widget_dict_ipv6["scrollbar_child_prefix"].config(command=self.widget_dict_ipv6["text_child_prefix"].yview)
+        self.widget_dict_ipv6["scrollbar_child_prefix"].grid(row=5, column=3, padx=self.padx, pady=self.pady, sticky="NS")
+        self.widget_dict_ipv6["text_child_prefix"].tag_config("ipv6_address_fg", foreground="#deef5a")
 
     def init_ping_page(self):
         top_frame_height = 130
@@ -403,9 +561,9 @@ class MainWindow:
         self.widget_dict_ping["sv_timeout"] = tkinter.StringVar()
         self.widget_dict_ping["sv_timeout"].set(self.detect_timeout_default)
         self.widget_dict_ping["spinbox_timeout"] = tkinter.Spinbox(parameter_frame, from_=self.detect_timeout_min,
-                                                                   to=self.detect_timeout_max, increment=1,
+                                                                   to=self.detect_timeout_max, increment=0.1,
                                                                    textvariable=self.widget_dict_ping["sv_timeout"],
-                                                                   width=3, bg="#e2deff")
+                                                                   width=4, bg="#e2deff")
         self.widget_dict_ping["spinbox_timeout"].pack(side=tkinter.LEFT, padx=self.padx)
         label_size = tkinter.Label(parameter_frame, text="数据大小(byte):")
         label_size.pack(side=tkinter.LEFT, padx=self.padx)
@@ -503,26 +661,55 @@ class MainWindow:
         if event.keysym == "Return":
             self.calculate6()
 
+    def debounce(self, name: str, func, *args):
+        """
+        输入防抖：debounce_ms内同一name的多次调用只执行最后一次，拖动滑块时只计算最后停下的值
+        """
+        after_id = self.debounce_after_id_dict.pop(name, None)
+        if after_id is not None:
+            self.window_obj.after_cancel(after_id)
+
+        def run():
+            self.debounce_after_id_dict.pop(name, None)
+            func(*args)
+
+        self.debounce_after_id_dict[name] = self.window_obj.after(self.debounce_ms, run)
+
+    def cancel_debounce(self, name: str):
+        after_id = self.debounce_after_id_dict.pop(name, None)
+        if after_id is not None:
+            self.window_obj.after_cancel(after_id)
+
     def set_sv_netmask_int(self, netmask_int: int):
         # print(type(netmask_int))  # <class 'str'>
         self.widget_dict_ipv4["sv_netmask_int"].set(netmask_int)
-        self.calculate(maskint=str(netmask_int))
+        if self.is_calculated and str(netmask_int) == str(self.current_maskint) \
+                and self.widget_dict_ipv4["sv_input_ip"].get().strip() == self.current_input_ip:
+            self.cancel_debounce("ipv4")
+            return  # 应用计算结果时设置滑块也会触发本回调，掩码位数及输入都没变，不再重复计算
+        self.debounce("ipv4", self.calculate, str(netmask_int))
 
     def set_sv_netmask_int_ipv6(self, netmask_int: int):
         self.widget_dict_ipv6["sv_ipv6_prefix_len_int"].set(netmask_int)
-        self.calculate6(maskint=str(netmask_int))
+        if self.is_calculated6 and str(netmask_int) == str(self.current_ipv6_prefix_len) \
+                and self.widget_dict_ipv6["sv_input_ipv6"].get().strip() == self.current_input_ipv6:
+            self.cancel_debounce("ipv6")
+            return  # 应用计算结果时设置滑块也会触发本回调，前缀长度及输入都没变，不再重复计算
+        self.debounce("ipv6", self.calculate6, str(netmask_int))
 
     def set_netmask_scale_on_spinbox_change(self):
         netmask_int_str = self.widget_dict_ipv4["sv_netmask_int"].get()
         self.widget_dict_ipv4["netmask_scale"].set(int(netmask_int_str))
-        self.calculate(maskint=netmask_int_str)
+        self.debounce("ipv4", self.calculate, netmask_int_str)
 
     def set_netmask_scale_on_spinbox_change_ipv6(self):
         netmask_int_str = self.widget_dict_ipv6["sv_ipv6_prefix_len_int"].get()
         self.widget_dict_ipv6["ipv6_prefix_len_scale"].set(int(netmask_int_str))
-        self.calculate6(maskint=netmask_int_str)
+        self.debounce("ipv6", self.calculate6, netmask_int_str)
 
     def clear(self):
+        self.cancel_debounce("ipv4")
+        self.compute_executor.cancel("ipv4")
         self.widget_dict_ipv4["sv_input_ip"].set("")
         self.widget_dict_ipv4["sv_netmask_int"].set(0)
         self.widget_dict_ipv4["netmask_scale"].set(0)
@@ -533,12 +720,15 @@ class MainWindow:
         self.is_calculated = False
 
     def clear6(self):
+        self.cancel_debounce("ipv6")
+        self.compute_executor.cancel("ipv6")
         self.widget_dict_ipv6["sv_input_ipv6"].set("")
         self.widget_dict_ipv6["sv_ipv6_prefix_len_int"].set(0)
         self.widget_dict_ipv6["ipv6_prefix_len_scale"].set(0)
         self.widget_dict_ipv6["text_ipv6_base_info"].delete("1.0", tkinter.END)
-        # self.current_netseg = ""
-        # self.current_maskint = 32
+        self.widget_dict_ipv6["text_child_prefix"].delete("1.0", tkinter.END)
+        self.widget_dict_ipv6["sv_child_page_info"].set("")
+        self.ipv6_child_page_index = 0
         self.is_calculated6 = False
 
     def stop_ping_detect(self):
@@ -592,9 +782,11 @@ class MainWindow:
         except ValueError:
             detect_interval = self.detect_interval_default
         try:
-            detect_timeout = int(self.widget_dict_ping["sv_timeout"].get())
+            detect_timeout = float(self.widget_dict_ping["sv_timeout"].get())
         except ValueError:
             detect_timeout = self.detect_timeout_default
+        if not math.isfinite(detect_timeout):  # float()能解析出 nan、inf ，比较大小时会绕过上下限
+            detect_timeout = self.detect_timeout_default
         try:
             detect_pkg_size = int(self.widget_dict_ping["sv_size"].get())
         except ValueError:
@@ -708,99 +900,131 @@ class MainWindow:
                 return
             else:
                 new_maskint = maskint
-        self.widget_dict_ipv4["text_ip_base_info"].delete("1.0", tkinter.END)
+        self.compute_executor.submit("ipv4", self.compute_ipv4_page, self.apply_ipv4_page, input_ip_str, str(new_maskint),
+                                     error_func=self.show_ipv4_page_error)
+
+    @staticmethod
+    def compute_ipv4_page(input_ip_str: str, new_maskint: str) -> dict:
+        """
+        在后台线程中计算ipv4界面要显示的全部内容，不涉及tkinter控件，
+        结果由 apply_ipv4_page() 在主线程中一次性更新到界面
+        """
+        base_info = TextUpdate()
+        other_hostseg = TextUpdate()
         # 开始计算
-        ip_hex_address = cofnet.ip_to_hex_string(input_ip_str)
-        ip_address = f"ip地址: {input_ip_str}    ip地址十六进制表示: {ip_hex_address}\n"  # 第 1 行
-        ip_int = cofnet.ip_or_maskbyte_to_int(input_ip_str)
-        ip_int_show = f"ip地址转为整数值: {ip_int}（十进制）\n"  # 第 2 行
-        ip_binary_str = cofnet.ip_or_maskbyte_to_binary_with_space(input_ip_str)
-        ip_binary_show = f"ip地址二进制表示: {ip_binary_str}\n"  # 第 3 行
-        maskbyte = cofnet.maskint_to_maskbyte(int(new_maskint))
-        netseg_hex_address = cofnet.ip_to_hex_string(maskbyte)
-        wildcard_mask = cofnet.maskint_to_wildcard_mask(int(new_maskint))
-        maskbyte_show = f"子网掩码: {maskbyte}  （{netseg_hex_address}）    反掩码: {wildcard_mask}\n"  # 第 4 行
-        ip_netseg = cofnet.get_netseg_byte(input_ip_str, new_maskint)
-        ip_hostseg = cofnet.get_hostseg_int(input_ip_str, new_maskint)
-        host_seg_num = cofnet.get_hostseg_num(int(new_maskint))
-        ip_netseg_hex_address = cofnet.ip_to_hex_string(ip_netseg)
-        ip_netseg_info = f"ip地址对应网络号: {ip_netseg}/{new_maskint}  十六进制表示: {ip_netseg_hex_address}\n"  # 第 5 行
+        ip_info = cofnet.calculate_ip_info(cofnet.ip_or_maskbyte_to_int(input_ip_str), int(new_maskint))
+        ip_address = f"ip地址: {input_ip_str}    ip地址十六进制表示: {ip_info['ip_hex']}\n"  # 第 1 行
+        ip_int_show = f"ip地址转为整数值: {ip_info['ip_int']}（十进制）\n"  # 第 2 行
+        ip_binary_show = f"ip地址二进制表示: {ip_info['ip_binary']}\n"  # 第 3 行
+        maskbyte = ip_info["maskbyte"]
+        maskbyte_show = f"子网掩码: {maskbyte}  （{ip_info['maskbyte_hex']}）    反掩码: {ip_info['wildcard_mask']}\n"  # 第 4 行
+        ip_netseg = ip_info["netseg"]
+        ip_hostseg = ip_info["hostseg"]
+        host_seg_num = ip_info["host_num"]
+        ip_netseg_info = f"ip地址对应网络号: {ip_netseg}/{new_maskint}  十六进制表示: {ip_info['netseg_hex']}\n"  # 第 5 行
         ip_hostseg_info = f"本ip为本网段第 {ip_hostseg + 1} 个ip（第1个ip是主机号为全0的ip）\n主机号可用ip总量: {host_seg_num} "  # 第 6、7 行
-        ip_netseg_int = cofnet.get_netseg_int(input_ip_str, new_maskint)
-        last_ip_address = cofnet.int32_to_ip(ip_netseg_int + host_seg_num - 1)
-        ip_hostseg_range = f"（{ip_netseg}->{last_ip_address}）"
+        ip_netseg_int = ip_info["netseg_int"]
+        ip_hostseg_range = f"（{ip_netseg}->{ip_info['last_ip']}）"
         # 将ip相关信息输出到Text控件中
-        self.widget_dict_ipv4["text_ip_base_info"].insert(tkinter.END, ip_address)
+        base_info.insert(tkinter.END, ip_address)
         start_index1 = "1.6"
         end_index1 = "1." + str(6 + len(input_ip_str))
-        self.widget_dict_ipv4["text_ip_base_info"].tag_add("ip_address_fg", start_index1, end_index1)
-        self.widget_dict_ipv4["text_ip_base_info"].insert(tkinter.END, ip_int_show)
-        self.widget_dict_ipv4["text_ip_base_info"].insert(tkinter.END, ip_binary_show)
+        base_info.tag_add("ip_address_fg", start_index1, end_index1)
+        base_info.insert(tkinter.END, ip_int_show)
+        base_info.insert(tkinter.END, ip_binary_show)
         new_maskint_with_space = cofnet.get_maskint_with_space(int(new_maskint))
         start_index2 = "3.11"
         end_index2 = "3." + str(11 + new_maskint_with_space)
-        self.widget_dict_ipv4["text_ip_base_info"].tag_add("maskint_fg", start_index2, end_index2)
-        self.widget_dict_ipv4["text_ip_base_info"].tag_add("hostseg_fg", end_index2, end_index2 + " lineend")
-        self.widget_dict_ipv4["text_ip_base_info"].insert(tkinter.END, maskbyte_show)
+        base_info.tag_add("maskint_fg", start_index2, end_index2)
+        base_info.tag_add("hostseg_fg", end_index2, end_index2 + " lineend")
+        base_info.insert(tkinter.END, maskbyte_show)
         start_index3 = "4.6"
         end_index3 = "4." + str(6 + len(maskbyte))
-        self.widget_dict_ipv4["text_ip_base_info"].tag_add("maskbyte_fg", start_index3, end_index3)
-        self.widget_dict_ipv4["text_ip_base_info"].insert(tkinter.END, ip_netseg_info)
+        base_info.tag_add("maskbyte_fg", start_index3, end_index3)
+        base_info.insert(tkinter.END, ip_netseg_info)
         start_index4 = "5.11"
         end_index4 = "5." + str(11 + len(ip_netseg))
         start_index4_2 = "5." + str(12 + len(ip_netseg))
         end_index4_2 = "5." + str(12 + len(str(new_maskint)))
-        self.widget_dict_ipv4["text_ip_base_info"].tag_add("maskint_fg", start_index4, end_index4)
-        self.widget_dict_ipv4["text_ip_base_info"].tag_add("maskbyte_fg", start_index4_2, end_index4_2)
-        self.widget_dict_ipv4["text_ip_base_info"].insert(tkinter.END, ip_hostseg_info)
+        base_info.tag_add("maskint_fg", start_index4, end_index4)
+        base_info.tag_add("maskbyte_fg", start_index4_2, end_index4_2)
+        base_info.insert(tkinter.END, ip_hostseg_info)
         start_index5 = "6.9"
         end_index5 = "6." + str(9 + len(str(ip_hostseg)))
-        self.widget_dict_ipv4["text_ip_base_info"].tag_add("hostseg_fg", start_index5, end_index5)
+        base_info.tag_add("hostseg_fg", start_index5, end_index5)
         start_index6 = "7.11"
         end_index6 = "7." + str(11 + len(str(host_seg_num)))
-        self.widget_dict_ipv4["text_ip_base_info"].tag_add("hostseg_num_fg", start_index6, end_index6)
-        self.widget_dict_ipv4["text_ip_base_info"].insert(tkinter.END, ip_hostseg_range)
-        # 更新子网掩码滑块及spinbox的值
-        self.widget_dict_ipv4["sv_netmask_int"].set(int(new_maskint))
-        self.widget_dict_ipv4["netmask_scale"].set(int(new_maskint))
+        base_info.tag_add("hostseg_num_fg", start_index6, end_index6)
+        base_info.insert(tkinter.END, ip_hostseg_range)
+        address_category, address_description = cofnet.classify_ipv4_int(ip_info["ip_int"])
+        base_info.insert(
+            tkinter.END, f"\n地址类型: {cofnet.get_ipv4_class(ip_info['ip_int'])}类地址  {address_description}（{address_category}）")  # 第 8 行
         # 输出同一网段下的所有主机ip
-        self.widget_dict_ipv4["text_other_hostseg"].delete("1.0", tkinter.END)
         if host_seg_num > 32768:  # 小于17位掩码时不再显示同网段所有ip
-            self.widget_dict_ipv4["text_other_hostseg"].insert(tkinter.END, "小于17位掩码时不再显示同网段所有ip")
+            other_hostseg.insert(tkinter.END, "小于17位掩码时不再显示同网段所有ip")
         else:
-            head = "序号\tip地址\t备注\n"
-            self.widget_dict_ipv4["text_other_hostseg"].insert(tkinter.END, head)
-            ip_netseg_int = cofnet.get_netseg_int(input_ip_str, new_maskint)
-            for i in range(host_seg_num):
-                ip_address = cofnet.int32_to_ip(ip_netseg_int + i)
-                if i == ip_hostseg and i == 0:
-                    ip_line_info = str(i + 1) + "\t" + ip_address + "\t此ip为您输入的ip（主机号为全0）\n"
-                elif i == ip_hostseg and i == host_seg_num - 1:
-                    ip_line_info = str(i + 1) + "\t" + ip_address + "\t此ip为您输入的ip（主机号为全1）\n"
-                elif i == ip_hostseg:
-                    ip_line_info = str(i + 1) + "\t" + ip_address + "\t此ip为您输入的ip\n"
-                elif i == 0:
-                    ip_line_info = str(i + 1) + "\t" + ip_address + "\t此ip主机号为全0\n"
-                elif i == host_seg_num - 1:
-                    ip_line_info = str(i + 1) + "\t" + ip_address + "\t此ip主机号为全1\n"
-                else:
-                    ip_line_info = str(i + 1) + "\t" + ip_address + "\n"
-                self.widget_dict_ipv4["text_other_hostseg"].insert(tkinter.END, ip_line_info)
-                if i == ip_hostseg:
-                    start_index = str(i + 2) + "." + str(len(str(i + 2)))
-                    end_index = str(i + 2) + "." + str(len(str(i + 2)) + 1 + len(ip_address))
-                    self.widget_dict_ipv4["text_other_hostseg"].tag_add("ip_address_fg", start_index, end_index)
-        # 记录当前网段及子网掩码位数
-        self.current_netseg = ip_netseg
-        self.current_maskint = new_maskint
+            ip_line_info_list = MainWindow.generate_same_netseg_ip_line_list(ip_netseg_int, host_seg_num, ip_hostseg)
+            # 一次性插入Text控件，逐行insert在大网段时非常慢
+            other_hostseg.insert(tkinter.END, "".join(ip_line_info_list))
+            ip_address = cofnet.int32_to_ip(ip_netseg_int + ip_hostseg)
+            start_index = str(ip_hostseg + 2) + "." + str(len(str(ip_hostseg + 1)) + 1)
+            end_index = str(ip_hostseg + 2) + "." + str(len(str(ip_hostseg + 1)) + 1 + len(ip_address))
+            other_hostseg.tag_add("ip_address_fg", start_index, end_index)
+        return {"text_ip_base_info": base_info, "text_other_hostseg": other_hostseg, "netseg": ip_netseg, "maskint": new_maskint,
+                "input_ip": input_ip_str + "/" + str(new_maskint)}
+
+    def apply_ipv4_page(self, result: dict):
+        """
+        在主线程中把 compute_ipv4_page() 的结果一次性更新到界面
+        """
+        result["text_ip_base_info"].apply(self.widget_dict_ipv4["text_ip_base_info"])
+        result["text_other_hostseg"].apply(self.widget_dict_ipv4["text_other_hostseg"])
+        # 记录当前网段及子网掩码位数，要在更新滑块及输入框之前记录，滑块触发的回调发现都没变就不会重复计算
+        self.current_netseg = result["netseg"]
+        self.current_maskint = result["maskint"]
+        self.current_input_ip = result["input_ip"]
         self.is_calculated = True
         self.widget_dict_ipv4["sv_input_ip"].set("")
-        self.widget_dict_ipv4["sv_input_ip"].set(input_ip_str + "/" + str(new_maskint))
+        self.widget_dict_ipv4["sv_input_ip"].set(result["input_ip"])
+        # 更新子网掩码滑块及spinbox的值
+        self.widget_dict_ipv4["sv_netmask_int"].set(int(result["maskint"]))
+        self.widget_dict_ipv4["netmask_scale"].set(int(result["maskint"]))
+
+    def show_ipv4_page_error(self, error: Exception):
+        """
+        在主线程中把后台计算ipv4界面时出的错显示到界面上
+        """
+        self.widget_dict_ipv4["text_ip_base_info"].delete("1.0", tkinter.END)
+        self.widget_dict_ipv4["text_ip_base_info"].insert(tkinter.END, f"计算出错: {error!r}")
+        self.widget_dict_ipv4["text_other_hostseg"].delete("1.0", tkinter.END)
+
+    @staticmethod
+    def generate_same_netseg_ip_line_list(ip_netseg_int: int, host_seg_num: int, ip_hostseg: int) -> list:
+        """
+        生成“本网段其他主机ip”文本框的每一行（含表头），不涉及tkinter控件，可单独调用
+        ip_hostseg为输入ip的主机号，该行会备注“此ip为您输入的ip”
+        """
+        ip_line_info_list = ["序号\tip地址\t备注\n"]
+        for i in range(host_seg_num):
+            ip_address = cofnet.int32_to_ip(ip_netseg_int + i)
+            if i == ip_hostseg and i == 0:
+                ip_line_info = str(i + 1) + "\t" + ip_address + "\t此ip为您输入的ip（主机号为全0）\n"
+            elif i == ip_hostseg and i == host_seg_num - 1:
+                ip_line_info = str(i + 1) + "\t" + ip_address + "\t此ip为您输入的ip（主机号为全1）\n"
+            elif i == ip_hostseg:
+                ip_line_info = str(i + 1) + "\t" + ip_address + "\t此ip为您输入的ip\n"
+            elif i == 0:
+                ip_line_info = str(i + 1) + "\t" + ip_address + "\t此ip主机号为全0\n"
+            elif i == host_seg_num - 1:
+                ip_line_info = str(i + 1) + "\t" + ip_address + "\t此ip主机号为全1\n"
+            else:
+                ip_line_info = str(i + 1) + "\t" + ip_address + "\n"
+            ip_line_info_list.append(ip_line_info)
+        return ip_line_info_list
 
     def calculate_ip_maskint(self, input_ip_maskint_str, maskint=None):
         # 输入信息为 ip/掩码位数，例如 "10.99.1.3/24"
         # maskint如果要赋值，需要赋str类型的值
-        self.widget_dict_ipv4["text_ip_base_info"].delete("1.0", tkinter.END)
         ip_maskint_seg_list = input_ip_maskint_str.split("/")
         input_ip_str = ip_maskint_seg_list[0]
         if maskint is None:
@@ -814,7 +1038,6 @@ class MainWindow:
         if not self.is_calculated:
             return
         else:
-            self.widget_dict_ipv4["text_ip_base_info"].delete("1.0", tkinter.END)
             current_netseg_int = cofnet.ip_or_maskbyte_to_int(self.current_netseg)
             shift_bit = 32 - int(self.current_maskint)
             last_netseg = cofnet.int32_to_ip(((current_netseg_int >> shift_bit) - 1) << shift_bit)
@@ -825,14 +1048,19 @@ class MainWindow:
         if not self.is_calculated6:
             return
         else:
-            pass
+            prefix_len = int(self.current_ipv6_prefix_len)
+            try:
+                last_prefix_int = cofnet.get_previous_prefix_int(self.current_ipv6_int, prefix_len)
+            except Exception as e:
+                messagebox.showinfo("Error", e.args[0])
+                return
+            self.calculate6_ipv6(cofnet.int128_to_ipv6_short(last_prefix_int), str(prefix_len))
 
     def calculate_next_netseg(self):
         # 计算下一子网信息
         if not self.is_calculated:
             return
         else:
-            self.widget_dict_ipv4["text_ip_base_info"].delete("1.0", tkinter.END)
             current_netseg_int = cofnet.ip_or_maskbyte_to_int(self.current_netseg)
             shift_bit = 32 - int(self.current_maskint)
             next_netseg = cofnet.int32_to_ip(((current_netseg_int >> shift_bit) + 1) << shift_bit)
@@ -843,16 +1071,91 @@ class MainWindow:
         if not self.is_calculated6:
             return
         else:
-            pass
+            prefix_len = int(self.current_ipv6_prefix_len)
+            try:
+                next_prefix_int = cofnet.get_next_prefix_int(self.current_ipv6_int, prefix_len)
+            except Exception as e:
+                messagebox.showinfo("Error", e.args[0])
+                return
+            self.calculate6_ipv6(cofnet.int128_to_ipv6_short(next_prefix_int), str(prefix_len))
+
+    @staticmethod
+    def generate_child_prefix_line_list(prefix_int: int, prefix_len: int, child_prefix_len: int, start_index: int, count: int,
+                                        highlight_index=-1) -> list:
+        """
+        生成“子地址块”文本框中一页的行（含表头），不涉及tkinter控件，可单独调用
+        只生成 [start_index, start_index+count) 这一页，highlight_index为输入地址所在的子地址块，该行会备注“您输入的地址在此地址块内”
+        """
+        line_list = ["序号\t子地址块\t备注\n"]
+        for index, child_prefix_int in enumerate(cofnet.iter_child_prefix_int(prefix_int, prefix_len, child_prefix_len, start_index, count),
+                                                 start_index):
+            remark = "\t您输入的地址在此地址块内" if index == highlight_index else ""
+            line_list.append(f"{index + 1}\t{cofnet.int128_to_ipv6_short(child_prefix_int)}/{child_prefix_len}{remark}\n")
+        return line_list
+
+    def show_ipv6_child_prefix_page(self, page_index=None):
+        """
+        显示当前地址块的第page_index页（从0开始）子地址块，None表示输入地址所在的那一页，-1表示最后一页
+        """
+        if not self.is_calculated6:
+            return
+        prefix_len = int(self.current_ipv6_prefix_len)
+        child_prefix_len_str = self.widget_dict_ipv6["sv_child_prefix_len"].get().strip()
+        if not child_prefix_len_str.isdigit() or int(child_prefix_len_str) > 128:
+            return
+        child_prefix_len = int(child_prefix_len_str)
+        if child_prefix_len < prefix_len:  # 子地址块不能比当前地址块大，自动调整
+            child_prefix_len = 64 if prefix_len < 64 else 128
+            self.widget_dict_ipv6["sv_child_prefix_len"].set(str(child_prefix_len))
+        child_prefix_num = cofnet.get_child_prefix_num(prefix_len, child_prefix_len)
+        page_num = (child_prefix_num + self.ipv6_child_page_size - 1) // self.ipv6_child_page_size
+        highlight_index = cofnet.get_child_prefix_index(prefix_len, child_prefix_len, self.current_ipv6_int)
+        if page_index is None:
+            page_index = highlight_index // self.ipv6_child_page_size
+        elif page_index < 0:
+            page_index = page_num - 1
+        page_index = min(page_index, page_num - 1)
+        start_index = page_index * self.ipv6_child_page_size
+        line_list = self.generate_child_prefix_line_list(self.current_ipv6_int, prefix_len, child_prefix_len, start_index,
+                                                         self.ipv6_child_page_size, highlight_index)
+        self.widget_dict_ipv6["text_child_prefix"].delete("1.0", tkinter.END)
+        self.widget_dict_ipv6["text_child_prefix"].insert(tkinter.END, "".join(line_list))
+        if start_index <= highlight_index < start_index + self.ipv6_child_page_size:
+            line_no = str(highlight_index - start_index + 2)
+            self.widget_dict_ipv6["text_child_prefix"].tag_add("ipv6_address_fg", line_no + ".0", line_no + ".end")
+            self.widget_dict_ipv6["text_child_prefix"].see(line_no + ".0")
+        self.ipv6_child_page_index = page_index
+        self.widget_dict_ipv6["sv_child_page_info"].set(f"第 {page_index + 1}/{page_num} 页，共 {child_prefix_num} 个")
 
     def calculate_ip_range(self, input_ip_str):
         # 输入信息为 ip-range，例如 "10.99.1.33-55"
-        # 需要计算ip默认所属类型，Class A,B,C,D
-        pass
+        start_ip, end_seg = input_ip_str.split("-")
+        start_ip_int = cofnet.ip_or_maskbyte_to_int(start_ip)
+        self.show_ip_range(start_ip_int, (start_ip_int & 0xFFFFFF00) | int(end_seg))
 
     def calculate_ip_range2(self, input_ip_str):
         # 输入信息为 ip-range，例如 "10.99.1.33-10.99.1.55"
-        pass
+        start_ip, end_ip = input_ip_str.split("-")
+        self.show_ip_range(cofnet.ip_or_maskbyte_to_int(start_ip), cofnet.ip_or_maskbyte_to_int(end_ip))
+
+    def show_ip_range(self, start_ip_int: int, end_ip_int: int):
+        """
+        显示ip地址范围的信息：ip数量、首尾ip的有类分类及特殊用途分类、可拆分为的最少cidr
+        """
+        self.compute_executor.cancel("ipv4")  # 计算量很小，直接在主线程中显示，同时作废还在后台计算的旧请求
+        self.widget_dict_ipv4["text_ip_base_info"].delete("1.0", tkinter.END)
+        start_category, start_description = cofnet.classify_ipv4_int(start_ip_int)
+        end_category, end_description = cofnet.classify_ipv4_int(end_ip_int)
+        cidr_list = [cofnet.int32_to_ip(netseg_int) + "/" + str(maskint)
+                     for netseg_int, maskint in cofnet.range_to_cidr_int_list(start_ip_int, end_ip_int, 32)]
+        info_list = [f"地址范围: {cofnet.int32_to_ip(start_ip_int)} -> {cofnet.int32_to_ip(end_ip_int)}\n",
+                     f"ip数量: {end_ip_int - start_ip_int + 1}\n",
+                     f"首ip地址类型: {cofnet.get_ipv4_class(start_ip_int)}类地址  {start_description}（{start_category}）\n",
+                     f"尾ip地址类型: {cofnet.get_ipv4_class(end_ip_int)}类地址  {end_description}（{end_category}）\n",
+                     f"可拆分为 {len(cidr_list)} 个cidr: {' '.join(cidr_list[:8])}{' ...' if len(cidr_list) > 8 else ''}"]
+        self.widget_dict_ipv4["text_ip_base_info"].insert(tkinter.END, "".join(info_list))
+        self.widget_dict_ipv4["text_ip_base_info"].tag_add("ip_address_fg", "1.6", "1.end")
+        self.is_calculated = False
 
     def calculate_cidr(self, input_ip_str):  # 被前面的 calculate_ip_maskint() 给替代了
         # 输入信息为 cidr，例如 "10.99.1.0/24"
@@ -894,7 +1197,16 @@ class MainWindow:
                 return
             else:
                 new_ipv6_prefix_len = ipv6_prefix_len
-        self.widget_dict_ipv6["text_ipv6_base_info"].delete("1.0", tkinter.END)
+        self.compute_executor.submit("ipv6", self.compute_ipv6_page, self.apply_ipv6_page, input_ipv6_str, str(new_ipv6_prefix_len),
+                                     error_func=self.show_ipv6_page_error)
+
+    @staticmethod
+    def compute_ipv6_page(input_ipv6_str: str, new_ipv6_prefix_len: str) -> dict:
+        """
+        在后台线程中计算ipv6界面要显示的全部内容，不涉及tkinter控件，
+        结果由 apply_ipv6_page() 在主线程中一次性更新到界面
+        """
+        base_info = TextUpdate()
         # 开始计算
         ipv6_address_full = cofnet.convert_to_ipv6_full(input_ipv6_str)
         ipv6_address_short = cofnet.convert_to_ipv6_short(input_ipv6_str)
@@ -907,112 +1219,131 @@ class MainWindow:
         seg_1_2 = ipv6_address_full_seg_list[0] + ipv6_address_full_seg_list[1]
         seg_1_2_ip_format = cofnet.int32_to_ip(int(seg_1_2, base=16))
         ipv6_seg_1_2_binary_str = cofnet.ip_or_maskbyte_to_binary_with_space(seg_1_2_ip_format)
-        seg_1_2_map_str = self.ipv6_2seg_to_map_binary_str(seg_1_2, 8)
+        seg_1_2_map_str = MainWindow.ipv6_2seg_to_map_binary_str(seg_1_2, 8)
         ipv6_seg_1_2_binary_text = f"seg1_2: {ipv6_seg_1_2_binary_str}  1-32位\n{seg_1_2_map_str}<{seg_1_2_ip_format}>\n"
         seg_3_4 = ipv6_address_full_seg_list[2] + ipv6_address_full_seg_list[3]
         seg_3_4_ip_format = cofnet.int32_to_ip(int(seg_3_4, base=16))
         ipv6_seg_3_4_binary_str = cofnet.ip_or_maskbyte_to_binary_with_space(seg_3_4_ip_format)
-        seg_3_4_map_str = self.ipv6_2seg_to_map_binary_str(seg_3_4, 8)
+        seg_3_4_map_str = MainWindow.ipv6_2seg_to_map_binary_str(seg_3_4, 8)
         ipv6_seg_3_4_binary_text = f"seg3_4: {ipv6_seg_3_4_binary_str}  33-64位\n{seg_3_4_map_str}<{seg_3_4_ip_format}>\n"
         seg_5_6 = ipv6_address_full_seg_list[4] + ipv6_address_full_seg_list[5]
         seg_5_6_ip_format = cofnet.int32_to_ip(int(seg_5_6, base=16))
         ipv6_seg_5_6_binary_str = cofnet.ip_or_maskbyte_to_binary_with_space(seg_5_6_ip_format)
-        seg_5_6_map_str = self.ipv6_2seg_to_map_binary_str(seg_5_6, 8)
+        seg_5_6_map_str = MainWindow.ipv6_2seg_to_map_binary_str(seg_5_6, 8)
         ipv6_seg_5_6_binary_text = f"seg5_6: {ipv6_seg_5_6_binary_str}  65-96位\n{seg_5_6_map_str}<{seg_5_6_ip_format}>\n"
         seg_7_8 = ipv6_address_full_seg_list[6] + ipv6_address_full_seg_list[7]
         seg_7_8_ip_format = cofnet.int32_to_ip(int(seg_7_8, base=16))
         ipv6_seg_7_8_binary_str = cofnet.ip_or_maskbyte_to_binary_with_space(seg_7_8_ip_format)
-        seg_7_8_map_str = self.ipv6_2seg_to_map_binary_str(seg_7_8, 8)
+        seg_7_8_map_str = MainWindow.ipv6_2seg_to_map_binary_str(seg_7_8, 8)
         ipv6_seg_7_8_binary_text = f"seg7_8: {ipv6_seg_7_8_binary_str}  97-128位\n{seg_7_8_map_str}<{seg_7_8_ip_format}>\n"
         # 将ip相关信息输出到Text控件中
-        self.widget_dict_ipv6["text_ipv6_base_info"].insert(tkinter.END, ipv6_address_full_text)
+        base_info.insert(tkinter.END, ipv6_address_full_text)
         start_index1 = "1.11"
         end_index1 = "1." + str(11 + len(ipv6_address_full))
-        self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("ipv6_address_fg", start_index1, end_index1)
-        self.widget_dict_ipv6["text_ipv6_base_info"].insert(tkinter.END, ipv6_address_short_text)
+        base_info.tag_add("ipv6_address_fg", start_index1, end_index1)
+        base_info.insert(tkinter.END, ipv6_address_short_text)
         start_index2 = "2.11"
         end_index2 = "2." + str(11 + len(ipv6_address_short))
-        self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("ipv6_address_fg", start_index2, end_index2)
-        self.widget_dict_ipv6["text_ipv6_base_info"].insert(tkinter.END, "/" + new_ipv6_prefix_len + "\n")
-        self.widget_dict_ipv6["text_ipv6_base_info"].insert(tkinter.END, ipv6_prefix_text)
+        base_info.tag_add("ipv6_address_fg", start_index2, end_index2)
+        base_info.insert(tkinter.END, "/" + new_ipv6_prefix_len + "\n")
+        base_info.insert(tkinter.END, ipv6_prefix_text)
         start_index3 = "3.10"
         end_index3 = "3." + str(10 + len(ipv6_prefix_cidrv6))
-        self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("ipv6_prefix_fg", start_index3, end_index3)
-        self.widget_dict_ipv6["text_ipv6_base_info"].insert(tkinter.END, "ipv6地址用二进制表示如下：                   十进制表示：\n")
-        self.widget_dict_ipv6["text_ipv6_base_info"].insert(tkinter.END, ipv6_seg_1_2_binary_text)
-        self.widget_dict_ipv6["text_ipv6_base_info"].insert(tkinter.END, ipv6_seg_3_4_binary_text)
-        self.widget_dict_ipv6["text_ipv6_base_info"].insert(tkinter.END, ipv6_seg_5_6_binary_text)
-        self.widget_dict_ipv6["text_ipv6_base_info"].insert(tkinter.END, ipv6_seg_7_8_binary_text)
-        self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("ipv6_address_fg", "6.8", "6.40")
-        self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("ipv6_address_fg", "8.8", "8.40")
-        self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("ipv6_address_fg", "10.8", "10.40")
-        self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("ipv6_address_fg", "12.8", "12.40")
-        self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("maskbyte_fg", "5.45", "5.51")
-        self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("maskbyte_fg", "7.45", "7.52")
-        self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("maskbyte_fg", "9.45", "9.52")
-        self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("maskbyte_fg", "11.45", "11.53")
+        base_info.tag_add("ipv6_prefix_fg", start_index3, end_index3)
+        base_info.insert(tkinter.END, "ipv6地址用二进制表示如下：                   十进制表示：\n")
+        base_info.insert(tkinter.END, ipv6_seg_1_2_binary_text)
+        base_info.insert(tkinter.END, ipv6_seg_3_4_binary_text)
+        base_info.insert(tkinter.END, ipv6_seg_5_6_binary_text)
+        base_info.insert(tkinter.END, ipv6_seg_7_8_binary_text)
+        address_category, address_description = cofnet.classify_ipv6_int(cofnet.ipv6_to_int128(input_ipv6_str))
+        base_info.insert(tkinter.END, f"地址类型: {address_description}（{address_category}）")  # 第 13 行
+        base_info.tag_add("ipv6_address_fg", "6.8", "6.40")
+        base_info.tag_add("ipv6_address_fg", "8.8", "8.40")
+        base_info.tag_add("ipv6_address_fg", "10.8", "10.40")
+        base_info.tag_add("ipv6_address_fg", "12.8", "12.40")
+        base_info.tag_add("maskbyte_fg", "5.45", "5.51")
+        base_info.tag_add("maskbyte_fg", "7.45", "7.52")
+        base_info.tag_add("maskbyte_fg", "9.45", "9.52")
+        base_info.tag_add("maskbyte_fg", "11.45", "11.53")
         two_seg_bin_prefix_num = int(new_ipv6_prefix_len) // 32
         two_seg_bin_prefix_remainder = int(new_ipv6_prefix_len) % 32
         color_bit_str_num = cofnet.get_maskint_with_space(two_seg_bin_prefix_remainder)
         if two_seg_bin_prefix_num == 0:
             start_index5 = "5.8"
             end_index5 = "5." + str(8 + color_bit_str_num)
-            self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("ipv6_prefix_fg", start_index5, end_index5)
+            base_info.tag_add("ipv6_prefix_fg", start_index5, end_index5)
             start_index5_h = "5." + str(8 + color_bit_str_num)
             end_index5_h = "5." + str(35 - color_bit_str_num + 8 + color_bit_str_num)
-            self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("hostseg_fg", start_index5_h, end_index5_h)
-            self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("hostseg_fg", "7.8", "7.43")
-            self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("hostseg_fg", "9.8", "9.43")
-            self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("hostseg_fg", "11.8", "11.43")
+            base_info.tag_add("hostseg_fg", start_index5_h, end_index5_h)
+            base_info.tag_add("hostseg_fg", "7.8", "7.43")
+            base_info.tag_add("hostseg_fg", "9.8", "9.43")
+            base_info.tag_add("hostseg_fg", "11.8", "11.43")
         elif two_seg_bin_prefix_num == 1:
-            self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("ipv6_prefix_fg", "5.8", "5.43")
+            base_info.tag_add("ipv6_prefix_fg", "5.8", "5.43")
             start_index7 = "7.8"
             end_index7 = "7." + str(8 + color_bit_str_num)
-            self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("ipv6_prefix_fg", start_index7, end_index7)
+            base_info.tag_add("ipv6_prefix_fg", start_index7, end_index7)
             start_index7_h = "7." + str(8 + color_bit_str_num)
             end_index7_h = "7." + str(35 - color_bit_str_num + 8 + color_bit_str_num)
-            self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("hostseg_fg", start_index7_h, end_index7_h)
-            self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("hostseg_fg", "9.8", "9.43")
-            self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("hostseg_fg", "11.8", "11.43")
+            base_info.tag_add("hostseg_fg", start_index7_h, end_index7_h)
+            base_info.tag_add("hostseg_fg", "9.8", "9.43")
+            base_info.tag_add("hostseg_fg", "11.8", "11.43")
         elif two_seg_bin_prefix_num == 2:
-            self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("ipv6_prefix_fg", "5.8", "5.43")
-            self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("ipv6_prefix_fg", "7.8", "7.43")
+            base_info.tag_add("ipv6_prefix_fg", "5.8", "5.43")
+            base_info.tag_add("ipv6_prefix_fg", "7.8", "7.43")
             start_index9 = "9.8"
             end_index9 = "9." + str(8 + color_bit_str_num)
-            self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("ipv6_prefix_fg", start_index9, end_index9)
+            base_info.tag_add("ipv6_prefix_fg", start_index9, end_index9)
             start_index9_h = "9." + str(8 + color_bit_str_num)
             end_index9_h = "9." + str(35 - color_bit_str_num + 8 + color_bit_str_num)
-            self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("hostseg_fg", start_index9_h, end_index9_h)
-            self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("hostseg_fg", "11.8", "11.43")
+            base_info.tag_add("hostseg_fg", start_index9_h, end_index9_h)
+            base_info.tag_add("hostseg_fg", "11.8", "11.43")
         elif two_seg_bin_prefix_num == 3:
-            self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("ipv6_prefix_fg", "5.8", "5.43")
-            self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("ipv6_prefix_fg", "7.8", "7.43")
-            self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("ipv6_prefix_fg", "9.8", "9.43")
+            base_info.tag_add("ipv6_prefix_fg", "5.8", "5.43")
+            base_info.tag_add("ipv6_prefix_fg", "7.8", "7.43")
+            base_info.tag_add("ipv6_prefix_fg", "9.8", "9.43")
             start_index11 = "11.8"
             end_index11 = "11." + str(8 + color_bit_str_num)
-            self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("ipv6_prefix_fg", start_index11, end_index11)
+            base_info.tag_add("ipv6_prefix_fg", start_index11, end_index11)
             start_index11_h = "11." + str(8 + color_bit_str_num)
             end_index11_h = "11." + str(35 - color_bit_str_num + 8 + color_bit_str_num)
-            self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("hostseg_fg", start_index11_h, end_index11_h)
+            base_info.tag_add("hostseg_fg", start_index11_h, end_index11_h)
         else:
-            self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("ipv6_prefix_fg", "5.8", "5.43")
-            self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("ipv6_prefix_fg", "7.8", "7.43")
-            self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("ipv6_prefix_fg", "9.8", "9.43")
-            self.widget_dict_ipv6["text_ipv6_base_info"].tag_add("ipv6_prefix_fg", "11.8", "11.43")
-        # 更新子网掩码滑块及spinbox的值
-        self.widget_dict_ipv6["sv_ipv6_prefix_len_int"].set(int(new_ipv6_prefix_len))
-        self.widget_dict_ipv6["ipv6_prefix_len_scale"].set(int(new_ipv6_prefix_len))  # 这里设置完后，会触发一次计算
-        # 记录当前网段及子网掩码位数
-        self.current_ipv6_prefix_cidrv6 = ipv6_prefix_cidrv6
-        self.current_ipv6_prefix_len = new_ipv6_prefix_len
-        self.is_calculated = True
+            base_info.tag_add("ipv6_prefix_fg", "5.8", "5.43")
+            base_info.tag_add("ipv6_prefix_fg", "7.8", "7.43")
+            base_info.tag_add("ipv6_prefix_fg", "9.8", "9.43")
+            base_info.tag_add("ipv6_prefix_fg", "11.8", "11.43")
+        return {"text_ipv6_base_info": base_info, "prefix_cidrv6": ipv6_prefix_cidrv6, "prefix_len": new_ipv6_prefix_len,
+                "ipv6_int": cofnet.ipv6_to_int128(input_ipv6_str), "input_ipv6": ipv6_address_short + "/" + str(new_ipv6_prefix_len)}
+
+    def apply_ipv6_page(self, result: dict):
+        """
+        在主线程中把 compute_ipv6_page() 的结果一次性更新到界面
+        """
+        result["text_ipv6_base_info"].apply(self.widget_dict_ipv6["text_ipv6_base_info"])
+        # 记录当前网段及子网掩码位数，要在更新滑块及输入框之前记录，滑块触发的回调发现都没变就不会重复计算
+        self.current_ipv6_prefix_cidrv6 = result["prefix_cidrv6"]
+        self.current_ipv6_prefix_len = result["prefix_len"]
+        self.current_ipv6_int = result["ipv6_int"]
+        self.current_input_ipv6 = result["input_ipv6"]
+        self.is_calculated6 = True
         self.widget_dict_ipv6["sv_input_ipv6"].set("")
-        self.widget_dict_ipv6["sv_input_ipv6"].set(ipv6_address_short + "/" + str(new_ipv6_prefix_len))
+        self.widget_dict_ipv6["sv_input_ipv6"].set(result["input_ipv6"])
+        # 更新子网掩码滑块及spinbox的值
+        self.widget_dict_ipv6["sv_ipv6_prefix_len_int"].set(int(result["prefix_len"]))
+        self.widget_dict_ipv6["ipv6_prefix_len_scale"].set(int(result["prefix_len"]))
+        self.show_ipv6_child_prefix_page()
+
+    def show_ipv6_page_error(self, error: Exception):
+        """
+        在主线程中把后台计算ipv6界面时出的错显示到界面上
+        """
+        self.widget_dict_ipv6["text_ipv6_base_info"].delete("1.0", tkinter.END)
+        self.widget_dict_ipv6["text_ipv6_base_info"].insert(tkinter.END, f"计算出错: {error!r}")
 
     def calculate6_ipv6_with_prefix_len(self, ipv6addr_prefix_len_str, ipv6_prefix_len=None):
         # 输入信息为 ipv6/前缀位数，例如 "FD00::11/64"
         # ipv6_prefix_len如果要赋值，需要赋str类型的值
-        self.widget_dict_ipv6["text_ipv6_base_info"].delete("1.0", tkinter.END)
         ipv6addr_prefix_len_seg_list = ipv6addr_prefix_len_str.split("/")
         input_ipv6_str = ipv6addr_prefix_len_seg_list[0]
         if ipv6_prefix_len is None:
@@ -1046,6 +1377,7 @@ class MainWindow:
             widget.destroy()
 
     def on_closing_main_window(self):
+        self.compute_executor.shutdown()
         self.is_stopped_all_ping_detect = True
         self.is_quit = True
         for thread_ping_detect in self.thread_start_ping_detect_list:
@@ -1077,6 +1409,7 @@ class PingDetectItemInfo:
         self.current_counter_stopped_all_ping_detect = 0
         self.frame_detect_info = None
         self.current_ping_detect_thread = None
+        self.rtt_estimator = None  # 本目标的RTT估计器，每次开始检测时重建
 
     def set_curent_ping_detect_thread_id(self, thread_id):
         self.current_ping_detect_thread = thread_id
@@ -1129,6 +1462,7 @@ class PingDetectItemInfo:
         stop_thread_silently(self.current_ping_detect_thread)
         self.main_window.current_ping_detect_obj_list.remove(self)
         self.frame_detect_info.destroy()
+        cofmetrics.TARGET_METRICS.remove_target(self.target_ip)
 
     def restart_this_job(self):
         if self.is_finished:
@@ -1145,6 +1479,8 @@ class PingDetectItemInfo:
     def start_ping_detect(self):
         rtt_time_ms_list = []
         lost_sum = 0
+        self.rtt_estimator = cofping.RttEstimator(min_rto_s=min(cofping.RTO_MIN_S_DEFAULT, self.detect_timeout),
+                                                  max_rto_s=self.detect_timeout)
         self.frame_detect_info_widget_dict["label_current_result_statistics"].__setitem__('text', "开始检测")
         self.frame_detect_info_widget_dict["result_text"].delete("1.0", tkinter.END)
         for i in range(self.detect_count):
@@ -1165,9 +1501,14 @@ class PingDetectItemInfo:
                 return
             start_time = time.time()
             # 创建ping对象（icmp_v4）
-            ping = cofping.PingOnePacket(target_ip=self.target_ip, timeout=self.detect_timeout, size=self.detect_pkg_size,
-                                         ttl=self.detect_ip_ttl, dont_frag=self.dont_frag)
+            ping = cofping.PingOnePacket(target_ip=self.target_ip, timeout=self.rtt_estimator.get_timeout(),
+                                         size=self.detect_pkg_size, ttl=self.detect_ip_ttl, dont_frag=self.dont_frag)
             ping.start()  # 阻塞型
+            ui_dispatch_start_ns = time.perf_counter_ns() if cofmetrics.INSTRUMENTATION.is_enabled else 0
+            if ping.result.is_success:
+                self.rtt_estimator.update(ping.result.rtt_ms / 1000)
+            elif not ping.result.received_a_respond:
+                self.rtt_estimator.on_timeout()
             current_time = time.strftime("%H:%M:%S", time.localtime())
             rtt_time_ms_list.append(ping.result.rtt_ms)
             if self.main_window.is_quit:
@@ -1213,6 +1554,8 @@ class PingDetectItemInfo:
                 else:
                     self.frame_detect_info_widget_dict["status_canvas"].create_oval(0, 0, self.height // 2, self.height // 2,
                                                                                     fill="red", width=0, outline="red")
+                if cofmetrics.INSTRUMENTATION.is_enabled:
+                    cofmetrics.INSTRUMENTATION.observe(cofmetrics.STAGE_UI_DISPATCH, time.perf_counter_ns() - ui_dispatch_start_ns)
                 if i == self.detect_count - 1:
                     break
                 using_time = time.time() - start_time
@@ -1224,6 +1567,15 @@ class PingDetectItemInfo:
 
 
 if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description="ipTool")
+    arg_parser.add_argument("--metrics-port", type=int, default=0,
+                            help="开启Prometheus指标导出（http://监听地址:端口/metrics），为0时不开启")
+    arg_parser.add_argument("--metrics-host", default="127.0.0.1",
+                            help="指标导出的监听地址，默认只监听本机，需要远程抓取时才指定 0.0.0.0")
+    args = arg_parser.parse_args()
+    if args.metrics_port > 0:
+        metrics_exporter = cofmetrics.MetricsExporter(listen_host=args.metrics_host, listen_port=args.metrics_port)
+        metrics_exporter.start()
     # 创建程序主界面对象，全局只有一个
     main_window_obj = MainWindow(width=960, height=600, title='ipTool')
     main_window_obj.show()  # 显示主界面，一切从这里开始